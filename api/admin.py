@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SupportRequest,Feedback
+from .models import SupportRequest,Feedback,FraudFlag
 
 # Register your models here.
 
@@ -7,3 +7,12 @@ from .models import SupportRequest,Feedback
 admin.site.register(SupportRequest)
 admin.site.register(Feedback)
 
+
+class AdminFraudFlag(admin.ModelAdmin):
+    list_display = ('detected_at', 'event', 'user', 'ip_address', 'score', 'is_reviewed')
+    list_filter = ('is_reviewed', 'event')
+    search_fields = ('user__username', 'ip_address')
+    list_editable = ('is_reviewed',)
+    ordering = ('-detected_at',)
+
+admin.site.register(FraudFlag, AdminFraudFlag)
@@ -0,0 +1,215 @@
+"""
+In-process streaming fraud scoring.
+
+Views report booking, cancellation, payment and registration events with
+observe(). Each event updates sliding windows of recent event times per user
+and per client IP, kept in fixed size ring buffers in process memory, and is
+scored against SIGNALS without touching the database: a few microseconds per
+event. Events scoring at least FRAUD_FLAG_THRESHOLD are put on a queue that a
+background thread writes to FraudFlag in batches for staff to review.
+
+Windows live per process, so with several workers each scores the traffic it
+serves; the signals are tuned to fire on bursts that show up in any one of them.
+"""
+import queue
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+
+BOOKING = 'booking'
+CANCELLATION = 'cancellation'
+PAYMENT = 'payment'
+PAYMENT_FAILED = 'payment_failed'
+REGISTRATION = 'registration'
+
+# Events kept per window; counts beyond it are capped, which only caps the score
+WINDOW_SIZE = 32
+
+# event: the event kind counted; scope: 'user' or 'ip'; an event scores weight x count / threshold once count reaches threshold
+Signal = namedtuple('Signal', 'name event scope seconds threshold weight')
+SIGNALS = [
+    Signal('rapid_bookings', BOOKING, 'user', 10 * 60, 5, 1.0),
+    Signal('repeated_cancellations', CANCELLATION, 'user', 24 * 3600, 3, 1.0),
+    Signal('failed_payments', PAYMENT_FAILED, 'user', 3600, 3, 1.0),
+    Signal('ip_bookings', BOOKING, 'ip', 10 * 60, 15, 0.7),
+    Signal('ip_payments', PAYMENT, 'ip', 3600, 15, 0.7),
+    Signal('ip_registrations', REGISTRATION, 'ip', 3600, 3, 0.8),
+]
+# Accounts seen from one IP in a day, over any event
+SHARED_IP = Signal('shared_ip_accounts', None, 'ip', 24 * 3600, 4, 0.7)
+
+
+class RingWindow:
+    """The last WINDOW_SIZE event times (and optionally who caused them) of one key."""
+    __slots__ = ('times', 'subjects', 'head', 'size')
+
+    def __init__(self, with_subjects=False):
+        self.times = array('d', bytes(8 * WINDOW_SIZE))
+        self.subjects = array('q', bytes(8 * WINDOW_SIZE)) if with_subjects else None
+        self.head = 0
+        self.size = 0
+
+    def add(self, now, subject=0):
+        self.times[self.head] = now
+        if self.subjects is not None:
+            self.subjects[self.head] = subject
+        self.head = (self.head + 1) % WINDOW_SIZE
+        self.size = min(self.size + 1, WINDOW_SIZE)
+
+    def _recent(self, now, seconds):
+        """Positions of the events within the last seconds, newest first."""
+        since = now - seconds
+        position = self.head
+        for _ in range(self.size):
+            position = (position - 1) % WINDOW_SIZE
+            if self.times[position] < since:
+                return
+            yield position
+
+    def count(self, now, seconds):
+        return sum(1 for _ in self._recent(now, seconds))
+
+    def distinct(self, now, seconds):
+        return len({self.subjects[position] for position in self._recent(now, seconds)})
+
+
+class Scorer:
+    """Sliding windows for at most max_keys users and IPs, least recently seen dropped first."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.windows = OrderedDict()
+        self.last_flagged = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _window(self, key, with_subjects=False):
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = RingWindow(with_subjects)
+            if len(self.windows) > self.max_keys:
+                self.windows.popitem(last=False)
+        else:
+            self.windows.move_to_end(key)
+        return window
+
+    def score(self, event, user_id, ip, now):
+        """Record an event; returns (score, {signal name: count}) of the signals it set off."""
+        scopes = {'user': user_id, 'ip': ip}
+        score, reasons = 0.0, {}
+        with self.lock:
+            for signal in SIGNALS:
+                subject = scopes[signal.scope]
+                if signal.event != event or subject is None:
+                    continue
+                window = self._window((signal.name, subject))
+                window.add(now)
+                count = window.count(now, signal.seconds)
+                if count >= signal.threshold:
+                    score += signal.weight * count / signal.threshold
+                    reasons[signal.name] = count
+            if ip is not None and user_id is not None:
+                window = self._window((SHARED_IP.name, ip), with_subjects=True)
+                window.add(now, user_id)
+                accounts = window.distinct(now, SHARED_IP.seconds)
+                if accounts >= SHARED_IP.threshold:
+                    score += SHARED_IP.weight * accounts / SHARED_IP.threshold
+                    reasons[SHARED_IP.name] = accounts
+        return score, reasons
+
+    def should_flag(self, subject, now):
+        """True once per FRAUD_FLAG_COOLDOWN for a user or IP, so a burst makes one flag, not one per event."""
+        with self.lock:
+            last = self.last_flagged.get(subject)
+            if last is not None and now - last < settings.FRAUD_FLAG_COOLDOWN:
+                return False
+            self.last_flagged[subject] = now
+            self.last_flagged.move_to_end(subject)
+            if len(self.last_flagged) > self.max_keys:
+                self.last_flagged.popitem(last=False)
+            return True
+
+
+_scorer = None
+_flags = queue.SimpleQueue()
+_writer = None
+_setup_lock = threading.Lock()
+
+
+def scorer():
+    global _scorer
+    if _scorer is None:
+        with _setup_lock:
+            if _scorer is None:
+                _scorer = Scorer(settings.FRAUD_MAX_TRACKED_KEYS)
+    return _scorer
+
+
+def client_ip(request):
+    """
+    The client's address. Each of the FRAUD_TRUSTED_PROXY_HOPS proxies in front
+    of the app appends the address it was reached from to X-Forwarded-For, so
+    the client is that many entries from the right; anything further left was
+    sent by the client and could be anything.
+    """
+    hops = settings.FRAUD_TRUSTED_PROXY_HOPS
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR') if hops > 0 else None
+    if forwarded:
+        entries = [entry.strip() for entry in forwarded.split(',')]
+        if len(entries) >= hops:
+            return entries[-hops] or None
+    return request.META.get('REMOTE_ADDR') or None
+
+
+def observe(event, request, user=None):
+    """
+    Score an event for the request's user (or user) and client IP, queueing a
+    FraudFlag when it is suspicious. Never queries the database.
+    """
+    if not settings.FRAUD_SCORING_ENABLED:
+        return None
+    user = user or getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    ip = client_ip(request)
+    now = time.time()
+    score, reasons = scorer().score(event, user_id, ip, now)
+    if score >= settings.FRAUD_FLAG_THRESHOLD and scorer().should_flag(user_id or ip, now):
+        _flags.put({
+            'user_id': user_id, 'ip_address': ip, 'event': event,
+            'score': round(score, 3), 'reasons': reasons, 'detected_at': timezone.now(),
+        })
+        _start_writer()
+    return score
+
+
+def _start_writer():
+    global _writer
+    if _writer is None:
+        with _setup_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_flags, name='fraud-flags', daemon=True)
+                _writer.start()
+
+
+def _write_flags():
+    """Background loop: write queued flags in batches, each batch one insert."""
+    from .models import FraudFlag
+
+    while True:
+        batch = [_flags.get()]
+        while len(batch) < 500:
+            try:
+                batch.append(_flags.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            FraudFlag.objects.bulk_create([FraudFlag(**flag) for flag in batch])
+        except Exception as e:
+            print(f"Error writing fraud flags: {e}")
+        finally:
+            close_old_connections()
@@ -0,0 +1,161 @@
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import CustomUser
+from authentication.tokens import get_tokens_for_user
+
+
+ROLE_FILTERS = {
+    'organization': {'is_organization': True},
+    'driver': {'is_driver': True},
+    'passenger': {'is_passenger': True},
+    'staff': {'is_staff': True},
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = "Replay captured traffic (see api.middleware.TrafficCaptureMiddleware) against a local instance."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Capture files; defaults to every file in TRAFFIC_CAPTURE_DIR.")
+        parser.add_argument('--target', default='http://localhost:8000', help="Base URL of the instance to replay against.")
+        parser.add_argument('--speed', type=float, default=1.0, help="Replay speed multiplier (2 replays twice as fast).")
+        parser.add_argument('--concurrency', type=int, default=16, help="Maximum number of in-flight requests.")
+        parser.add_argument('--users-per-role', type=int, default=1, help="Local users per role that recorded users are spread over.")
+        parser.add_argument('--user', action='append', default=[], metavar='ROLE=USERNAME',
+                            help="Use this local user for a role (may be repeated).")
+        parser.add_argument('--limit', type=int, default=0, help="Replay at most this many requests.")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds.")
+
+    def handle(self, *args, **options):
+        if options['speed'] <= 0:
+            raise CommandError("--speed must be positive.")
+
+        records = self._load_records(options['paths'], options['limit'])
+        if not records:
+            raise CommandError("No captured traffic found.")
+
+        self.tokens = self._build_token_pools(options['user'], options['users_per_role'])
+        self.target = options['target'].rstrip('/')
+        self.timeout = options['timeout']
+        self.local = threading.local()
+        self.results = []
+        self.results_lock = threading.Lock()
+
+        self.stdout.write(f"Replaying {len(records)} requests at {options['speed']}x against {self.target}")
+        started = time.perf_counter()
+        first_ts = records[0]['ts']
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for record in records:
+                # Keep the recorded inter-arrival times, scaled by the speed factor
+                delay = (record['ts'] - first_ts) / options['speed'] - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._replay_one, record)
+
+        self._report(time.perf_counter() - started)
+
+    def _load_records(self, paths, limit):
+        if not paths:
+            paths = glob.glob(os.path.join(settings.TRAFFIC_CAPTURE_DIR, 'traffic.jsonl*'))
+        records = []
+        for path in paths:
+            with open(path) as capture_file:
+                for line in capture_file:
+                    line = line.strip()
+                    if line:
+                        records.append(json.loads(line))
+        records.sort(key=lambda record: record['ts'])
+        return records[:limit] if limit else records
+
+    def _build_token_pools(self, user_options, users_per_role):
+        """Mint fresh access tokens for local users, grouped by role."""
+        explicit = {}
+        for option in user_options:
+            role, _, username = option.partition('=')
+            if role not in ROLE_FILTERS or not username:
+                raise CommandError(f"Invalid --user value: {option}")
+            explicit.setdefault(role, []).append(username)
+
+        pools = {}
+        for role, filters in ROLE_FILTERS.items():
+            if role in explicit:
+                users = list(CustomUser.objects.filter(username__in=explicit[role]))
+            else:
+                users = list(CustomUser.objects.filter(is_active=True, **filters).order_by('id')[:users_per_role])
+            pools[role] = [get_tokens_for_user(user)['access'] for user in users]
+        return pools
+
+    def _token_for(self, record):
+        pool = self.tokens.get(record.get('role'))
+        if not pool:
+            return None
+        # Spread recorded users over the pool deterministically
+        ref = record.get('user_ref') or ''
+        return pool[int(ref, 16) % len(pool)] if ref else pool[0]
+
+    def _session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def _replay_one(self, record):
+        headers = {}
+        token = self._token_for(record)
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+
+        started = time.perf_counter()
+        try:
+            response = self._session().request(
+                record['method'],
+                f"{self.target}{record['path']}",
+                params=record.get('query') or None,
+                json=record.get('body'),
+                headers=headers,
+                timeout=self.timeout,
+            )
+            status_code = response.status_code
+        except requests.RequestException:
+            status_code = None
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        with self.results_lock:
+            self.results.append((record, status_code, duration_ms))
+
+    def _report(self, elapsed):
+        replayed = [duration for _, status_code, duration in self.results if status_code is not None]
+        recorded = [record['duration_ms'] for record, _, _ in self.results]
+        failures = sum(1 for _, status_code, _ in self.results if status_code is None)
+        mismatches = sum(1 for record, status_code, _ in self.results
+                         if status_code is not None and status_code != record['status'])
+
+        self.stdout.write(f"Completed {len(self.results)} requests in {elapsed:.2f}s "
+                          f"({len(self.results) / elapsed if elapsed else 0:.1f} req/s)")
+        self.stdout.write(f"Connection failures: {failures}, status mismatches: {mismatches}")
+        for pct in (50, 95, 99):
+            self.stdout.write(f"p{pct}: replay {percentile(replayed, pct):.1f} ms, "
+                              f"recorded {percentile(recorded, pct):.1f} ms")
+
+        by_path = {}
+        for record, _, duration in self.results:
+            by_path.setdefault((record['method'], record['path']), []).append(duration)
+        slowest = sorted(by_path.items(), key=lambda item: -percentile(item[1], 95))[:10]
+        for (method, path), durations in slowest:
+            self.stdout.write(f"  {method} {path}: n={len(durations)} p95={percentile(durations, 95):.1f} ms")
@@ -0,0 +1,125 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+
+from authentication.querysets import user_role
+
+
+# Keys whose values are never written to the capture files, in bodies or query strings
+SENSITIVE_KEYS = {
+    'password', 'password2', 'old_password', 'new_password', 'new_password2',
+    'email', 'username', 'phone', 'phone_number', 'address', 'license_number',
+    'emergency_contact_name', 'emergency_contact_number', 'token', 'refresh', 'access',
+    'key', 'secret', 'signature',
+}
+
+
+def get_traffic_logger():
+    """
+    Return the logger that writes sampled traffic to rotating JSONL files.
+    The handler is attached once per process.
+    """
+    logger = logging.getLogger('disha.traffic')
+    if not logger.handlers:
+        capture_dir = settings.TRAFFIC_CAPTURE_DIR
+        os.makedirs(capture_dir, exist_ok=True)
+        handler = RotatingFileHandler(
+            os.path.join(capture_dir, 'traffic.jsonl'),
+            maxBytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+            backupCount=settings.TRAFFIC_CAPTURE_BACKUP_COUNT,
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def anonymize(value):
+    """Recursively mask sensitive keys in a decoded JSON body or query string."""
+    if isinstance(value, dict):
+        return {
+            key: '***' if key in SENSITIVE_KEYS else anonymize(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [anonymize(item) for item in value]
+    return value
+
+
+def user_ref(user):
+    """
+    Stable pseudonym for a user so that replay can map every recorded user
+    to one local user of the same role without storing the real id.
+    """
+    if not user or not user.is_authenticated:
+        return None
+    digest = hmac.new(settings.SECRET_KEY.encode(), str(user.pk).encode(), hashlib.sha256)
+    return digest.hexdigest()[:16]
+
+
+class TrafficCaptureMiddleware:
+    """
+    Record a random sample of API requests (method, path, anonymized body and role)
+    together with the response status and timing, for replay in benchmarks.
+    Enabled with TRAFFIC_CAPTURE_ENABLED; the sampling rate is TRAFFIC_CAPTURE_SAMPLE_RATE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.TRAFFIC_CAPTURE_ENABLED
+        self.sample_rate = settings.TRAFFIC_CAPTURE_SAMPLE_RATE
+        self.max_body_bytes = settings.TRAFFIC_CAPTURE_MAX_BODY_BYTES
+
+    def __call__(self, request):
+        if not self.enabled or not self._should_sample(request):
+            return self.get_response(request)
+
+        # Read the body before the view consumes the stream
+        body = self._read_body(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        # DRF copies the authenticated user back onto the Django request
+        user = getattr(request, 'user', None)
+        record = {
+            'ts': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'query': anonymize(request.GET.dict()),
+            'role': user_role(user),
+            'user_ref': user_ref(user),
+            'body': body,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 3),
+        }
+        try:
+            get_traffic_logger().info(json.dumps(record, default=str))
+        except Exception as e:
+            print(f"Error writing traffic sample: {e}")
+        return response
+
+    def _should_sample(self, request):
+        if not request.path.startswith('/api/'):
+            return False
+        return random.random() < self.sample_rate
+
+    def _read_body(self, request):
+        if request.method in ('GET', 'HEAD', 'OPTIONS', 'DELETE'):
+            return None
+        if request.content_type != 'application/json':
+            return None
+        try:
+            if int(request.META.get('CONTENT_LENGTH') or 0) > self.max_body_bytes:
+                return None
+            return anonymize(json.loads(request.body or b'null'))
+        except (ValueError, TypeError):
+            return None
@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-19 08:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_supportrequest_status_feedback'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FraudFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('event', models.CharField(max_length=30)),
+                ('score', models.FloatField()),
+                ('reasons', models.JSONField(default=dict)),
+                ('is_reviewed', models.BooleanField(db_index=True, default=False)),
+                ('detected_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fraud_flags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-detected_at'],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 from authentication.models import CustomUser
@@ -39,3 +40,20 @@ class Feedback(models.Model):
     def __str__(self):
         return f"Feedback from {self.user.username} - {self.feedback_type}"
 
+
+class FraudFlag(models.Model):
+    """An event the fraud scorer (api.fraud) rated suspicious, for staff to review."""
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, blank=True, null=True, related_name='fraud_flags')
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    event = models.CharField(max_length=30)
+    score = models.FloatField()
+    # Signals the event set off, with their counts in the window
+    reasons = models.JSONField(default=dict)
+    is_reviewed = models.BooleanField(default=False, db_index=True)
+    detected_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-detected_at']
+
+    def __str__(self):
+        return f"{self.event} by {self.user_id or self.ip_address} - {self.score}"
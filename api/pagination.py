@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination on the primary key, newest first.
+    Each page is an index range scan from the cursor, so deep pages
+    cost the same as the first one, unlike OFFSET based pagination.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+    def __init__(self, ordering=None, page_size=None):
+        if ordering:
+            self.ordering = ordering
+        if page_size:
+            self.page_size = page_size
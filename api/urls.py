@@ -1,19 +1,26 @@
 from django.urls import path, include
 from authentication.views import ProfileAPIView
-from .views import ReviewCreateAPIView,ReviewListAPIView,PassengerHomeView, SupportRequestAPIView,FeedbackView
-from booking.views import TicketFilterView,TicketDetailView
+from .views import ReviewCreateAPIView,ReviewListAPIView,PassengerHomeView, SupportRequestAPIView,FeedbackView,LocationAutocompleteView,RouteInfoView,JourneyPlanView,PriceCalendarView,DemandForecastView
+from booking.views import TicketFilterView,TicketDetailView,TicketQRView
 urlpatterns = [
     # path('profile/',ProfileAPIView.as_view(),name="profile"),
     path('',PassengerHomeView.as_view(),name='home'),
+    path('locations/autocomplete/',LocationAutocompleteView.as_view(),name='location-autocomplete'),
+    path('locations/route/',RouteInfoView.as_view(),name='route-info'),
+    path('journeys/',JourneyPlanView.as_view(),name='journey-plan'),
+    path('fares/calendar/',PriceCalendarView.as_view(),name='price-calendar'),
+    path('forecasts/',DemandForecastView.as_view(),name='demand-forecast'),
     path('reviews/create/',ReviewCreateAPIView.as_view(),name='review-create'),
     path('review/',ReviewListAPIView.as_view(),name='review'),
     path('ticket/filter/',TicketFilterView.as_view(),name='ticket-filter'),
     path('ticket/detail/<str:ticket_id>/',TicketDetailView.as_view(),name='ticket-detail'),
+    path('ticket/detail/<str:ticket_id>/qr/',TicketQRView.as_view(),name='ticket-qr'),
     path('auth/',include('authentication.urls')),
     path('organization/',include('organization.urls')),
     path('booking/',include('booking.urls')),
     path('passenger/',include('passenger.urls')),
     path('driver/',include('driver.urls')),
+    path('wallet/',include('wallet.urls')),
     path('support-request/',SupportRequestAPIView.as_view(),name='support-request'),
     path('feedback/',FeedbackView.as_view(),name='feedback')
 ]
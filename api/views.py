@@ -5,15 +5,23 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from authentication.renderers import UserRenderer
+from authentication.views import get_profile_by_role
 from organization.models import Review
 from organization.serializers import ReviewSerializer,TripSerializer,TripPriceSerializer
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.contenttypes.prefetch import GenericPrefetch
 from authentication.models import Passenger,Driver,Organization,CustomUser
-from organization.models import Trip,Vehicle
+from organization.models import Trip,DemandForecast
+from organization.locations import registry as locations
+from organization import journeys, price_calendar, routes
+from organization.cache import get_or_set_trip_listing, trip_listing_etag, not_modified
 from django.db.models import Q
-from datetime import datetime
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.utils import timezone
 from .models import SupportRequest,Feedback
 from .serializers import SupportRequestSerializer,FeedbackSerializer
+from .pagination import KeysetPagination
 from django.core.mail import send_mail
 from django.conf import settings
 # Create your views here.
@@ -34,11 +42,12 @@ class PassengerHomeView(APIView):
             filter_date = datetime.strptime(filters['date'], '%Y-%m-%d').date()
             trips_query = trips_query.filter(start_datetime__date=filter_date)
 
+        # Locations arrive normalized to slugs (see normalize_filters), so these are index lookups
         if filters.get('origin'):
-            trips_query = trips_query.filter(from_location__icontains=filters['origin'])
+            trips_query = trips_query.filter(from_location__in=filters['origin'].split(','))
 
         if filters.get('destination'):
-            trips_query = trips_query.filter(to_location__icontains=filters['destination'])
+            trips_query = trips_query.filter(to_location__in=filters['destination'].split(','))
 
         if filters.get('available_seats'):
             trips_query = trips_query.filter(vehicle__available_seat__gte=int(filters['available_seats']))
@@ -51,25 +60,28 @@ class PassengerHomeView(APIView):
 
         return trips_query
 
+    def normalize_filters(self, data):
+        """
+        Resolve free-text origin/destination (names, aliases, Nepali spellings or
+        prefixes) to the location slugs stored on trips. Equivalent searches then
+        share one cache entry and filter with equality instead of icontains.
+        """
+        filters = {key: data.get(key) for key in data}
+        for key in ('origin', 'destination'):
+            if filters.get(key):
+                # An unknown location matches no trips rather than being ignored
+                filters[key] = ','.join(locations.match(filters[key])) or '-'
+        return filters
+
     def get_vehicle_trip_data(self, trips_query):
         """
         This method fetches vehicle data and related trips based on the filtered trips query.
         """
-        # Fetch vehicles that are related to trips and have a driver assigned
-        vehicles = Vehicle.objects.select_related('driver').filter(driver__isnull=False)
-
-        vehicle_trip_data = []
+        # Trips of vehicles that have a driver assigned, in vehicle order, with
+        # everything TripSerializer reads (ratings included) loaded up front
+        trips = trips_query.filter(vehicle__driver__isnull=False).with_related().order_by('vehicle_id')
 
-        for vehicle in vehicles:
-            # Fetch the related trip for the vehicle if it exists and matches filters
-            trip = getattr(vehicle, 'vehicle', None)  # 'vehicle' is the related name for Trip model
-
-            if trip and trip in trips_query:
-                # Serialize the trip data
-                trip_serializer = TripSerializer(trip)
-                
-                # Append the serialized data to the list
-                vehicle_trip_data.append(trip_serializer.data)
+        vehicle_trip_data = TripSerializer(trips, many=True).data
 
         return vehicle_trip_data
 
@@ -78,12 +90,22 @@ class PassengerHomeView(APIView):
         GET method for fetching home data without filters.
         """
         try:
-            # Fetch all trips without filters
-            trips_query = Trip.objects.all()
-            vehicle_trip_data = self.get_vehicle_trip_data(trips_query)
+            # Pollers that already hold the current listing get a 304
+            etag = trip_listing_etag()
+            unchanged = not_modified(request, etag)
+            if unchanged:
+                return unchanged
+
+            # Fetch all trips without filters (served from the trip cache when possible)
+            vehicle_trip_data = get_or_set_trip_listing(
+                {}, lambda: self.get_vehicle_trip_data(Trip.objects.all())
+            )
 
             # Return the list as a response
-            return Response({"vehicle_trip_data": vehicle_trip_data}, status=status.HTTP_200_OK)
+            response = Response({"vehicle_trip_data": vehicle_trip_data}, status=status.HTTP_200_OK)
+            if etag:
+                response['ETag'] = etag
+            return response
 
         except Exception as e:
             # Return an error response if any exception occurs
@@ -95,13 +117,12 @@ class PassengerHomeView(APIView):
         """
         try:
             # Retrieve filter parameters from the request data
-            filters = request.data
+            filters = self.normalize_filters(request.data)
 
-            # Get filtered trips using the helper method
-            trips_query = self.get_filtered_trips(filters)
-
-            # Fetch and serialize vehicle and trip data
-            vehicle_trip_data = self.get_vehicle_trip_data(trips_query)
+            # Get filtered trips and serialize vehicle and trip data, keyed by the filters
+            vehicle_trip_data = get_or_set_trip_listing(
+                filters, lambda: self.get_vehicle_trip_data(self.get_filtered_trips(filters))
+            )
 
             # Return the filtered list as a response
             return Response({"vehicle_trip_data": vehicle_trip_data}, status=status.HTTP_200_OK)
@@ -110,6 +131,168 @@ class PassengerHomeView(APIView):
             # Return an error response if any exception occurs
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
        
+class LocationAutocompleteView(APIView):
+    """
+    Autocomplete trip locations from ?q= (English, Nepali or common alternative
+    spellings). Answered from the in-memory location trie, without the database.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            return Response({"error": "limit must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+        matches = locations.complete(query, limit) if query.strip() else []
+        response = Response({"locations": [locations.describe(slug) for slug in matches]}, status=status.HTTP_200_OK)
+        # The registry only changes with a deploy
+        response['Cache-Control'] = 'private, max-age=3600'
+        return response
+
+
+class RouteInfoView(APIView):
+    """Road distance and usual travel time between ?from= and ?to=, from the in-memory route matrix."""
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        origin = locations.resolve(request.query_params.get('from', ''))
+        destination = locations.resolve(request.query_params.get('to', ''))
+        if not origin or not destination or origin == destination:
+            return Response({"error": "from and to must be two different known locations."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "from_location": locations.describe(origin),
+            "to_location": locations.describe(destination),
+            "distance_km": routes.distance_km(origin, destination),
+            "duration_minutes": int(routes.duration(origin, destination).total_seconds() // 60),
+        }, status=status.HTTP_200_OK)
+
+
+class JourneyPlanView(APIView):
+    """
+    Plan journeys of one or more legs between two locations.
+
+    ?from= and ?to= accept anything the location registry resolves, ?date=
+    (YYYY-MM-DD, default now) is the earliest departure, ?passengers= the seats
+    needed on every leg, ?max_transfers= (0-3) and ?sort=arrival|price.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        params = request.query_params
+        origin = locations.resolve(params.get('from', ''))
+        destination = locations.resolve(params.get('to', ''))
+        if not origin or not destination:
+            return Response({"error": "from and to must be known locations."}, status=status.HTTP_400_BAD_REQUEST)
+        if origin == destination:
+            return Response({"error": "from and to must differ."}, status=status.HTTP_400_BAD_REQUEST)
+        sort = params.get('sort', 'arrival')
+        if sort not in ('arrival', 'price'):
+            return Response({"error": "sort must be arrival or price."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            passengers = max(int(params.get('passengers', 1)), 1)
+            max_transfers = min(max(int(params.get('max_transfers', 2)), 0), 3)
+            limit = min(max(int(params.get('limit', 5)), 1), 20)
+            earliest = timezone.now()
+            if params.get('date'):
+                day = datetime.strptime(params['date'], '%Y-%m-%d')
+                earliest = max(earliest, timezone.make_aware(day))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = journeys.get_graph().search(
+            origin, destination, earliest,
+            passengers=passengers, max_transfers=max_transfers, optimize=sort, limit=limit,
+        )
+        return Response({
+            "from_location": locations.describe(origin),
+            "to_location": locations.describe(destination),
+            "journeys": [journeys.describe(journey, passengers) for journey in found],
+        }, status=status.HTTP_200_OK)
+
+
+class PriceCalendarView(APIView):
+    """
+    Cheapest fare and seats left for each day on a route.
+
+    ?from= and ?to= accept anything the location registry resolves, ?start=
+    (YYYY-MM-DD, default today) is the first day and ?days= the window length,
+    up to 60 (default 30).
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        params = request.query_params
+        origin = locations.resolve(params.get('from', ''))
+        destination = locations.resolve(params.get('to', ''))
+        if not origin or not destination or origin == destination:
+            return Response({"error": "from and to must be two different known locations."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = min(max(int(params.get('days', price_calendar.DEFAULT_DAYS)), 1), price_calendar.MAX_DAYS)
+            today = timezone.localdate()
+            start = datetime.strptime(params['start'], '%Y-%m-%d').date() if params.get('start') else today
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # Past days have nothing left to book
+        start = max(start, today)
+
+        calendar = price_calendar.get_calendar(origin, destination, start, days)
+        priced = [day for day in calendar if day['min_price'] is not None]
+        cheapest = min(priced, key=lambda day: Decimal(day['min_price']))['date'] if priced else None
+        return Response({
+            "from_location": locations.describe(origin),
+            "to_location": locations.describe(destination),
+            "cheapest_date": cheapest,
+            "days": calendar,
+        }, status=status.HTTP_200_OK)
+
+
+class DemandForecastView(APIView):
+    """
+    Forecast passengers per day on a route, as written by the forecast_demand command.
+
+    ?from= and ?to= accept anything the location registry resolves, ?start=
+    (YYYY-MM-DD, default today) is the first day and ?days= how many, up to 60.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        params = request.query_params
+        origin = locations.resolve(params.get('from', ''))
+        destination = locations.resolve(params.get('to', ''))
+        if not origin or not destination or origin == destination:
+            return Response({"error": "from and to must be two different known locations."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = min(max(int(params.get('days', 30)), 1), 60)
+            start = datetime.strptime(params['start'], '%Y-%m-%d').date() if params.get('start') else timezone.localdate()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        forecasts = list(DemandForecast.objects.filter(
+            from_location=origin, to_location=destination, date__gte=start, date__lt=start + timedelta(days=days),
+        ))
+        generated_at = max((forecast.generated_at for forecast in forecasts), default=None)
+        return Response({
+            "from_location": locations.describe(origin),
+            "to_location": locations.describe(destination),
+            "generated_at": generated_at.isoformat() if generated_at else None,
+            "days": [
+                {
+                    "date": forecast.date.isoformat(),
+                    "expected_passengers": forecast.expected_passengers,
+                    "lower": forecast.lower,
+                    "upper": forecast.upper,
+                }
+                for forecast in forecasts
+            ],
+        }, status=status.HTTP_200_OK)
+
+
 class ReviewCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
@@ -157,6 +340,14 @@ class ReviewCreateAPIView(APIView):
         data['reviewee_content_type'] = reviewee_content_type.id
         data['reviewee_object_id'] = reviewee_instance.id
 
+        # Optionally tie the review to a trip, so it can be weighted by the trip's passengers
+        trip_id = data.get('trip_id')
+        if trip_id:
+            trip = Trip.objects.filter(trip_id=trip_id).only('id').first()
+            if not trip:
+                raise ValidationError("Trip not found.")
+            data['trip'] = trip.id
+
         # Validate and create the review
         serializer = ReviewSerializer(data=data)
         serializer.is_valid(raise_exception=True)
@@ -165,41 +356,48 @@ class ReviewCreateAPIView(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)        
        
 class ReviewListAPIView(APIView):
+    """
+    List reviews written by or about the current user, newest first.
+    ?side=given|received narrows to one side; pages are keyset paginated (?cursor=...).
+    """
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
-    def get(self, request, *args, **kwargs):
-        user = request.user
 
-        # Filter reviews based on the current user type
-        if hasattr(user, 'passenger_profile'):
-            reviews = Review.objects.filter(
-                reviewer_content_type=ContentType.objects.get_for_model(Passenger),
-                reviewer_object_id=user.passenger_profile.id
-            ) | Review.objects.filter(
-                reviewee_content_type=ContentType.objects.get_for_model(Passenger),
-                reviewee_object_id=user.passenger_profile.id
-            )
-        elif hasattr(user, 'driver_profile'):
-            reviews = Review.objects.filter(
-                reviewer_content_type=ContentType.objects.get_for_model(Driver),
-                reviewer_object_id=user.driver_profile.id
-            ) | Review.objects.filter(
-                reviewee_content_type=ContentType.objects.get_for_model(Driver),
-                reviewee_object_id=user.driver_profile.id
-            )
-        elif hasattr(user, 'organization_profile'):
-            reviews = Review.objects.filter(
-                reviewer_content_type=ContentType.objects.get_for_model(Organization),
-                reviewer_object_id=user.organization_profile.id
-            ) | Review.objects.filter(
-                reviewee_content_type=ContentType.objects.get_for_model(Organization),
-                reviewee_object_id=user.organization_profile.id
-            )
+    def get(self, request, *args, **kwargs):
+        profile = get_profile_by_role(request.user)
+        if not profile:
+            return Response({"error": "Profile not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        content_type = ContentType.objects.get_for_model(type(profile))
+        given = Q(reviewer_content_type=content_type, reviewer_object_id=profile.id)
+        received = Q(reviewee_content_type=content_type, reviewee_object_id=profile.id)
+
+        side = request.query_params.get('side')
+        if side == 'given':
+            condition = given
+        elif side == 'received':
+            condition = received
         else:
-            reviews = Review.objects.none()
-
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+            condition = given | received
+
+        # Resolve reviewers and reviewees with one query per content type for the whole page
+        reviews = Review.objects.filter(condition).prefetch_related(
+            GenericPrefetch('reviewer', self.profile_querysets()),
+            GenericPrefetch('reviewee', self.profile_querysets()),
+        )
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = ReviewSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @staticmethod
+    def profile_querysets():
+        return [
+            Passenger.objects.select_related('user'),
+            Driver.objects.select_related('user').prefetch_related('rating_summaries'),
+            Organization.objects.select_related('user'),
+        ]
     
 class SupportRequestAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -4,9 +4,10 @@ from django.core.exceptions import ValidationError
 import random
 import string
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Sum, F
 from django.apps import apps
 from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.fields import GenericRelation
 from cloudinary.models import CloudinaryField
 from decimal import Decimal
 class CustomUserManager(BaseUserManager):
@@ -92,12 +93,19 @@ class Organization(Profile):
     remaining_earnings = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     date_created = models.DateTimeField(auto_now_add=True)
     no_of_trips = models.IntegerField(default=0)
+    rating_summaries = GenericRelation('organization.ReviewSummary', content_type_field='reviewee_content_type', object_id_field='reviewee_object_id')
 
     def __str__(self) -> str:
         return self.user.username
 
+    def get_rating_summary(self):
+        """Return the materialized rating summary (uses prefetched summaries when available)."""
+        summaries = self.rating_summaries.all()
+        return summaries[0] if summaries else None
+
     def get_total_reviews(self):
-        return self.organization_reviews.count()
+        summary = self.get_rating_summary()
+        return summary.review_count if summary else 0
     
     def update_total_earnings(self, date=None):
         """
@@ -123,15 +131,20 @@ class Organization(Profile):
 
 
     def update_earnings(self, amount):
-        self.total_earnings += amount
-        self.remaining_earnings += amount
-        self.save()
+        Organization.objects.filter(pk=self.pk).update(
+            total_earnings=F('total_earnings') + amount,
+            remaining_earnings=F('remaining_earnings') + amount,
+        )
+        self.refresh_from_db(fields=['total_earnings', 'remaining_earnings'])
 
     def withdraw_earnings(self, amount):
-        if amount > self.remaining_earnings:
+        # Conditional update, so concurrent withdrawals can't overdraw the balance
+        updated = Organization.objects.filter(pk=self.pk, remaining_earnings__gte=amount).update(
+            remaining_earnings=F('remaining_earnings') - amount
+        )
+        if not updated:
             raise ValidationError('Insufficient funds to withdraw')
-        self.remaining_earnings -= amount
-        self.save()
+        self.refresh_from_db(fields=['remaining_earnings'])
 
     def _generate_registration_number(self):
         random_text = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
@@ -158,8 +171,14 @@ class Driver(models.Model):
     remaining_earnings = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
     date_created = models.DateTimeField(auto_now=True)
     no_of_trips = models.IntegerField(default=0)
+    rating_summaries = GenericRelation('organization.ReviewSummary', content_type_field='reviewee_content_type', object_id_field='reviewee_object_id')
     def __str__(self):
         return self.user.username
+
+    def get_rating_summary(self):
+        """Return the materialized rating summary (uses prefetched summaries when available)."""
+        summaries = self.rating_summaries.all()
+        return summaries[0] if summaries else None
     
     def update_total_earnings(self, date=None):
         """
@@ -191,14 +210,13 @@ class Driver(models.Model):
     #     self.save()
 
     def withdraw_earnings(self, amount):
-        if amount > self.remaining_earnings:
+        # Conditional update, so concurrent withdrawals can't overdraw the balance
+        updated = Driver.objects.filter(pk=self.pk, remaining_earnings__gte=amount).update(
+            remaining_earnings=F('remaining_earnings') - amount
+        )
+        if not updated:
             raise ValidationError("Insufficient earnings to withdraw the requested amount.")
-        try:
-            with transaction.atomic():
-                self.remaining_earnings -= amount
-                self.save()
-        except Exception as e:
-            raise ValidationError(f"An error occurred while withdrawing earnings: {str(e)}")
+        self.refresh_from_db(fields=['remaining_earnings'])
 
 class Location(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='location')
@@ -220,15 +238,14 @@ class Passenger(Profile):
         return f"{self.user.username} - profile"
 
     def add_loyalty_points(self, points):
-        self.loyalty_points += points
-        self.save()
+        Passenger.objects.filter(pk=self.pk).update(loyalty_points=F('loyalty_points') + points)
+        self.refresh_from_db(fields=['loyalty_points'])
 
     def redeem_loyalty_points(self, points):
-        if points > self.loyalty_points:
+        # Conditional update, so concurrent redemptions can't spend the same points twice
+        updated = Passenger.objects.filter(pk=self.pk, loyalty_points__gte=points).update(
+            loyalty_points=F('loyalty_points') - points
+        )
+        if not updated:
             raise ValidationError("Insufficient loyalty points.")
-        try:
-            with transaction.atomic():
-                self.loyalty_points -= points
-                self.save()
-        except Exception as e:
-            raise ValidationError(f"An error occurred while redeeming loyalty points: {str(e)}")
+        self.refresh_from_db(fields=['loyalty_points'])
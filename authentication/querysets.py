@@ -0,0 +1,32 @@
+from django.db import models
+
+
+def user_role(user):
+    """Return the role name of the user, or 'anonymous'."""
+    if not user or not user.is_authenticated:
+        return 'anonymous'
+    if user.is_organization:
+        return 'organization'
+    if user.is_driver:
+        return 'driver'
+    if user.is_passenger:
+        return 'passenger'
+    return 'staff' if user.is_staff else 'user'
+
+
+class RoleScopedQuerySet(models.QuerySet):
+    """
+    QuerySet that narrows itself to the rows a user may see.
+
+    Subclasses set role_lookups, mapping each role to the lookup from the model
+    to the user that owns the row for that role. The filter compares user ids,
+    so the users table is never joined and the check runs in the same SQL as
+    the rest of the query.
+    """
+    role_lookups = {}
+
+    def visible_to(self, user):
+        lookup = self.role_lookups.get(user_role(user))
+        if lookup is None:
+            return self.none()
+        return self.filter(**{lookup: user.pk})
@@ -270,11 +270,17 @@ class OrganizationSerializer(serializers.ModelSerializer):
 class DriverSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     email = serializers.ReadOnlyField(source='user.email')
+    rating = serializers.SerializerMethodField()
     
     class Meta:
         model = Driver
         fields = '__all__'
 
+    def get_rating(self, obj):
+        """Return the driver's materialized rating summary, if any reviews exist."""
+        summary = obj.get_rating_summary()
+        return summary.as_dict() if summary else None
+
     def create(self, validated_data):
         # Retrieve user from the context
         username = self.context['username']
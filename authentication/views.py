@@ -13,6 +13,7 @@ from django.shortcuts import get_object_or_404
 from django.db import transaction
 from functools import lru_cache
 from authentication.emailverification import send_verification_email
+from api import fraud
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_decode
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadTimeSignature
@@ -69,6 +70,7 @@ class RegistrationView(APIView):
         serializer = TemporaryUserSerializer(data=data)
         if serializer.is_valid():
             temporary_user = serializer.save()
+            fraud.observe(fraud.REGISTRATION, request)
 
             # Send verification email
             send_verification_email(temporary_user, request)
@@ -1,9 +1,16 @@
 from django.contrib import admin
-from .models import Booking,Ticket,DailyEarnings
+from .models import Booking,Ticket,DailyEarnings,BookingTombstone,TicketSigningKey
 
 # Register your models here.
 
 admin.site.register(Ticket)
+admin.site.register(BookingTombstone)
+
+class TicketSigningKeyAdmin(admin.ModelAdmin):
+    list_display = ['key_id', 'organization', 'created_at', 'retired_at']
+    list_filter = ['organization']
+
+admin.site.register(TicketSigningKey, TicketSigningKeyAdmin)
 # admin.site.register(DailyEarnings)
 
 class BookingAdmin(admin.ModelAdmin):
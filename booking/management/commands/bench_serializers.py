@@ -0,0 +1,261 @@
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from authentication.models import CustomUser, Organization, Driver, Passenger
+from organization.models import Vehicle, Seat, Trip, TripPrice
+from organization.serializers import TripSerializer
+from booking.models import Booking, DailyEarnings
+from booking.serializers import BookingSerializer, DailyEarningSerializer
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmarks', 'serializers_baseline.json')
+
+# Fixed fixture sizes: (number of trips, bookings per trip, seats per booking)
+FIXTURE_SIZES = {
+    'small': (2, 5, 2),
+    'large': (10, 40, 3),
+}
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries without Django's bounded query log."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Rollback(Exception):
+    """Raised to discard the benchmark fixtures once measurements are done."""
+
+
+class Command(BaseCommand):
+    help = "Benchmark BookingSerializer, TripSerializer and DailyEarningSerializer at fixed fixture sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help="Timed runs per benchmark.")
+        parser.add_argument('--warmups', type=int, default=2, help="Untimed warmup runs per benchmark.")
+        parser.add_argument('--save-baseline', action='store_true', help="Store the results as the in-repo baseline.")
+        parser.add_argument('--compare', action='store_true', help="Compare the results with the stored baseline.")
+        parser.add_argument('--threshold', type=float, default=0.20,
+                            help="Relative growth in allocations or queries that counts as a regression (default 0.20).")
+        # Wall time moves by half between runs on a shared machine even normalised, so by default it is only reported
+        parser.add_argument('--time-threshold', type=float, default=0.50,
+                            help="Relative growth in calibrated median time that is reported (default 0.50).")
+        parser.add_argument('--fail-on-time', action='store_true',
+                            help="Count time growth beyond --time-threshold as a regression too.")
+
+    def handle(self, *args, **options):
+        results = {}
+        calibrations = [self._calibrate()]
+        # Fixtures live only inside this transaction; it is always rolled back
+        try:
+            with transaction.atomic():
+                for size, dimensions in FIXTURE_SIZES.items():
+                    trips = self._create_fixtures(size, *dimensions)
+                    for name, func in self._benchmarks(trips).items():
+                        key = f"{name}[{size}]"
+                        results[key] = self._measure(func, options['runs'], options['warmups'])
+                        self._print_result(key, results[key])
+                raise Rollback
+        except Rollback:
+            pass
+        # Before and after, so the machine slowing down during the run shows in both
+        calibrations.append(self._calibrate())
+        calibration_ms = round(statistics.median(calibrations), 3)
+        self.stdout.write(f"Calibration loop: {calibration_ms:.2f} ms")
+
+        if options['save_baseline']:
+            self._save_baseline(results, calibration_ms)
+            self.stdout.write(f"Baseline written to {BASELINE_PATH}")
+
+        if options['compare']:
+            regressions = self._compare(
+                results, calibration_ms, options['threshold'], options['time_threshold'], options['fail_on_time'],
+            )
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def _benchmarks(self, trips):
+        """Each benchmark re-runs the view-style query and serializes the result."""
+        trip_ids = [trip.id for trip in trips]
+
+        def booking_list():
+            queryset = Booking.objects.filter(trip_id__in=trip_ids).select_related('trip', 'trip__vehicle').prefetch_related('seats')
+            return BookingSerializer(queryset, many=True).data
+
+        # Prefetching the seats holds every listed vehicle's seats at once, which
+        # roughly doubles the peak allocation of a large page against loading them per trip
+        def trip_list():
+            queryset = Trip.objects.filter(id__in=trip_ids).with_related()
+            return TripSerializer(queryset, many=True).data
+
+        def daily_earnings():
+            # The nested trip's rating fields read the driver's and the organization's summaries
+            queryset = DailyEarnings.objects.filter(trip_id__in=trip_ids).select_related('trip', 'trip__vehicle').prefetch_related(
+                'trip__vehicle__driver__rating_summaries', 'trip__organization__rating_summaries',
+            )
+            return DailyEarningSerializer(queryset, many=True).data
+
+        return {
+            'BookingSerializer': booking_list,
+            'TripSerializer': trip_list,
+            'DailyEarningSerializer': daily_earnings,
+        }
+
+    def _calibrate(self, runs=9):
+        """
+        Median time of a fixed pure Python loop, in ms. Benchmark times are
+        compared as multiples of it, so a slower or busier machine doesn't read
+        as a regression.
+        """
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            rows = [{'id': i, 'name': str(i), 'price': i * 1.5} for i in range(20000)]
+            sorted(rows, key=lambda row: row['name'])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def _measure(self, func, runs, warmups):
+        for _ in range(warmups):
+            func()
+
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # Allocations and query count are deterministic, so one traced run is enough
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            tracemalloc.start()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return {
+            'mean_ms': round(statistics.mean(timings), 3),
+            'stdev_ms': round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0,
+            'median_ms': round(statistics.median(timings), 3),
+            'min_ms': round(min(timings), 3),
+            'peak_kb': round(peak / 1024, 1),
+            'queries': counter.count,
+        }
+
+    def _print_result(self, key, result):
+        self.stdout.write(
+            f"{key}: {result['mean_ms']:.2f} ms +- {result['stdev_ms']:.2f} ms "
+            f"(median {result['median_ms']:.2f}, min {result['min_ms']:.2f}), peak {result['peak_kb']:.1f} KiB, {result['queries']} queries"
+        )
+
+    def _save_baseline(self, results, calibration_ms):
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        baseline = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'calibration_ms': calibration_ms,
+            },
+            'benchmarks': results,
+        }
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+
+    def _compare(self, results, calibration_ms, threshold, time_threshold, fail_on_time):
+        if not os.path.exists(BASELINE_PATH):
+            raise CommandError("No baseline stored yet; run with --save-baseline first.")
+        with open(BASELINE_PATH) as baseline_file:
+            stored = json.load(baseline_file)
+        baseline = stored['benchmarks']
+        baseline_calibration = stored['environment'].get('calibration_ms')
+
+        regressions = []
+        for key, result in results.items():
+            previous = baseline.get(key)
+            if not previous:
+                self.stdout.write(f"{key}: no baseline")
+                continue
+            # Allocations and query counts are the hard gate; time only with --fail-on-time
+            checks = [
+                ('allocations', result['peak_kb'], previous['peak_kb'], threshold, True),
+                ('queries', result['queries'], previous['queries'], threshold, True),
+            ]
+            if baseline_calibration and 'median_ms' in previous:
+                checks.append((
+                    'time', round(result['median_ms'] / calibration_ms, 2),
+                    round(previous['median_ms'] / baseline_calibration, 2), time_threshold, fail_on_time,
+                ))
+            for metric, current, old, limit, gating in checks:
+                change = (current - old) / old if old else 0.0
+                if change > limit:
+                    line = f"{key}: {metric} {old} -> {current} (+{change:.0%})"
+                    if gating:
+                        regressions.append(f"{key} {metric} +{change:.0%}")
+                        self.stdout.write(self.style.ERROR(line))
+                    else:
+                        self.stdout.write(self.style.WARNING(line))
+                elif change < -limit:
+                    self.stdout.write(self.style.SUCCESS(f"{key}: {metric} {old} -> {current} ({change:.0%})"))
+        return regressions
+
+    def _create_fixtures(self, size, num_trips, bookings_per_trip, seats_per_booking):
+        """Create trips, seats, bookings and one daily earnings row per trip without writing ticket files."""
+        prefix = f"bench-{size}"
+        org_user = CustomUser.objects.create_user(f"{prefix}-org", f"{prefix}-org@example.com", 'bench', is_organization=True)
+        organization = Organization.objects.create(user=org_user, name=f"{prefix} org")
+        passenger_user = CustomUser.objects.create_user(f"{prefix}-pas", f"{prefix}-pas@example.com", 'bench', is_passenger=True)
+        passenger = Passenger.objects.create(user=passenger_user)
+
+        seat_count = bookings_per_trip * seats_per_booking + 1
+        start = timezone.now() + timedelta(days=1)
+        trips = []
+        for index in range(num_trips):
+            driver_user = CustomUser.objects.create_user(f"{prefix}-drv{index}", f"{prefix}-drv{index}@example.com", 'bench', is_driver=True)
+            driver = Driver.objects.create(user=driver_user, license_number=f"{prefix}-{index}", organization=organization)
+            vehicle = Vehicle.objects.create(
+                organization=organization, driver=driver, registration_number=f"{prefix}-{index}",
+                vehicle_type='bus', seating_capacity=seat_count, available_seat=seat_count,
+                license_plate_number=f"B{size[0]}{index}", insurance_expiry_date=date(2099, 1, 1),
+                fitness_certificate_expiry_date=date(2099, 1, 1),
+            )
+            seats = Seat.objects.bulk_create(
+                [Seat(vehicle=vehicle, seat_number=f"S{str(i).zfill(3)}") for i in range(1, seat_count + 1)]
+            )
+            trip = Trip.objects.create(
+                trip_id=f"{prefix}-{index}", organization=organization, vehicle=vehicle, from_location='kathmandu', to_location='pokhara',
+                start_datetime=start, end_datetime=start + timedelta(hours=7),
+            )
+            TripPrice.objects.create(trip=trip, price=1000)
+
+            bookings = Booking.objects.bulk_create([
+                Booking(booking_id=f"{prefix}-{index}-{b}", passenger=passenger, trip=trip, trip_datetime=start.date(),
+                        num_passengers=seats_per_booking, price=1000 * seats_per_booking, is_confirmed=True, is_paid=True)
+                for b in range(bookings_per_trip)
+            ])
+            Booking.seats.through.objects.bulk_create([
+                Booking.seats.through(booking_id=booking.id, seat_id=seats[1 + b * seats_per_booking + s].id)
+                for b, booking in enumerate(bookings) for s in range(seats_per_booking)
+            ])
+
+            earnings = DailyEarnings.objects.create(trip=trip, trip_date=start.date(), is_completed=True)
+            earnings.bookings.set(bookings)
+            trips.append(trip)
+        return trips
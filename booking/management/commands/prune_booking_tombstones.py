@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from booking.models import BookingTombstone
+
+
+class Command(BaseCommand):
+    help = ("Delete the tombstones of cancelled bookings whose departure is over. Manifests and ticket "
+            "revocation lists only read tombstones of departures from yesterday on.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help="Keep the tombstones of departures from this many days ago on (at least 2).")
+
+    def handle(self, *args, **options):
+        if options['days'] < 2:
+            raise CommandError("--days must be at least 2, so yesterday's departures keep their tombstones.")
+        cutoff = timezone.localdate() - timedelta(days=options['days'])
+        deleted, _ = BookingTombstone.objects.filter(trip_datetime__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstone(s) of departures before {cutoff}."))
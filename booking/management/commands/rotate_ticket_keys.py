@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import Organization
+from booking.models import TicketSigningKey
+
+
+class Command(BaseCommand):
+    help = ("Sign new tickets with a fresh key. Retired keys keep verifying for a while, so QR codes "
+            "downloaded before the rotation still scan; drivers' devices pick up the new key on their next sync.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('organizations', nargs='*', type=int, help="Organization ids; every organization if none.")
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.order_by('pk')
+        if options['organizations']:
+            organizations = organizations.filter(pk__in=options['organizations'])
+            missing = set(options['organizations']) - set(organizations.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"No organization with id {', '.join(map(str, sorted(missing)))}")
+        rotated = 0
+        for organization_id in organizations.values_list('pk', flat=True):
+            TicketSigningKey.rotate(organization_id)
+            rotated += 1
+        self.stdout.write(self.style.SUCCESS(f"Rotated the ticket keys of {rotated} organization(s)."))
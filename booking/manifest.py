@@ -0,0 +1,129 @@
+"""
+Compact passenger manifests of a trip's departure, for drivers syncing over
+poor connections.
+
+A manifest lists each booking of the departure as its id, the passenger's
+name, seat numbers and whether it is paid. Every response carries a cursor;
+sent back, only bookings saved since then and the ids of bookings cancelled
+since then (BookingTombstone) are returned, so a refresh with nothing new is
+a few dozen bytes. Clients drop the removed ids first, then upsert the
+bookings by id.
+
+The cursor holds the departure date and the time of the sync. Changes are
+looked for from SYNC_OVERLAP before it, so a booking saved in a transaction
+that committed after the previous sync read is not missed; the overlap can
+return a booking twice, which the upsert absorbs. A cursor for another date
+(the trip has moved on to its next departure) gets the full manifest again.
+
+revoked_bookings serves the same tombstones organization-wide, with the
+bookings that are not paid and confirmed, as the revocation list of offline
+ticket checks (booking.ticket_signing).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .models import Booking, BookingTombstone
+
+
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(trip_date, synced_at):
+    """Opaque cursor: the departure date and the sync time in milliseconds, base 36."""
+    return f"{trip_date:%Y%m%d}.{_base36(int(synced_at.timestamp() * 1000))}"
+
+
+def decode_cursor(cursor):
+    """(trip date, sync time) of a cursor from encode_cursor; raises InvalidCursor."""
+    try:
+        day, millis = cursor.split('.')
+        trip_date = datetime.strptime(day, '%Y%m%d').date()
+        synced_at = datetime.fromtimestamp(int(millis, 36) / 1000, tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        raise InvalidCursor(cursor)
+    return trip_date, synced_at
+
+
+def _base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
+
+
+def build_manifest(trip, cursor=None):
+    """
+    The manifest of trip's current departure: everything when cursor is None
+    (or for another date), otherwise the changes since cursor.
+    """
+    synced_at = timezone.now()
+    trip_date = trip.start_datetime.date()
+    since = None
+    if cursor:
+        cursor_date, cursor_time = decode_cursor(cursor)
+        if cursor_date == trip_date:
+            since = cursor_time - SYNC_OVERLAP
+
+    bookings = Booking.objects.filter(trip=trip, trip_datetime=trip_date)
+    removed = []
+    if since is not None:
+        bookings = bookings.filter(updated_at__gte=since)
+        removed = list(BookingTombstone.objects.filter(
+            trip=trip, trip_datetime=trip_date, deleted_at__gte=since,
+        ).values_list('booking_id', flat=True).distinct())
+
+    # One row per booking and seat, folded into one entry per booking
+    rows = {}
+    for booking_id, name, is_paid, seat_number in bookings.values_list(
+        'booking_id', 'passenger__user__username', 'is_paid', 'seats__seat_number',
+    ).order_by('booking_id', 'seats__seat_number'):
+        entry = rows.get(booking_id)
+        if entry is None:
+            entry = rows[booking_id] = {'id': booking_id, 'name': name, 'seats': [], 'paid': is_paid}
+        if seat_number:
+            entry['seats'].append(seat_number)
+
+    return {
+        'trip_id': trip.trip_id,
+        'date': trip_date.isoformat(),
+        'full': since is None,
+        'cursor': encode_cursor(trip_date, synced_at),
+        'bookings': list(rows.values()),
+        'removed': removed,
+    }
+
+
+def revoked_bookings(organization, cursor=None):
+    """
+    Ids of the organization's bookings, for departures from yesterday on
+    (overnight trips are still running), that were cancelled or are not paid
+    and confirmed: all of them, or those changed since cursor.
+    """
+    synced_at = timezone.now()
+    today = synced_at.date()
+    since_day = today - timedelta(days=1)
+    tombstones = BookingTombstone.objects.filter(trip__organization=organization, trip_datetime__gte=since_day)
+    # A ticket signed while paid stays valid offline unless listed once payment or confirmation is withdrawn
+    unsigned = Booking.objects.filter(trip__organization=organization, trip_datetime__gte=since_day).exclude(is_paid=True, is_confirmed=True)
+    since = None
+    if cursor:
+        cursor_date, cursor_time = decode_cursor(cursor)
+        # From another day, the full list drops the departures that are over
+        if cursor_date == today:
+            since = cursor_time - SYNC_OVERLAP
+            tombstones = tombstones.filter(deleted_at__gte=since)
+            unsigned = unsigned.filter(updated_at__gte=since)
+    revoked = set(tombstones.values_list('booking_id', flat=True)) | set(unsigned.values_list('booking_id', flat=True))
+    return {
+        'full': since is None,
+        'cursor': encode_cursor(today, synced_at),
+        'revoked': sorted(revoked),
+    }
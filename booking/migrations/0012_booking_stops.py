@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-19 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0011_dailyearnings_is_completed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='from_stop',
+            field=models.CharField(blank=True, choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='segment_mask',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='to_stop',
+            field=models.CharField(blank=True, choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100, null=True),
+        ),
+    ]
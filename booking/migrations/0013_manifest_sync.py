@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-19 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0012_booking_stops'),
+        ('organization', '0018_demand_forecasts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='BookingTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking_id', models.CharField(max_length=200)),
+                ('trip_datetime', models.DateField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_tombstones', to='organization.trip')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-19 08:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_alter_driver_profile_image_and_more'),
+        ('booking', '0013_manifest_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSigningKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('secret', models.CharField(editable=False, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_signing_key', to='authentication.organization')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-19 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_alter_driver_profile_image_and_more'),
+        ('booking', '0014_ticket_signing_keys'),
+    ]
+
+    # HMAC secrets can't become key pairs; keys are created again on first use
+    operations = [
+        migrations.DeleteModel(
+            name='TicketSigningKey',
+        ),
+        migrations.CreateModel(
+            name='TicketSigningKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_id', models.CharField(editable=False, max_length=16, unique=True)),
+                ('private_key', models.CharField(editable=False, max_length=64)),
+                ('public_key', models.CharField(editable=False, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('retired_at', models.DateTimeField(blank=True, null=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_signing_keys', to='authentication.organization')),
+            ],
+        ),
+    ]
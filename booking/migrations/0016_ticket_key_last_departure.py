@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0015_ticket_signing_key_pairs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticketsigningkey',
+            name='last_departure',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+    ]
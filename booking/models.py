@@ -1,15 +1,39 @@
 # booking/models.py
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from organization.models import Trip,TripPrice, Seat
-from authentication.models import Passenger
+from organization.locations import trip_choices
+from authentication.models import Passenger, Organization
+from authentication.querysets import RoleScopedQuerySet
 from django.conf import settings
 import os
 from rest_framework.serializers import ValidationError
 import random
-from django.db.models.signals import post_save
+from datetime import timedelta
+import secrets
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
+from organization import cache as trip_cache
+from organization import price_calendar
+from . import ticket_signing
+from wallet.models import Wallet, refund
+from django.apps import apps
+from django.db.models import Sum
+
+class BookingQuerySet(RoleScopedQuerySet):
+    role_lookups = {
+        'organization': 'trip__organization__user',
+        'driver': 'trip__vehicle__driver__user',
+        'passenger': 'passenger__user',
+    }
+
+    def with_related(self):
+        """Everything BookingSerializer reads, joined in one query (seats prefetched)."""
+        return self.select_related(
+            'passenger__user', 'trip__organization', 'trip__vehicle__driver', 'trip__price'
+        ).prefetch_related('seats')
+
 
 class Booking(models.Model):
     booking_id = models.CharField(max_length=200, unique=True, editable=False)
@@ -20,8 +44,18 @@ class Booking(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     booking_datetime = models.DateTimeField(auto_now_add=True)
     seats = models.ManyToManyField(Seat, related_name="bookings", blank=True)
+    # Stops the passengers board and leave at; blank means the trip's origin and destination
+    from_stop = models.CharField(max_length=100, choices=trip_choices, blank=True, null=True)
+    to_stop = models.CharField(max_length=100, choices=trip_choices, blank=True, null=True)
+    # Route segments the booking holds on its seats (Trip.segment_mask)
+    segment_mask = models.PositiveBigIntegerField(default=0, editable=False)
     is_confirmed = models.BooleanField(default=False, db_index=True)
     is_paid = models.BooleanField(default=False, db_index=True)
+    # Bumped on every save, so driver manifests can sync only what changed; bulk updates must set it themselves
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = BookingQuerySet.as_manager()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._seats_updated = False  # Add this line to initialize the attribute
@@ -38,7 +72,9 @@ class Booking(models.Model):
             print(f"Generated booking ID: {self.booking_id}")
 
         self.trip_datetime = self.trip.start_datetime.date()
-        self.price = self.trip.price.price * self.num_passengers
+        # Quoted once, from the trip's compiled fare table at the load the booking brings it to
+        if self._state.adding:
+            self.price = self.trip.price.quote() * self.num_passengers
         print(f"Calculated price: {self.price}")
 
         super().save(*args, **kwargs)
@@ -68,15 +104,28 @@ class Booking(models.Model):
 
     def delete(self, *args, **kwargs):
         self.reset_seat_occupation_and_vehicle_availability()
+        self.refund_to_wallet()
         super().delete(*args, **kwargs)
 
+    def refund_to_wallet(self):
+        """Credit what was paid for this booking to the passenger's wallet when it is cancelled."""
+        if not self.is_paid:
+            return None
+        Payment = apps.get_model('passenger.Payment')
+        amount = Payment.objects.filter(booking=self, is_successful=True).aggregate(total=Sum('amount_paid'))['total'] or self.price
+        if not amount:
+            return None
+        wallet = Wallet.for_user(self.passenger.user)
+        # Keyed on the booking, so a retried cancellation never refunds twice
+        return refund(wallet, amount, reference=f"refund:booking:{self.pk}", description=f"Refund for booking {self.booking_id}")
+
     def reset_seat_occupation_and_vehicle_availability(self):
         print("Running reset_seat_occupation_and_vehicle_availability method...")
-        if self.seats.exists():
-            print(f"Updating {self.seats.count()} seat(s) to available status.")
-            self.seats.update(is_occupied=False)
-            self.trip.vehicle.available_seat += self.seats.count()
-            self.trip.vehicle.save()
+        seat_ids = list(self.seats.values_list('pk', flat=True))
+        if seat_ids:
+            print(f"Updating {len(seat_ids)} seat(s) to available status.")
+            # Bookings made before segment inventory hold their seats outright
+            self.trip.vehicle.release_seats(seat_ids, self.segment_mask or Seat.ALL_SEGMENTS)
             print(f"Updated vehicle available seats: {self.trip.vehicle.available_seat}")
 
     def generate_or_update_ticket(self):
@@ -118,14 +167,99 @@ class Booking(models.Model):
         Driver: {self.trip.vehicle.driver.user.username}
         {vehicle_details}
         Status: {'Confirmed' if self.is_confirmed else 'Not Confirmed'}, {'Paid' if self.is_paid else 'Not Paid'}
+        Signed Ticket: {ticket_signing.sign_ticket(self) if ticket_signing.is_signable(self) else 'issued once paid and confirmed'}
         -------------------------------------
         """
 
+class BookingTombstone(models.Model):
+    """
+    A cancelled booking, kept so driver manifests synced before the
+    cancellation learn to drop it. prune_booking_tombstones deletes them once
+    their departure is over.
+    """
+    booking_id = models.CharField(max_length=200)
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='booking_tombstones')
+    trip_datetime = models.DateField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.booking_id} - cancelled {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class TicketSigningKey(models.Model):
+    """
+    An Ed25519 key pair signing an organization's ticket QR payloads. Only the
+    public half leaves the server; the key without retired_at signs new tickets.
+    A retired key keeps verifying until last_departure, the latest departure it
+    signed a ticket for, has run.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='ticket_signing_keys')
+    key_id = models.CharField(max_length=16, unique=True, editable=False)
+    private_key = models.CharField(max_length=64, editable=False)
+    public_key = models.CharField(max_length=64, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    retired_at = models.DateTimeField(null=True, blank=True)
+    last_departure = models.DateField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f"Ticket signing key {self.key_id} of {self.organization}"
+
+    @classmethod
+    def _create(cls, organization_id):
+        private_key, public_key = ticket_signing.generate_key_pair()
+        return cls.objects.create(
+            organization_id=organization_id, key_id=secrets.token_hex(4), private_key=private_key, public_key=public_key,
+        )
+
+    @classmethod
+    def for_organization(cls, organization_id):
+        """The organization's active key, created on first use."""
+        key = cls.objects.filter(organization_id=organization_id, retired_at__isnull=True).order_by('-created_at').first()
+        return key or cls._create(organization_id)
+
+    @classmethod
+    def verifying_keys(cls, organization_id):
+        """
+        The organization's keys that tickets may still carry: the active one and
+        retired ones that signed departures from yesterday on (overnight trips are still running).
+        """
+        cls.for_organization(organization_id)
+        return cls.objects.filter(
+            models.Q(retired_at__isnull=True) | models.Q(last_departure__gte=timezone.localdate() - timedelta(days=1)),
+            organization_id=organization_id,
+        ).order_by('-created_at')
+
+    def signed_for(self, departure):
+        """Record that the key signed a ticket for departure, keeping it in verifying_keys until then."""
+        if self.last_departure is None or self.last_departure < departure:
+            type(self).objects.filter(pk=self.pk).filter(
+                models.Q(last_departure__isnull=True) | models.Q(last_departure__lt=departure),
+            ).update(last_departure=departure)
+            self.last_departure = departure
+
+    @classmethod
+    @transaction.atomic
+    def rotate(cls, organization_id):
+        """Retire the organization's active keys and sign from now on with a new one."""
+        cls.objects.filter(organization_id=organization_id, retired_at__isnull=True).update(retired_at=timezone.now())
+        return cls._create(organization_id)
+
+
+class TicketQuerySet(RoleScopedQuerySet):
+    role_lookups = {
+        'organization': 'booking__trip__organization__user',
+        'driver': 'booking__trip__vehicle__driver__user',
+        'passenger': 'booking__passenger__user',
+    }
+
+
 class Ticket(models.Model):
     ticket_id = models.CharField(max_length=200, unique=True, editable=False)
     booking = models.OneToOneField(Booking, on_delete=models.CASCADE)
     ticket_file = models.FileField(upload_to='tickets/', max_length=200)
 
+    objects = TicketQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.ticket_id:
             from_location = self.booking.trip.from_location[:2].upper()
@@ -138,6 +272,22 @@ class Ticket(models.Model):
     def __str__(self):
         return f"Ticket for {self.booking.trip.vehicle.registration_number} - {self.booking.trip.from_location} to {self.booking.trip.to_location}"
 
+class DailyEarningsQuerySet(RoleScopedQuerySet):
+    role_lookups = {
+        'organization': 'trip__organization__user',
+        'driver': 'trip__vehicle__driver__user',
+    }
+
+    def with_related(self):
+        """Everything DailyEarningSerializer reads: the trip with its vehicle, and the bookings."""
+        return self.select_related(
+            'trip__organization', 'trip__vehicle__organization__user', 'trip__vehicle__driver__user', 'trip__price'
+        ).prefetch_related(
+            'trip__vehicle__seats', 'trip__vehicle__driver__rating_summaries', 'trip__organization__rating_summaries',
+            models.Prefetch('bookings', queryset=Booking.objects.with_related()),
+        )
+
+
 class DailyEarnings(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='daily_earnings')
     trip_date = models.DateField(default=timezone.now)  # Default to today's date
@@ -145,6 +295,8 @@ class DailyEarnings(models.Model):
     total_earnings = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     bookings = models.ManyToManyField(Booking, related_name='daily_earnings', blank=True)
     is_completed = models.BooleanField(default=False)
+
+    objects = DailyEarningsQuerySet.as_manager()
     
     def __str__(self):
         return f"Earnings for {self.trip_date} - Trip ID: {self.trip.trip_id}"
@@ -155,4 +307,42 @@ class DailyEarnings(models.Model):
         bookings = self.bookings.filter(trip_datetime=self.trip_date)
         self.num_passengers_on_that_day = sum(booking.num_passengers for booking in bookings)
         self.total_earnings = sum(booking.price for booking in bookings)
-        self.save()
\ No newline at end of file
+        self.save()
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def invalidate_booking_trip_cache(sender, instance, **kwargs):
+    """Bookings change seat availability and earnings shown on the trip."""
+    trip_cache.invalidate_trip(instance.trip_id)
+    price_calendar.invalidate_trips(pk=instance.trip_id)
+
+
+@receiver(post_delete, sender=Booking)
+def record_booking_tombstone(sender, instance, **kwargs):
+    """
+    Every deleted booking, QuerySet.delete() included, leaves a tombstone for
+    manifest syncs. It is written once the deletion commits, and only if the
+    trip is still there: bookings deleted along with their trip need none.
+    """
+    def record():
+        if Trip.objects.filter(pk=instance.trip_id).exists():
+            BookingTombstone.objects.create(booking_id=instance.booking_id, trip_id=instance.trip_id, trip_datetime=instance.trip_datetime)
+    transaction.on_commit(record)
+
+
+@receiver(m2m_changed, sender=Booking.seats.through)
+def touch_booking_on_seat_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """seats.add/remove/set/clear don't save the booking; bump updated_at so manifest deltas carry the new seats."""
+    if reverse:
+        # Changed from the seat's side; a clear is caught before it, while the seat's bookings are still known
+        if action == 'pre_clear':
+            bookings = Booking.objects.filter(seats=instance)
+        elif action in ('post_add', 'post_remove'):
+            bookings = Booking.objects.filter(pk__in=pk_set)
+        else:
+            return
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        bookings = Booking.objects.filter(pk=instance.pk)
+    else:
+        return
+    bookings.update(updated_at=timezone.now())
@@ -66,43 +66,33 @@ class BookingSerializer(serializers.ModelSerializer):
         except Passenger.DoesNotExist:
             raise serializers.ValidationError({"message": "Passenger not found"})
 
-        # Assign trip to the booking and validate seat availability
+        # Assign trip to the booking and work out the stretch of route it travels
         try:
             trip = Trip.objects.select_related('vehicle').get(trip_id=trip_id)
-            available_seats = trip.vehicle.available_seat
-            if len(seats_data) > available_seats:
-                raise serializers.ValidationError({"seats": f"Not enough seats available. Only {available_seats} seats are left."})
             validated_data['trip'] = trip
         except Trip.DoesNotExist:
             raise serializers.ValidationError({"message": "Trip not found"})
+        validated_data['segment_mask'] = trip.segment_mask(validated_data.get('from_stop'), validated_data.get('to_stop'))
 
-        # Check if selected seats are occupied and validate seat selection
+        # Validate seat selection; occupancy is checked when the seats are claimed
         seat_numbers = [seat['seat_number'] for seat in seats_data]
-        seats = trip.vehicle.seats.filter(seat_number__in=seat_numbers, is_occupied=False)
-        
-        if seats.count() != len(seat_numbers):
+        seats = list(trip.vehicle.seats.filter(seat_number__in=seat_numbers))
+
+        if len(seats) != len(seat_numbers):
             raise serializers.ValidationError({"seats": "One or more seats are already occupied or invalid."})
 
+        # Claim the segments first, so a seat taken meanwhile fails before anything is written
+        trip.vehicle.claim_seats([seat.pk for seat in seats], validated_data['segment_mask'])
+
         # Create the booking and assign the seats
         booking = Booking.objects.create(**validated_data)
         booking.seats.set(seats)
         booking.save()
 
-        # Update seat occupation and vehicle availability
-        self.update_seat_occupation_and_vehicle_availability(booking)
-
         return booking
 
-    def update_seat_occupation_and_vehicle_availability(self, booking):
-        """Update the status of selected seats and the vehicle's available seat count."""
-        if booking.seats.exists():
-            num_passengers = booking.seats.count()
-            booking.seats.update(is_occupied=True)
-            booking.trip.vehicle.available_seat -= num_passengers
-            booking.trip.vehicle.save()
-
     def update(self, instance, validated_data):
-        """Update a Booking instance with partial data, excluding seats."""
+        """Update a Booking instance with partial data, excluding seats and stops."""
         validated_data.pop('seats', None)
         instance.is_confirmed = validated_data.get('is_confirmed', instance.is_confirmed)
         instance.is_paid = validated_data.get('is_paid', instance.is_paid)
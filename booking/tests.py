@@ -1,3 +1,151 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import CustomUser, Organization, Driver, Passenger
+from organization.models import Vehicle, Seat, Trip, TripPrice
+from .models import Booking, BookingTombstone, TicketSigningKey
+from . import ticket_signing
+from .manifest import build_manifest, revoked_bookings
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BookingTestCase(TestCase):
+    """An organization with one driven 6-seat bus on a kathmandu -> pokhara trip tomorrow, fare 1000."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        self.organization = Organization.objects.create(user=org_user, name='Org')
+        driver_user = CustomUser.objects.create_user('driver', 'driver@example.com', 'password', is_driver=True)
+        self.driver = Driver.objects.create(user=driver_user, license_number='L-1', organization=self.organization)
+        passenger_user = CustomUser.objects.create_user('rider', 'rider@example.com', 'password', is_passenger=True)
+        self.passenger = Passenger.objects.create(user=passenger_user)
+        self.vehicle = Vehicle.objects.create(
+            organization=self.organization, driver=self.driver, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=6, available_seat=5, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        self.seats = [Seat.objects.create(vehicle=self.vehicle, seat_number=f"S00{i}") for i in range(1, 7)]
+        start = timezone.now() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            organization=self.organization, vehicle=self.vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=start, end_datetime=start + timedelta(hours=7),
+        )
+        TripPrice.objects.create(trip=self.trip, price=1000)
+
+    def book(self, *seats, paid=True):
+        booking = Booking.objects.create(passenger=self.passenger, trip=self.trip, is_paid=paid, is_confirmed=paid)
+        booking.seats.set(seats)
+        return booking
+
+
+class TicketSigningTests(BookingTestCase):
+    def keys(self):
+        return {key.key_id: key.public_key for key in TicketSigningKey.verifying_keys(self.organization.pk)}
+
+    def test_signed_ticket_verifies(self):
+        booking = self.book(self.seats[2], self.seats[1])
+        ticket = ticket_signing.verify_ticket(ticket_signing.sign_ticket(booking), self.keys())
+        self.assertEqual(ticket['booking_id'], booking.booking_id)
+        self.assertEqual(ticket['seats'], ['S002', 'S003'])
+        self.assertEqual(ticket['date'], booking.trip_datetime)
+
+    def test_tampered_ticket_is_rejected(self):
+        payload = ticket_signing.sign_ticket(self.book(self.seats[1]))
+        for tampered in [payload.replace('S002', 'S003'), payload[:-4] + 'AAAA', '1' + payload[1:]]:
+            with self.assertRaises(ticket_signing.InvalidTicket):
+                ticket_signing.verify_ticket(tampered, self.keys())
+
+    def test_revoked_ticket_is_rejected(self):
+        booking = self.book(self.seats[1])
+        payload = ticket_signing.sign_ticket(booking)
+        with self.assertRaises(ticket_signing.InvalidTicket):
+            ticket_signing.verify_ticket(payload, self.keys(), revoked={booking.booking_id})
+
+    def test_unpaid_booking_is_not_signed(self):
+        booking = self.book(self.seats[1], paid=False)
+        with self.assertRaises(ticket_signing.InvalidTicket):
+            ticket_signing.sign_ticket(booking)
+        self.assertIn(booking.booking_id, revoked_bookings(self.organization)['revoked'])
+
+        client = APIClient()
+        client.force_authenticate(self.passenger.user)
+        response = client.get(f"/api/ticket/detail/{booking.ticket.ticket_id}/qr/")
+        self.assertEqual(response.status_code, 400)
+
+        booking.is_paid = booking.is_confirmed = True
+        booking.save()
+        response = client.get(f"/api/ticket/detail/{booking.ticket.ticket_id}/qr/")
+        self.assertEqual(response.status_code, 200)
+        ticket_signing.verify_ticket(response['X-Ticket-Payload'], self.keys())
+        self.assertNotIn(booking.booking_id, revoked_bookings(self.organization)['revoked'])
+
+    def test_retired_key_verifies_until_its_last_departure_has_run(self):
+        booking = self.book(self.seats[1])
+        old_payload = ticket_signing.sign_ticket(booking)
+        TicketSigningKey.rotate(self.organization.pk)
+        new_payload = ticket_signing.sign_ticket(booking)
+        self.assertNotEqual(old_payload.split('|')[1], new_payload.split('|')[1])
+        ticket_signing.verify_ticket(old_payload, self.keys())
+        ticket_signing.verify_ticket(new_payload, self.keys())
+
+        # Two days after the departure, the retired key is gone
+        TicketSigningKey.objects.exclude(retired_at=None).update(last_departure=timezone.localdate() - timedelta(days=2))
+        with self.assertRaises(ticket_signing.InvalidTicket):
+            ticket_signing.verify_ticket(old_payload, self.keys())
+        ticket_signing.verify_ticket(new_payload, self.keys())
+
+
+class ManifestDeltaTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.book(self.seats[1])
+        self.second = self.book(self.seats[2])
+        # Synced long enough ago that the cursor overlap doesn't return them again
+        Booking.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.cursor = build_manifest(self.trip)['cursor']
+
+    def delta(self):
+        return build_manifest(Trip.objects.get(pk=self.trip.pk), self.cursor)
+
+    def test_unchanged_manifest_is_empty(self):
+        delta = self.delta()
+        self.assertEqual((delta['full'], delta['bookings'], delta['removed']), (False, [], []))
+
+    def test_changed_seats_are_synced(self):
+        self.first.seats.set([self.seats[3]])
+        self.assertEqual(self.delta()['bookings'], [{'id': self.first.booking_id, 'name': 'rider', 'seats': ['S004'], 'paid': True}])
+
+    def test_seat_side_changes_are_synced(self):
+        self.seats[2].bookings.clear()
+        self.assertEqual([entry['id'] for entry in self.delta()['bookings']], [self.second.booking_id])
+
+    def test_queryset_delete_leaves_tombstones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(pk__in=[self.first.pk, self.second.pk]).delete()
+        self.assertEqual(sorted(self.delta()['removed']), sorted([self.first.booking_id, self.second.booking_id]))
+
+    def test_deleted_trip_leaves_no_tombstones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip.delete()
+        self.assertFalse(BookingTombstone.objects.exists())
+
+    def test_prune_keeps_recent_departures(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.delete()
+        BookingTombstone.objects.create(booking_id='BOK-OLD', trip=self.trip, trip_datetime=timezone.localdate() - timedelta(days=8))
+        call_command('prune_booking_tombstones', stdout=StringIO())
+        self.assertEqual(list(BookingTombstone.objects.values_list('booking_id', flat=True)), [self.first.booking_id])
@@ -0,0 +1,119 @@
+"""
+Signed ticket payloads that conductors verify offline.
+
+A ticket's QR code holds one line:
+
+    2|<key id>|<organization id>|<booking id>|<trip id>|<YYYYMMDD>|<seat,seat>|<signature>
+
+The signature is Ed25519 over everything before it with the organization's
+active TicketSigningKey, base64url encoded. Only paid and confirmed bookings
+are signed, so a valid payload is a seat that was paid for. A driver's device
+fetches its organization's public keys and the revoked booking ids
+(cancellations, from BookingTombstone, and bookings no longer paid and
+confirmed) while it has a connection, then checks boardings with
+verify_ticket without any request per passenger. Public keys can only verify,
+so a lost device leaks nothing that could sign a ticket.
+
+The key id picks the key a ticket was signed with, so keys can be rotated
+(TicketSigningKey.rotate): new tickets are signed with the new key while a
+retired key keeps verifying until the last departure it signed for has run,
+so QR codes downloaded before the rotation still scan.
+"""
+import base64
+from datetime import datetime
+from io import BytesIO
+
+import qrcode
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+
+
+VERSION = '2'
+
+
+class InvalidTicket(ValueError):
+    pass
+
+
+def generate_key_pair():
+    """(private key, public key) of a new Ed25519 key, both as raw bytes in hex."""
+    private_key = Ed25519PrivateKey.generate()
+    public_key = private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    private_bytes = private_key.private_bytes(
+        serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption(),
+    )
+    return private_bytes.hex(), public_key.hex()
+
+
+def _encode(signature):
+    return base64.urlsafe_b64encode(signature).rstrip(b'=').decode()
+
+
+def _decode(signature):
+    return base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))
+
+
+def is_signable(booking):
+    """Whether the booking is paid and confirmed, the only state a ticket is signed in."""
+    return booking.is_confirmed and booking.is_paid
+
+
+def sign_ticket(booking, key=None):
+    """
+    The signed payload of a paid and confirmed booking, with its organization's
+    active key unless key (a TicketSigningKey) is given; raises InvalidTicket otherwise.
+    """
+    from .models import TicketSigningKey
+
+    if not is_signable(booking):
+        raise InvalidTicket("Booking isn't paid and confirmed.")
+    trip = booking.trip
+    if key is None:
+        key = TicketSigningKey.for_organization(trip.organization_id)
+    key.signed_for(booking.trip_datetime)
+    message = '|'.join([
+        VERSION, key.key_id, str(trip.organization_id), booking.booking_id, trip.trip_id,
+        f"{booking.trip_datetime:%Y%m%d}", ','.join(sorted(seat.seat_number for seat in booking.seats.all())),
+    ])
+    signature = Ed25519PrivateKey.from_private_bytes(bytes.fromhex(key.private_key)).sign(message.encode())
+    return f"{message}|{_encode(signature)}"
+
+
+def verify_ticket(payload, keys, revoked=()):
+    """
+    Check a scanned payload against keys ({key id: public key hex}) and the
+    revoked booking ids. Returns the ticket's fields; raises InvalidTicket.
+    """
+    parts = payload.split('|')
+    if len(parts) != 8 or parts[0] != VERSION:
+        raise InvalidTicket("Not a ticket.")
+    version, key_id, organization_id, booking_id, trip_id, day, seats, signature = parts
+    public_key = keys.get(key_id)
+    if public_key is None:
+        raise InvalidTicket("Ticket of another organization or a retired key.")
+    try:
+        Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_key)).verify(
+            _decode(signature), payload.rsplit('|', 1)[0].encode(),
+        )
+    except (InvalidSignature, ValueError):
+        raise InvalidTicket("Signature doesn't match.")
+    if booking_id in revoked:
+        raise InvalidTicket("Booking was cancelled.")
+    return {
+        'organization_id': int(organization_id),
+        'booking_id': booking_id,
+        'trip_id': trip_id,
+        'date': datetime.strptime(day, '%Y%m%d').date(),
+        'seats': seats.split(',') if seats else [],
+    }
+
+
+def qr_png(payload):
+    """PNG bytes of a QR code holding payload."""
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=8, border=2)
+    code.add_data(payload)
+    code.make(fit=True)
+    buffer = BytesIO()
+    code.make_image().save(buffer)
+    return buffer.getvalue()
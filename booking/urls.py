@@ -9,6 +9,7 @@ urlpatterns = [
       
     path('daily-earnings/create/', views.DailyEarningsCreateView.as_view(), name='daily-earnings-create'),
     path('daily-earnings/filter/', views.DailyEarningsFilterView.as_view(), name='daily-earnings-filter'),
+    path('daily-earnings/detail/<int:earnings_id>/', views.DailyEarningsDetailView.as_view(), name='daily-earnings-detail'),
     path('reset-trip/',views.ResetTripView.as_view(),name='reset-trip')    
 ]
 
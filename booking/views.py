@@ -3,13 +3,16 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse
 from rest_framework.permissions import IsAuthenticated
 
 from .serializers import BookingSerializer, TicketSerializer, DailyEarningSerializer
 from .models import Booking, Ticket, DailyEarnings
+from . import ticket_signing
 from organization.models import TripPrice, Trip
 from authentication.models import Passenger,Organization,Driver
 from authentication.renderers import UserRenderer
+from api import fraud
 from datetime import timedelta
 
 class BookingCreateView(APIView):
@@ -46,6 +49,7 @@ class BookingCreateView(APIView):
             if serializer.is_valid():
                 with transaction.atomic():
                     booking = serializer.save()
+                fraud.observe(fraud.BOOKING, request)
                 message = {
                     "message": "Booking created successfully",
                     "data": serializer.data
@@ -66,16 +70,9 @@ class BookingFilterView(APIView):
 
     def get(self, request):
         try:
-            queryset = Booking.objects.select_related('trip', 'trip__vehicle').prefetch_related('seats')
-
-            if request.user.is_organization:
-                queryset = queryset.filter(trip__organization__user=request.user)
-            elif request.user.is_driver:
-                queryset = queryset.filter(trip__vehicle__driver__user=request.user)
-            elif request.user.is_passenger:
-                queryset = queryset.filter(passenger__user=request.user)
-            else:
+            if not (request.user.is_organization or request.user.is_driver or request.user.is_passenger):
                 return Response({"error": "User is not a driver, organization, or passenger"}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = Booking.objects.visible_to(request.user).with_related()
 
             serializer = BookingSerializer(queryset, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -86,38 +83,26 @@ class BookingFilterView(APIView):
 class BookingDetailView(APIView):
     """
     API view for retrieving, updating, and deleting a specific booking.
+    Only bookings visible to the user are found, so a booking that isn't
+    theirs is a 404 from the same query as the lookup.
     """
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
 
+    def get_booking(self, request, booking_id):
+        return get_object_or_404(Booking.objects.visible_to(request.user).with_related(), booking_id=booking_id)
+
     def get(self, request, booking_id):
+        booking = self.get_booking(request, booking_id)
         try:
-            booking = get_object_or_404(
-                Booking.objects.select_related('trip', 'trip__vehicle').prefetch_related('seats'),
-                booking_id=booking_id
-            )
-
-            # Ensure the user is authorized to view the booking
-            if (request.user.is_driver and booking.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and booking.trip.organization.user != request.user) or \
-               (request.user.is_passenger and booking.passenger.user != request.user):
-                return Response({"message": "Not authorized to view this booking."}, status=status.HTTP_403_FORBIDDEN)
-
             serializer = BookingSerializer(booking)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     def put(self, request, booking_id):
+        booking = self.get_booking(request, booking_id)
         try:
-            booking = get_object_or_404(Booking, booking_id=booking_id)
-
-            # Ensure the user is authorized to update the booking
-            if (request.user.is_driver and booking.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and booking.trip.organization.user != request.user) or \
-               (request.user.is_passenger and booking.passenger.user != request.user):
-                return Response({"message": "Not authorized to update this booking."}, status=status.HTTP_403_FORBIDDEN)
-
             serializer = BookingSerializer(booking, data=request.data, partial=True)
             if serializer.is_valid():
                 with transaction.atomic():
@@ -129,17 +114,11 @@ class BookingDetailView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, booking_id):
+        booking = self.get_booking(request, booking_id)
         try:
-            booking = get_object_or_404(Booking, booking_id=booking_id)
-
-            # Ensure the user is authorized to delete the booking
-            if (request.user.is_driver and booking.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and booking.trip.organization.user != request.user) or \
-               (request.user.is_passenger and booking.passenger.user != request.user):
-                return Response({"message": "Not authorized to delete this booking."}, status=status.HTTP_403_FORBIDDEN)
-
             with transaction.atomic():
                 booking.delete()
+            fraud.observe(fraud.CANCELLATION, request)
             return Response({"message": "Booking deleted successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -178,14 +157,7 @@ class TicketFilterView(APIView):
 
     def get(self, request):
         try:
-            queryset = Ticket.objects.select_related('booking__trip', 'booking__trip__vehicle').prefetch_related('booking__seats')
-
-            if request.user.is_driver:
-                queryset = queryset.filter(booking__trip__vehicle__driver__user=request.user)
-            elif request.user.is_organization:
-                queryset = queryset.filter(booking__trip__organization__user=request.user)
-            else:
-                queryset = queryset.filter(booking__passenger__user=request.user)
+            queryset = Ticket.objects.visible_to(request.user).select_related('booking')
 
             serializer = TicketSerializer(queryset, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -196,40 +168,24 @@ class TicketFilterView(APIView):
 class TicketDetailView(APIView):
     """
     API view for retrieving, updating, and deleting a specific ticket.
+    Tickets that aren't the user's are a 404 from the lookup query itself.
     """
     permission_classes = [IsAuthenticated]
 
+    def get_ticket(self, request, ticket_id):
+        return get_object_or_404(Ticket.objects.visible_to(request.user).select_related('booking'), ticket_id=ticket_id)
+
     def get(self, request, ticket_id):
+        ticket = self.get_ticket(request, ticket_id)
         try:
-            ticket = get_object_or_404(
-                Ticket.objects.select_related('booking__trip', 'booking__trip__vehicle').prefetch_related('booking__seats'),
-                ticket_id=ticket_id
-            )
-
-            # Ensure the user is authorized to view the ticket
-            if (request.user.is_driver and ticket.booking.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and ticket.booking.trip.organization.user != request.user) or \
-               (request.user.is_passenger and ticket.booking.passenger.user != request.user):
-                return Response({"message": "Not authorized to view this ticket."}, status=status.HTTP_403_FORBIDDEN)
-
             serializer = TicketSerializer(ticket)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     def put(self, request, ticket_id):
+        ticket = self.get_ticket(request, ticket_id)
         try:
-            ticket = get_object_or_404(
-                Ticket.objects.select_related('booking__trip', 'booking__trip__vehicle').prefetch_related('booking__seats'),
-                ticket_id=ticket_id
-            )
-
-            # Ensure the user is authorized to update the ticket
-            if (request.user.is_driver and ticket.booking.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and ticket.booking.trip.organization.user != request.user) or \
-               (request.user.is_passenger and ticket.booking.passenger.user != request.user):
-                return Response({"message": "Not authorized to update this ticket."}, status=status.HTTP_403_FORBIDDEN)
-
             serializer = TicketSerializer(ticket, data=request.data, partial=True)
             if serializer.is_valid():
                 with transaction.atomic():
@@ -239,19 +195,10 @@ class TicketDetailView(APIView):
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     def delete(self, request, ticket_id):
+        ticket = self.get_ticket(request, ticket_id)
         try:
-            ticket = get_object_or_404(
-                Ticket.objects.select_related('booking__trip', 'booking__trip__vehicle').prefetch_related('booking__seats'),
-                ticket_id=ticket_id
-            )
-
-            # Ensure the user is authorized to delete the ticket
-            if (request.user.is_driver and ticket.booking.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and ticket.booking.trip.organization.user != request.user) or \
-               (request.user.is_passenger and ticket.booking.passenger.user != request.user):
-                return Response({"message": "Not authorized to delete this ticket."}, status=status.HTTP_403_FORBIDDEN)
-
             with transaction.atomic():
                 ticket.delete()
             return Response({"message": "Ticket deleted successfully"}, status=status.HTTP_200_OK)
@@ -259,6 +206,27 @@ class TicketDetailView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TicketQRView(APIView):
+    """
+    The ticket's signed payload as a QR code PNG, for conductors to check
+    offline with the organization's public keys (see booking.ticket_signing).
+    Only served once the booking is paid and confirmed.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, ticket_id):
+        ticket = get_object_or_404(
+            Ticket.objects.visible_to(request.user).select_related('booking__trip').prefetch_related('booking__seats'),
+            ticket_id=ticket_id,
+        )
+        if not ticket_signing.is_signable(ticket.booking):
+            return Response({"message": "The ticket is issued once the booking is paid and confirmed."}, status=status.HTTP_400_BAD_REQUEST)
+        payload = ticket_signing.sign_ticket(ticket.booking)
+        response = HttpResponse(ticket_signing.qr_png(payload), content_type='image/png')
+        response['X-Ticket-Payload'] = payload
+        return response
+
+
 class DailyEarningsCreateView(APIView):
     """
     API view for creating daily earnings.
@@ -315,14 +283,9 @@ class DailyEarningsFilterView(APIView):
 
     def get(self, request):
         try:
-            queryset = DailyEarnings.objects.select_related('trip', 'trip__vehicle')
-
-            if request.user.is_driver:
-                queryset = queryset.filter(trip__vehicle__driver__user=request.user)
-            elif request.user.is_organization:
-                queryset = queryset.filter(trip__organization__user=request.user)
-            else:
+            if not (request.user.is_driver or request.user.is_organization):
                 return Response({"error": "User is not a driver or organization"}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = DailyEarnings.objects.visible_to(request.user).with_related()
 
             serializer = DailyEarningSerializer(queryset, many=True)
             
@@ -336,38 +299,27 @@ class DailyEarningsFilterView(APIView):
 class DailyEarningsDetailView(APIView):
     """
     API view for retrieving, updating, and deleting specific daily earnings.
+    Earnings of other drivers and organizations are a 404 from the lookup query itself.
     """
     permission_classes = [IsAuthenticated]
 
+    def get_daily_earnings(self, request, earnings_id, related=False):
+        queryset = DailyEarnings.objects.visible_to(request.user)
+        if related:
+            queryset = queryset.with_related()
+        return get_object_or_404(queryset, pk=earnings_id)
+
     def get(self, request, earnings_id):
+        daily_earnings = self.get_daily_earnings(request, earnings_id, related=True)
         try:
-            daily_earnings = get_object_or_404(
-                DailyEarnings.objects.select_related('trip', 'trip__vehicle'),
-                earnings_id=earnings_id
-            )
-
-            # Ensure the user is authorized to view the daily earnings
-            if (request.user.is_driver and daily_earnings.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and daily_earnings.trip.organization.user != request.user):
-                return Response({"message": "Not authorized to view these earnings."}, status=status.HTTP_403_FORBIDDEN)
-
             serializer = DailyEarningSerializer(daily_earnings)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     def put(self, request, earnings_id):
+        daily_earnings = self.get_daily_earnings(request, earnings_id, related=True)
         try:
-            daily_earnings = get_object_or_404(
-                DailyEarnings.objects.select_related('trip', 'trip__vehicle'),
-                earnings_id=earnings_id
-            )
-
-            # Ensure the user is authorized to update the daily earnings
-            if (request.user.is_driver and daily_earnings.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and daily_earnings.trip.organization.user != request.user):
-                return Response({"message": "Not authorized to update these earnings."}, status=status.HTTP_403_FORBIDDEN)
-
             serializer = DailyEarningSerializer(daily_earnings, data=request.data, partial=True)
             if serializer.is_valid():
                 with transaction.atomic():
@@ -379,17 +331,8 @@ class DailyEarningsDetailView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, earnings_id):
+        daily_earnings = self.get_daily_earnings(request, earnings_id)
         try:
-            daily_earnings = get_object_or_404(
-                DailyEarnings.objects.select_related('trip', 'trip__vehicle'),
-                earnings_id=earnings_id
-            )
-
-            # Ensure the user is authorized to delete the daily earnings
-            if (request.user.is_driver and daily_earnings.trip.vehicle.driver.user != request.user) or \
-               (request.user.is_organization and daily_earnings.trip.organization.user != request.user):
-                return Response({"message": "Not authorized to delete these earnings."}, status=status.HTTP_403_FORBIDDEN)
-
             with transaction.atomic():
                 daily_earnings.delete()
             return Response({"message": "Daily earnings deleted successfully"}, status=status.HTTP_200_OK)
@@ -417,6 +360,10 @@ class ResetTripView(APIView):
             # Step 3: Perform reset actions
             try:
                 with transaction.atomic():  # Ensure all changes are atomic
+                    # Scheduled vehicles move on to their next departure, keeping this run's history
+                    if trip.advance_to_next_departure(updated_by=user.username):
+                        return Response({"message": "Trip reset successfully."}, status=status.HTTP_200_OK)
+
                     trip.vehicle.reset_all_seats()  # Reset seats in the vehicle
                     trip.start_datetime += timedelta(days=1)  # Move the trip date by 1 day
                     trip.is_completed = False  # Mark trip as not completed
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'booking',
     'passenger',
     'driver',
+    'wallet',
 
     # Third-party apps
     'rest_framework',
@@ -55,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.TrafficCaptureMiddleware',     # Sampled traffic capture for replay benchmarks
 ]
 
 ROOT_URLCONF = 'disha.urls'
@@ -89,6 +91,43 @@ DATABASES = {
     'default': db_url(config('DATABASE_URL'))
 }
 
+# Cache configuration. Local memory by default; set CACHE_BACKEND to
+# django.core.cache.backends.filebased.FileBasedCache (CACHE_LOCATION is a directory) or
+# django.core.cache.backends.db.DatabaseCache (run `manage.py createcachetable`) to share it between workers.
+# A shared backend is required with more than one worker: the trip cache's invalidation counters live in it
+# (see organization.cache), and with local memory a change in one worker reaches the others only when
+# their cached entries are recomputed, up to TRIP_CACHE_TIMEOUT later. The organization.W001 check warns about it.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='disha-cache'),
+        'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int)},
+    }
+}
+TRIP_CACHE_TIMEOUT = config('TRIP_CACHE_TIMEOUT', default=300, cast=int)
+# Worker processes gunicorn runs (it reads the same variable)
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+# Seconds an expired trip cache entry may still be served while one request refreshes it
+TRIP_CACHE_STALE_TIMEOUT = config('TRIP_CACHE_STALE_TIMEOUT', default=60, cast=int)
+
+# Trip schedules: departures are materialized this many days ahead (see materialize_departures)
+TRIP_SCHEDULE_HORIZON_DAYS = config('TRIP_SCHEDULE_HORIZON_DAYS', default=14, cast=int)
+# Return legs (see organization.planning) leave after this share of the outbound run, and never sooner than the minimum
+RETURN_LEG_TURNAROUND_RATIO = config('RETURN_LEG_TURNAROUND_RATIO', default=0.25, cast=float)
+RETURN_LEG_MIN_TURNAROUND_MINUTES = config('RETURN_LEG_MIN_TURNAROUND_MINUTES', default=60, cast=int)
+# Seconds a day of a route's price calendar stays cached without a change (see organization.price_calendar)
+PRICE_CALENDAR_TIMEOUT = config('PRICE_CALENDAR_TIMEOUT', default=600, cast=int)
+
+# Fraud scoring (api.fraud): events scoring at least the threshold are flagged for review,
+# at most once per cooldown (seconds) per user or IP
+FRAUD_SCORING_ENABLED = config('FRAUD_SCORING_ENABLED', default=True, cast=bool)
+FRAUD_FLAG_THRESHOLD = config('FRAUD_FLAG_THRESHOLD', default=1.0, cast=float)
+FRAUD_FLAG_COOLDOWN = config('FRAUD_FLAG_COOLDOWN', default=600, cast=int)
+FRAUD_MAX_TRACKED_KEYS = config('FRAUD_MAX_TRACKED_KEYS', default=100000, cast=int)
+# Proxies in front of the app that append to X-Forwarded-For (1 for the hosting platform's
+# router); the client address is taken that many entries from the right, 0 ignores the header
+FRAUD_TRUSTED_PROXY_HOPS = config('FRAUD_TRUSTED_PROXY_HOPS', default=1, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -149,6 +188,38 @@ SIMPLE_JWT = {
     "JTI_CLAIM": "jti",
 }
 
+# Traffic capture settings (see api.middleware and the replay_traffic command)
+TRAFFIC_CAPTURE_ENABLED = config('TRAFFIC_CAPTURE_ENABLED', default=False, cast=bool)
+TRAFFIC_CAPTURE_SAMPLE_RATE = config('TRAFFIC_CAPTURE_SAMPLE_RATE', default=0.01, cast=float)
+TRAFFIC_CAPTURE_DIR = config('TRAFFIC_CAPTURE_DIR', default=os.path.join(BASE_DIR, 'traffic'))
+TRAFFIC_CAPTURE_MAX_BYTES = config('TRAFFIC_CAPTURE_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+TRAFFIC_CAPTURE_BACKUP_COUNT = config('TRAFFIC_CAPTURE_BACKUP_COUNT', default=10, cast=int)
+TRAFFIC_CAPTURE_MAX_BODY_BYTES = 64 * 1024
+
+# Payment gateways (see passenger.gateways). Calls to a gateway share one pooled
+# HTTP session and give up after PAYMENT_HTTP_TIMEOUT seconds; a request waits at most
+# PAYMENT_INITIATE_WAIT seconds for one before answering with the payment still pending.
+# Status polls look a pending payment up at most once per PAYMENT_REFRESH_INTERVAL seconds.
+PAYMENT_HTTP_TIMEOUT = config('PAYMENT_HTTP_TIMEOUT', default=10.0, cast=float)
+PAYMENT_INITIATE_WAIT = config('PAYMENT_INITIATE_WAIT', default=2.0, cast=float)
+PAYMENT_HTTP_POOL_SIZE = config('PAYMENT_HTTP_POOL_SIZE', default=20, cast=int)
+PAYMENT_HTTP_WORKERS = config('PAYMENT_HTTP_WORKERS', default=8, cast=int)
+PAYMENT_REFRESH_INTERVAL = config('PAYMENT_REFRESH_INTERVAL', default=10, cast=int)
+PAYMENT_GATEWAYS = {
+    'mock': {
+        'BASE_URL': config('MOCK_GATEWAY_URL', default='http://127.0.0.1:8765'),
+        'SECRET_KEY': config('MOCK_GATEWAY_SECRET_KEY', default='mock-secret'),
+        'WEBHOOK_SECRET': config('MOCK_GATEWAY_WEBHOOK_SECRET', default='mock-webhook-secret'),
+    },
+    'khalti': {
+        'BASE_URL': config('KHALTI_BASE_URL', default='https://a.khalti.com/api/v2'),
+        'SECRET_KEY': config('KHALTI_SECRET_KEY', default=''),
+        'WEBHOOK_SECRET': config('KHALTI_WEBHOOK_SECRET', default=''),
+    },
+}
+PAYMENT_RETURN_URL = config('PAYMENT_RETURN_URL', default='http://localhost:3000/payment/complete/')
+PAYMENT_WEBHOOK_BASE_URL = config('PAYMENT_WEBHOOK_BASE_URL', default='http://127.0.0.1:8000')
+
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -1,11 +1,14 @@
 
 from django.urls import path, include
 from authentication.views import ProfileAPIView
-from .views import OrganizationDetailView, SetTripComplete
+from .views import OrganizationDetailView, SetTripComplete, TripManifestView, TicketKeyView, RevokedTicketsView
 urlpatterns = [ 
  path('profile/',ProfileAPIView.as_view(),name='driver-profile'),
  path('organization/',OrganizationDetailView.as_view(),name='driver-org'),
  path('trip/completed/',SetTripComplete.as_view(),name='trip-completed'),
+ path('trip/<str:trip_id>/manifest/',TripManifestView.as_view(),name='trip-manifest'),
+ path('ticket-key/',TicketKeyView.as_view(),name='ticket-key'),
+ path('revoked-tickets/',RevokedTicketsView.as_view(),name='revoked-tickets'),
 ]
 
 
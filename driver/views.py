@@ -11,6 +11,8 @@ from authentication.models import Driver,Organization
 from authentication.serializers import DriverSerializer,OrganizationSerializer
 from organization.serializers import TripSerializer
 from organization.models import Trip
+from booking.manifest import build_manifest, revoked_bookings, InvalidCursor
+from booking.models import TicketSigningKey
 # Create your views here.
 class OrganizationDetailView(APIView):
     """
@@ -51,8 +53,7 @@ class SetTripComplete(APIView):
             driver = get_object_or_404(Driver, user=request.user)
             trip = get_object_or_404(Trip, trip_id=trip_id, vehicle__driver=driver)
             with transaction.atomic():
-                trip.is_completed = True
-                trip.save()
+                trip.mark_completed()
                 
                 # Update the vehicle availability
                 # trip.vehicle.available_seat += trip.bookings.filter(is_confirmed=True).count()
@@ -65,8 +66,7 @@ class SetTripComplete(APIView):
             trip = get_object_or_404(Trip, trip_id=trip_id, vehicle__organization=organization)
             
             with transaction.atomic():
-                trip.is_completed = True
-                trip.save()
+                trip.mark_completed()
                 
                 # # Update the vehicle availability
                 # trip.vehicle.available_seat += trip.bookings.filter(is_confirmed=True).count()
@@ -75,4 +75,76 @@ class SetTripComplete(APIView):
                 return Response({"message": "Trip marked as complete."}, status=status.HTTP_200_OK)
         
         else:
-            return Response({"message": "You are not a driver or organization or authorized to view this."}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"message": "You are not a driver or organization or authorized to view this."}, status=status.HTTP_400_BAD_REQUEST)
+
+class TripManifestView(APIView):
+    """
+    Compact passenger manifest of a trip's current departure for its driver or
+    organization. Pass the cursor of the previous response as ?cursor= to get
+    only the bookings changed and the booking ids removed since then.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request, trip_id):
+        if request.user.is_driver:
+            trip = get_object_or_404(Trip, trip_id=trip_id, vehicle__driver__user=request.user)
+        elif request.user.is_organization:
+            trip = get_object_or_404(Trip, trip_id=trip_id, organization__user=request.user)
+        else:
+            return Response({"message": "You are not a driver or organization or authorized to view this."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            manifest = build_manifest(trip, request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({"cursor": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(manifest, status=status.HTTP_200_OK)
+
+
+def ticket_organization(user):
+    """The organization whose tickets a driver or organization user checks, or None."""
+    if user.is_driver:
+        return get_object_or_404(Driver, user=user).organization
+    if user.is_organization:
+        return get_object_or_404(Organization, user=user)
+    return None
+
+
+class TicketKeyView(APIView):
+    """
+    The public keys a driver's device verifies its organization's ticket QR
+    codes with (booking.ticket_signing), by key id, to keep for checking
+    boardings offline. Refetch on sync to pick up rotated keys.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        organization = ticket_organization(request.user)
+        if organization is None:
+            return Response({"message": "You are not a driver of an organization or authorized to view this."}, status=status.HTTP_400_BAD_REQUEST)
+        keys = [
+            {"key_id": key.key_id, "public_key": key.public_key, "active": key.retired_at is None}
+            for key in TicketSigningKey.verifying_keys(organization.pk)
+        ]
+        return Response({"organization_id": organization.pk, "algorithm": "Ed25519", "keys": keys}, status=status.HTTP_200_OK)
+
+
+class RevokedTicketsView(APIView):
+    """
+    Booking ids of the organization's cancelled tickets for current departures,
+    for offline ticket checks. Pass the previous response's cursor as ?cursor=
+    to get only the cancellations since then.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        organization = ticket_organization(request.user)
+        if organization is None:
+            return Response({"message": "You are not a driver of an organization or authorized to view this."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            revoked = revoked_bookings(organization, request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({"cursor": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(revoked, status=status.HTTP_200_OK)
@@ -6,6 +6,12 @@ admin.site.register(models.Review)
 admin.site.register(models.Vehicle)
 admin.site.register(models.Seat)
 admin.site.register(models.TripPrice)
+admin.site.register(models.ReviewSummary)
+admin.site.register(models.TripStop)
+admin.site.register(models.TripSchedule)
+admin.site.register(models.Departure)
+admin.site.register(models.PricingRule)
+admin.site.register(models.DemandForecast)
 
 
 class AdminTrip(admin.ModelAdmin):
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+
+
+LISTING_GENERATION_KEY = 'trips:generation'
+# Bumped when a completed trip's duration is recorded (see organization.routes)
+ROUTE_GENERATION_KEY = 'routes:generation'
+
+# How long one worker may hold the right to refresh a stale entry
+REFRESH_LOCK_TIMEOUT = 30
+
+# Backends that keep a separate cache, and so separate generation counters, in every process
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def generations_are_shared():
+    """True when every worker reads the same counters: a shared cache backend, or a single worker process."""
+    return settings.CACHES['default']['BACKEND'] not in PER_PROCESS_BACKENDS or settings.WEB_CONCURRENCY <= 1
+
+
+def _initial_generation():
+    """
+    Time based starting value, so a counter that was evicted from the cache
+    never restarts at a value that older cached entries were stored under.
+    """
+    return time.time_ns() // 1000
+
+
+def _trip_generation_key(trip_pk):
+    return f"trips:generation:trip:{trip_pk}"
+
+
+def _vehicle_generation_key(vehicle_pk):
+    return f"trips:generation:vehicle:{vehicle_pk}"
+
+
+def get_generations(*keys, timeout=None):
+    """
+    Return the current value of each generation counter, creating missing ones.
+
+    Counters don't expire unless given a timeout, so a cache entry keeps its key for as long as it
+    may be served, stale window included. A worker that never sees another
+    worker's bump (a per-process cache backend) still recomputes each entry
+    once it is past its freshness, so it serves changes late by at most
+    TRIP_CACHE_TIMEOUT plus the time one refresh takes.
+    """
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        initial = _initial_generation()
+        for key in missing:
+            cache.add(key, initial, timeout)
+        values.update(cache.get_many(missing))
+    return [values.get(key, 0) for key in keys]
+
+
+def bump_generation(key, timeout=None):
+    """Invalidate every cached entry built from the given generation counter."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_generation(), timeout)
+
+
+def invalidate_trip_listings():
+    bump_generation(LISTING_GENERATION_KEY)
+
+
+def invalidate_trip(trip_pk):
+    """Invalidate the listings and the cached detail of one trip."""
+    bump_generation(LISTING_GENERATION_KEY)
+    if trip_pk:
+        bump_generation(_trip_generation_key(trip_pk))
+
+
+def invalidate_vehicle(vehicle_pk):
+    """Invalidate the listings and anything built from the vehicle's seats."""
+    bump_generation(LISTING_GENERATION_KEY)
+    if vehicle_pk:
+        bump_generation(_vehicle_generation_key(vehicle_pk))
+
+
+def trip_listing_etag():
+    """Version tag of the trip listing; None unless all workers share the counters (generations_are_shared)."""
+    if not generations_are_shared():
+        return None
+    generation, = get_generations(LISTING_GENERATION_KEY)
+    return f'W/"trips-{generation}"'
+
+
+def trip_etag(trip):
+    """Version tag of a trip's detail payload (trip, price, bookings, vehicle and seats), or None."""
+    if not generations_are_shared():
+        return None
+    trip_generation, vehicle_generation = get_generations(
+        _trip_generation_key(trip.pk), _vehicle_generation_key(trip.vehicle_id)
+    )
+    return f'W/"trip-{trip.pk}-{trip_generation}-{vehicle_generation}"'
+
+
+def vehicle_etag(vehicle, trip_pk=None):
+    """Version tag of a vehicle's detail payload (vehicle, seats and its trip, if any), or None."""
+    if not generations_are_shared():
+        return None
+    keys = [_vehicle_generation_key(vehicle.pk)]
+    if trip_pk:
+        keys.append(_trip_generation_key(trip_pk))
+    generations = '-'.join(str(generation) for generation in get_generations(*keys))
+    return f'W/"vehicle-{vehicle.pk}-{generations}"'
+
+
+def not_modified(request, etag):
+    """
+    Return a 304 response when the request's If-None-Match matches etag,
+    otherwise None. Weak comparison, as used for GET requests.
+
+    A 304 vouches that nothing changed in any worker, so tags are only made
+    (and etag is only set) when the counters are shared between workers.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header or not etag:
+        return None
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    bare_etag = etag.removeprefix('W/')
+    if '*' in candidates or any(candidate.removeprefix('W/') == bare_etag for candidate in candidates):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    return None
+
+
+def _digest(filters):
+    """Stable digest of a filter mapping, independent of key order."""
+    normalized = {str(key): str(value) for key, value in (filters or {}).items() if value not in (None, '')}
+    payload = json.dumps(normalized, sort_keys=True)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def trip_listing_key(filters):
+    generation, = get_generations(LISTING_GENERATION_KEY)
+    return f"trips:list:{generation}:{_digest(filters)}"
+
+
+def trip_detail_key(trip):
+    trip_generation, vehicle_generation = get_generations(
+        _trip_generation_key(trip.pk), _vehicle_generation_key(trip.vehicle_id)
+    )
+    return f"trips:detail:{trip.pk}:{trip_generation}:{vehicle_generation}"
+
+
+class _Call:
+    """One in-flight computation that concurrent callers wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key, compute):
+    """
+    Run compute once per key at a time within this worker. Threads that ask
+    for the same key while it is running wait for, and share, its result.
+    """
+    with _inflight_lock:
+        call = _inflight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _inflight[key] = _Call()
+
+    if not is_leader:
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    try:
+        call.value = compute()
+        return call.value
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.event.set()
+
+
+def _store(key, compute, fresh_for):
+    value = compute()
+    # Entries outlive their freshness so they can be served stale during a refresh
+    cache.set(key, (time.time() + fresh_for, value), fresh_for + settings.TRIP_CACHE_STALE_TIMEOUT)
+    return value
+
+
+def cached(key, compute, timeout=None):
+    """
+    Return the value cached under key, computing and storing it on a miss.
+
+    Concurrent misses for the same key are coalesced into one computation.
+    Once an entry is past its freshness, one request refreshes it while the
+    others keep getting the stale value, so expiry doesn't stampede the database.
+
+    The key must be built (and its generation read) before compute runs, so
+    an invalidation during compute leaves the result under the old generation.
+    """
+    fresh_for = settings.TRIP_CACHE_TIMEOUT if timeout is None else timeout
+    entry = cache.get(key)
+    if entry is not None:
+        fresh_until, value = entry
+        if time.time() < fresh_until:
+            return value
+        lock_key = f"{key}:refresh"
+        if not cache.add(lock_key, True, REFRESH_LOCK_TIMEOUT):
+            return value
+        try:
+            return single_flight(key, lambda: _store(key, compute, fresh_for))
+        finally:
+            cache.delete(lock_key)
+
+    return single_flight(key, lambda: _store(key, compute, fresh_for))
+
+
+def get_or_set_trip_listing(filters, compute):
+    return cached(trip_listing_key(filters), compute)
+
+
+def get_or_set_trip_detail(trip, compute):
+    return cached(trip_detail_key(trip), compute)
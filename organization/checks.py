@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from .cache import generations_are_shared
+
+
+@register()
+def check_shared_trip_cache(app_configs, **kwargs):
+    """The trip cache's invalidation counters must be seen by every worker."""
+    if generations_are_shared():
+        return []
+    return [Warning(
+        f"CACHE_BACKEND {settings.CACHES['default']['BACKEND']} keeps a separate cache per process, "
+        f"but WEB_CONCURRENCY is {settings.WEB_CONCURRENCY}.",
+        hint="Trip changes reach other workers' caches up to TRIP_CACHE_TIMEOUT late, and ETags are off. "
+             "Use a shared backend such as DatabaseCache or FileBasedCache.",
+        id='organization.W001',
+    )]
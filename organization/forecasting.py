@@ -0,0 +1,148 @@
+"""
+Passenger demand forecasts per route and day.
+
+History is read with one grouped query (passengers per route per trip day)
+into a routes x days NumPy matrix, and every route is fitted at once:
+
+- weekday factors from the last 26 weeks, shrunk towards 1 on thin routes;
+- a level: the exponentially weighted mean of the last 8 weeks with the
+  weekday pattern taken out;
+- a yearly factor: how far the same weeks of earlier years (52 weeks back, so
+  weekdays line up) stood above or below the level of their own time, which
+  is what carries festival surges such as Dashain and Tihar into the forecast.
+
+The expected passengers of a day are level x weekday factor x yearly factor,
+with a 90% interval from the spread of recent days around the fitted level.
+Run by the forecast_demand command; the API only reads DemandForecast rows.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+from booking.models import Booking
+from .models import DemandForecast
+
+
+# 52 weeks, so a day a "year" back falls on the same weekday
+YEAR = 364
+WEEKDAY_WINDOW = 26 * 7
+LEVEL_WINDOW = 8 * 7
+LEVEL_HALF_LIFE = 14
+# Passengers a route needs before its own weekday and yearly pattern count fully
+WEEKDAY_PRIOR = 200
+YEARLY_PRIOR = 100
+YEARLY_SMOOTHING = 7
+# z for a two-sided 90% interval
+Z_90 = 1.645
+
+
+def load_history(first_day, last_day):
+    """[(origin, destination, day, passengers)] of bookings for trips from first_day to last_day."""
+    return list(
+        Booking.objects.filter(trip_datetime__gte=first_day, trip_datetime__lte=last_day).annotate(
+            # Bookings between stops count for the stretch they travel
+            origin=Coalesce(NullIf('from_stop', Value('')), 'trip__from_location'),
+            destination=Coalesce(NullIf('to_stop', Value('')), 'trip__to_location'),
+        ).values('origin', 'destination', 'trip_datetime').annotate(
+            passengers=Sum('num_passengers'),
+        ).values_list('origin', 'destination', 'trip_datetime', 'passengers').order_by()
+    )
+
+
+def daily_matrix(rows, first_day, days):
+    """(routes, counts): the routes seen and their passengers per day as a routes x days array."""
+    routes = sorted({(origin, destination) for origin, destination, _, _ in rows})
+    index = {route: position for position, route in enumerate(routes)}
+    counts = np.zeros((len(routes), days))
+    if rows:
+        route_index = np.fromiter((index[origin, destination] for origin, destination, _, _ in rows), dtype=np.intp, count=len(rows))
+        day_index = np.fromiter(((day - first_day).days for _, _, day, _ in rows), dtype=np.intp, count=len(rows))
+        passengers = np.fromiter((passengers for _, _, _, passengers in rows), dtype=float, count=len(rows))
+        np.add.at(counts, (route_index, day_index), passengers)
+    return routes, counts
+
+
+def _weekday_factors(counts, weekdays):
+    """routes x 7 multipliers averaging 1, from the last WEEKDAY_WINDOW days."""
+    window, window_weekdays = counts[:, -WEEKDAY_WINDOW:], weekdays[-WEEKDAY_WINDOW:]
+    mean = window.mean(axis=1, keepdims=True)
+    by_weekday = np.stack([window[:, window_weekdays == day].mean(axis=1) for day in range(7)], axis=1)
+    raw = np.divide(by_weekday, mean, out=np.ones_like(by_weekday), where=mean > 0)
+    total = window.sum(axis=1, keepdims=True)
+    factors = 1 + (raw - 1) * total / (total + WEEKDAY_PRIOR)
+    return factors / factors.mean(axis=1, keepdims=True)
+
+
+def _yearly_factors(counts, horizon):
+    """routes x horizon multipliers from the same weeks of earlier years, 1 without history."""
+    routes, days = counts.shape
+    # Centred moving average, so a festival moving a few days between years still lines up
+    padded = np.concatenate([np.zeros((routes, 1)), np.cumsum(counts, axis=1)], axis=1)
+    half = YEARLY_SMOOTHING // 2
+    weighted = np.zeros((routes, horizon))
+    weights = np.zeros((routes, 1))
+    ahead = np.arange(horizon)
+    for years in range(1, days // YEAR + 1):
+        centre = days + ahead - YEAR * years
+        if centre[0] - half < 0 or days - YEAR * years - LEVEL_WINDOW < 0:
+            break
+        end = np.minimum(centre + half + 1, days)
+        smoothed = (padded[:, end] - padded[:, centre - half]) / (end - centre + half)
+        # The level of that year at the point the forecast is made
+        baseline = counts[:, days - YEAR * years - LEVEL_WINDOW:days - YEAR * years].mean(axis=1, keepdims=True)
+        ratio = np.clip(np.divide(smoothed, baseline, out=np.ones_like(smoothed), where=baseline > 0), 0.2, 5)
+        volume = baseline * LEVEL_WINDOW
+        weighted += ratio * volume
+        weights = weights + volume
+    return (weighted + YEARLY_PRIOR) / (weights + YEARLY_PRIOR)
+
+
+def fit(counts, first_weekday, horizon):
+    """
+    Forecast the horizon days following the history in counts (routes x days,
+    the first day falling on first_weekday, Monday being 0).
+    Returns (expected, lower, upper), each routes x horizon.
+    """
+    routes, days = counts.shape
+    weekdays = (first_weekday + np.arange(days)) % 7
+    factors = _weekday_factors(counts, weekdays)
+
+    recent, recent_weekdays = counts[:, -LEVEL_WINDOW:], weekdays[-LEVEL_WINDOW:]
+    decay = 0.5 ** (np.arange(LEVEL_WINDOW)[::-1] / LEVEL_HALF_LIFE)
+    level = (recent / factors[:, recent_weekdays]) @ (decay / decay.sum())
+
+    ahead_weekdays = (first_weekday + days + np.arange(horizon)) % 7
+    expected = level[:, None] * factors[:, ahead_weekdays] * _yearly_factors(counts, horizon)
+
+    # Spread of recent days around the fitted level, plus Poisson noise of the forecast itself
+    residual_variance = ((recent - level[:, None] * factors[:, recent_weekdays]) ** 2).mean(axis=1, keepdims=True)
+    spread = Z_90 * np.sqrt(residual_variance + expected)
+    return expected, np.maximum(expected - spread, 0), expected + spread
+
+
+def forecast(today, history_days, horizon):
+    """Fit every route with bookings in the history window; returns (routes, first forecast day, expected, lower, upper)."""
+    first_day = today - timedelta(days=history_days)
+    routes, counts = daily_matrix(load_history(first_day, today - timedelta(days=1)), first_day, history_days)
+    expected, lower, upper = fit(counts, first_day.weekday(), horizon)
+    return routes, today, expected, lower, upper
+
+
+@transaction.atomic
+def save_forecasts(routes, first_day, expected, lower, upper):
+    """Replace the stored forecasts from first_day on; earlier ones stay to compare with what happened."""
+    DemandForecast.objects.filter(date__gte=first_day).delete()
+    rows = [
+        DemandForecast(
+            from_location=origin, to_location=destination, date=first_day + timedelta(days=ahead),
+            expected_passengers=round(float(expected[route, ahead]), 2),
+            lower=round(float(lower[route, ahead]), 2), upper=round(float(upper[route, ahead]), 2),
+        )
+        for route, (origin, destination) in enumerate(routes)
+        for ahead in range(expected.shape[1])
+    ]
+    DemandForecast.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
@@ -0,0 +1,176 @@
+"""
+Multi-leg journey planning over upcoming trips.
+
+The route network is held in memory as, per origin, the upcoming legs sorted by
+departure. It is rebuilt lazily when the trip listing generation changes (every
+trip, price, vehicle, seat and booking change bumps it, see organization.cache):
+one lean values_list query is diffed against the current graph, and only the
+origins whose legs changed are re-sorted. Graphs are immutable once built, so
+searches never lock.
+
+Searches are a best-first label-setting search over (location, arrival time,
+price, legs) with Pareto pruning and a bounded number of transfers, ordered by
+earliest arrival or lowest total price.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import cache as trip_cache
+
+
+# Shortest change between two legs at the same place
+MIN_CONNECTION = timedelta(minutes=30)
+# Journeys must finish within this long after the first possible departure
+MAX_JOURNEY = timedelta(hours=48)
+# Rebuild even without a generation change, in case the counter was evicted
+MAX_GRAPH_AGE = 300
+
+Leg = namedtuple('Leg', 'trip_pk trip_id origin destination departure arrival price seats')
+
+
+class RouteGraph:
+    """Immutable snapshot of upcoming legs, indexed by origin and departure time."""
+
+    def __init__(self, legs, generation, previous=None):
+        self.generation = generation
+        self.built_at = time.monotonic()
+        self.legs = {leg.trip_pk: leg for leg in legs}
+
+        old_legs = previous.legs if previous else {}
+        # Origins that gained, lost or changed a leg; the rest are reused as is
+        dirty_origins = {leg.origin for pk, leg in self.legs.items() if old_legs.get(pk) != leg}
+        dirty_origins.update(leg.origin for pk, leg in old_legs.items() if self.legs.get(pk) != leg)
+
+        by_origin = {}
+        for leg in self.legs.values():
+            if leg.origin in dirty_origins:
+                by_origin.setdefault(leg.origin, []).append(leg)
+
+        # Unchanged origins keep their sorted lists from the previous graph
+        self.departures = {} if previous is None else {
+            origin: entry for origin, entry in previous.departures.items() if origin not in dirty_origins
+        }
+        for origin, origin_legs in by_origin.items():
+            origin_legs.sort(key=lambda leg: leg.departure)
+            self.departures[origin] = ([leg.departure for leg in origin_legs], origin_legs)
+        self.changed_origins = dirty_origins
+
+    def legs_from(self, origin, earliest, latest):
+        """Legs leaving origin between earliest and latest, in departure order."""
+        entry = self.departures.get(origin)
+        if not entry:
+            return
+        times, legs = entry
+        for index in range(bisect_left(times, earliest), len(legs)):
+            if legs[index].departure > latest:
+                return
+            yield legs[index]
+
+    def search(self, origin, destination, earliest, passengers=1, max_transfers=2, optimize='arrival', limit=5):
+        """
+        Up to limit journeys from origin to destination leaving no earlier than
+        earliest, each a list of legs with enough free seats for passengers.
+        optimize is 'arrival' (earliest arrival, then price) or 'price'.
+        """
+        latest = earliest + MAX_JOURNEY
+        if optimize == 'price':
+            def key(arrival, price):
+                return (price, arrival)
+        else:
+            def key(arrival, price):
+                return (arrival, price)
+
+        counter = 0
+        queue = [(key(earliest, 0), counter, origin, earliest, 0, ())]
+        # Per location, the (arrival, price, legs) labels already settled
+        settled = {}
+        journeys = []
+        while queue and len(journeys) < limit:
+            _, _, location, arrival, price, path = heapq.heappop(queue)
+
+            labels = settled.setdefault(location, [])
+            if any(a <= arrival and p <= price and n <= len(path) for a, p, n in labels):
+                continue
+            labels.append((arrival, price, len(path)))
+
+            if location == destination:
+                journeys.append(list(path))
+                continue
+            if len(path) > max_transfers:
+                continue
+
+            visited = {origin, *(leg.destination for leg in path)}
+            ready = arrival + MIN_CONNECTION if path else arrival
+            for leg in self.legs_from(location, ready, latest):
+                if leg.seats < passengers or leg.destination in visited or leg.arrival > latest:
+                    continue
+                counter += 1
+                leg_price = price + leg.price * passengers
+                heapq.heappush(queue, (key(leg.arrival, leg_price), counter, leg.destination, leg.arrival, leg_price, path + (leg,)))
+        return journeys
+
+
+def load_legs():
+    Trip = _trip_model()
+    rows = Trip.objects.filter(
+        is_completed=False, start_datetime__gte=timezone.now(), price__isnull=False,
+    ).values_list(
+        'pk', 'trip_id', 'from_location', 'to_location', 'start_datetime', 'end_datetime',
+        'price__price', 'vehicle__available_seat',
+    )
+    return [Leg(*row) for row in rows]
+
+
+def _trip_model():
+    from django.apps import apps
+    return apps.get_model('organization', 'Trip')
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """The current route graph, rebuilding it (incrementally) if trips changed since it was built."""
+    global _graph
+    generation, = trip_cache.get_generations(trip_cache.LISTING_GENERATION_KEY)
+    graph = _graph
+    if graph is not None and graph.generation == generation and time.monotonic() - graph.built_at < MAX_GRAPH_AGE:
+        return graph
+    with _graph_lock:
+        graph = _graph
+        if graph is None or graph.generation != generation or time.monotonic() - graph.built_at >= MAX_GRAPH_AGE:
+            graph = _graph = RouteGraph(load_legs(), generation, previous=graph)
+    return graph
+
+
+def describe(journey, passengers=1):
+    """JSON friendly form of a journey."""
+    first, last = journey[0], journey[-1]
+    return {
+        'from_location': first.origin,
+        'to_location': last.destination,
+        'departure': first.departure.isoformat(),
+        'arrival': last.arrival.isoformat(),
+        'duration_minutes': int((last.arrival - first.departure).total_seconds() // 60),
+        'transfers': len(journey) - 1,
+        'total_price': str(sum(leg.price for leg in journey) * passengers),
+        'legs': [
+            {
+                'trip_id': leg.trip_id,
+                'from_location': leg.origin,
+                'to_location': leg.destination,
+                'departure': leg.departure.isoformat(),
+                'arrival': leg.arrival.isoformat(),
+                'price': str(leg.price),
+                'available_seats': leg.seats,
+            }
+            for leg in journey
+        ],
+    }
@@ -1,22 +1,105 @@
-trip_choices = [
-    ('kathmandu', 'Kathmandu'),
-    ('pokhara', 'Pokhara'),
-    ('chitwan', 'Chitwan'),
-    ('lumbini', 'Lumbini'),
-    ('janakpur', 'Janakpur'),
-    ('biratnagar', 'Biratnagar'),
-    ('birgunj', 'Birgunj'),
-    ('dharan', 'Dharan'),
-    ('butwal', 'Butwal'),
-    ('hetauda', 'Hetauda'),
-    ('nepalgunj', 'Nepalgunj'),
-    ('dhangadhi', 'Dhangadhi'),
-    ('bharatpur', 'Bharatpur'),
-    ('itahari', 'Itahari'),
-    ('gaur', 'Gaur'),
-    ('tansen', 'Tansen'),
-    ('jomsom', 'Jomsom'),
-    ('namche_bazaar', 'Namche Bazaar'),
-    ('manang', 'Manang'),
-    ('lukla', 'Lukla'),
+"""
+Registry of trip locations.
+
+Each location has the slug stored in Trip.from_location/to_location, an English
+label, its Nepali spelling and common alternative spellings. The registry is
+compiled once at import into an exact-match table and a prefix trie, so
+resolving search input or autocompleting a prefix never touches the database.
+"""
+import re
+import unicodedata
+
+
+# (slug, label, Nepali spelling, aliases)
+LOCATIONS = [
+    ('kathmandu', 'Kathmandu', 'काठमाडौं', ['ktm', 'kantipur', 'kathmandau']),
+    ('pokhara', 'Pokhara', 'पोखरा', ['pkr']),
+    ('chitwan', 'Chitwan', 'चितवन', ['chitawan']),
+    ('lumbini', 'Lumbini', 'लुम्बिनी', []),
+    ('janakpur', 'Janakpur', 'जनकपुर', ['janakpurdham', 'janakpur dham']),
+    ('biratnagar', 'Biratnagar', 'विराटनगर', []),
+    ('birgunj', 'Birgunj', 'वीरगंज', ['birganj']),
+    ('dharan', 'Dharan', 'धरान', []),
+    ('butwal', 'Butwal', 'बुटवल', []),
+    ('hetauda', 'Hetauda', 'हेटौंडा', ['hetaunda']),
+    ('nepalgunj', 'Nepalgunj', 'नेपालगञ्ज', ['nepalganj']),
+    ('dhangadhi', 'Dhangadhi', 'धनगढी', ['dhangadi']),
+    ('bharatpur', 'Bharatpur', 'भरतपुर', []),
+    ('itahari', 'Itahari', 'इटहरी', []),
+    ('gaur', 'Gaur', 'गौर', []),
+    ('tansen', 'Tansen', 'तानसेन', []),
+    ('jomsom', 'Jomsom', 'जोमसोम', ['jomosom']),
+    ('namche_bazaar', 'Namche Bazaar', 'नाम्चे बजार', ['namche', 'namche bazar']),
+    ('manang', 'Manang', 'मनाङ', []),
+    ('lukla', 'Lukla', 'लुक्ला', []),
+    ('jaleswor', 'Jaleswor', 'जलेश्वर', ['jaleshwar', 'jaleswar']),
+    ('mathayani', 'Mathayani', '', []),
+    ('sindhuli', 'Sindhuli', 'सिन्धुली', ['sindhulimadhi', 'sindhuli madhi']),
 ]
+
+trip_choices = [(slug, label) for slug, label, _, _ in LOCATIONS]
+
+
+def normalize(text):
+    """Case and separator insensitive form of a location name."""
+    text = unicodedata.normalize('NFC', str(text)).casefold()
+    return re.sub(r'[\s_\-]+', ' ', text).strip()
+
+
+class LocationRegistry:
+    """Exact lookup and prefix autocomplete over location names, Nepali names and aliases."""
+
+    def __init__(self, locations):
+        self.labels = {}
+        self.nepali = {}
+        self.exact = {}
+        self.trie = {}
+        for slug, label, nepali, aliases in locations:
+            self.labels[slug] = label
+            self.nepali[slug] = nepali
+            for name in [slug, label, nepali, *aliases]:
+                key = normalize(name)
+                if not key:
+                    continue
+                self.exact.setdefault(key, slug)
+                # Every word start is searchable, so "bazaar" finds Namche Bazaar
+                words = key.split(' ')
+                for index in range(len(words)):
+                    self._insert(' '.join(words[index:]), slug)
+
+    def _insert(self, key, slug):
+        node = self.trie
+        for char in key:
+            node = node.setdefault(char, {})
+            # Slugs reachable below this node; locations are inserted in registry order
+            matches = node.setdefault('', [])
+            if slug not in matches:
+                matches.append(slug)
+
+    def resolve(self, text):
+        """The slug that text names exactly (slug, label, Nepali name or alias), else None."""
+        return self.exact.get(normalize(text))
+
+    def complete(self, prefix, limit=None):
+        """Slugs with a name, alias or word starting with prefix, in registry order."""
+        node = self.trie
+        for char in normalize(prefix):
+            node = node.get(char)
+            if node is None:
+                return []
+        matches = node.get('', [])
+        return matches[:limit] if limit else list(matches)
+
+    def match(self, text):
+        """
+        Slugs that search input refers to: the exact match if there is one,
+        otherwise every location it is a prefix of.
+        """
+        slug = self.resolve(text)
+        return [slug] if slug else self.complete(text)
+
+    def describe(self, slug):
+        return {'value': slug, 'label': self.labels[slug], 'nepali': self.nepali[slug]}
+
+
+registry = LocationRegistry(LOCATIONS)
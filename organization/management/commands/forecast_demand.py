@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from organization import forecasting
+
+
+class Command(BaseCommand):
+    help = ("Forecast passengers per route for the coming days from booking history, "
+            "replacing the stored forecasts from today on.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history-days', type=int, default=3 * 365, help="Days of booking history to fit on.")
+        parser.add_argument('--horizon', type=int, default=30, help="How many days ahead, today included, to forecast.")
+
+    def handle(self, *args, **options):
+        if options['history_days'] < forecasting.LEVEL_WINDOW:
+            raise CommandError(f"--history-days must be at least {forecasting.LEVEL_WINDOW}")
+        # The yearly factor of a day comes from the same day a year back, which must be history
+        if not 1 <= options['horizon'] <= forecasting.YEAR:
+            raise CommandError(f"--horizon must be between 1 and {forecasting.YEAR}")
+        started = time.monotonic()
+        routes, first_day, expected, lower, upper = forecasting.forecast(
+            timezone.localdate(), options['history_days'], options['horizon'],
+        )
+        written = forecasting.save_forecasts(routes, first_day, expected, lower, upper)
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast {len(routes)} routes for {options['horizon']} days ({written} rows) "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,118 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from organization import planning, price_calendar, routes
+from organization.locations import registry
+from organization.models import Departure, Vehicle
+
+
+class Command(BaseCommand):
+    help = ("Import departures from a CSV file with the columns registration_number, from_location, "
+            "to_location, departure, arrival (optional, defaults to the route duration) and price. "
+            "Every row is validated in one pass, overlaps with what the vehicle or driver already "
+            "does included, before anything is created.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Departures per insert.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate the file without creating anything.")
+        parser.add_argument('--skip-conflicts', action='store_true',
+                            help="Import the rows that fit and report the rest, instead of importing nothing.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+                rows = list(csv.DictReader(csv_file))
+        except OSError as error:
+            raise CommandError(f"Can't read {options['path']}: {error}")
+
+        vehicles = {
+            vehicle.registration_number: vehicle
+            for vehicle in Vehicle.objects.filter(
+                registration_number__in={row.get('registration_number', '').strip() for row in rows}
+            ).only('id', 'registration_number', 'organization_id', 'driver_id')
+        }
+
+        departures, row_numbers, errors = [], {}, []
+        # Row 1 is the header
+        for line, row in enumerate(rows, start=2):
+            try:
+                departure = self.build_departure(row, vehicles)
+            except ValueError as error:
+                errors.append(f"Row {line}: {error}")
+                continue
+            row_numbers[id(departure)] = line
+            departures.append(departure)
+        for error in errors:
+            self.stderr.write(error)
+        if errors:
+            raise CommandError(f"{len(errors)} of {len(rows)} rows are invalid, nothing imported")
+
+        fitting, conflicts = planning.check_assignments(departures)
+        for departure, clashes in conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"Row {row_numbers[id(departure)]}: {departure} is busy with {planning.describe_clashes(clashes)}"
+            ))
+        skipped = len(departures) - len(fitting) - len(conflicts)
+        if conflicts and not options['skip_conflicts']:
+            raise CommandError(f"{len(conflicts)} rows would double-book a vehicle or driver, nothing imported")
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Would import {len(fitting)} departures ({skipped} already exist, {len(conflicts)} conflicting)"
+            ))
+            return
+        with transaction.atomic():
+            Departure.objects.bulk_create(fitting, batch_size=options['batch_size'])
+        price_calendar.invalidate_departures(fitting)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(fitting)} departures ({skipped} already exist, {len(conflicts)} conflicting)"
+        ))
+
+    def build_departure(self, row, vehicles):
+        vehicle = vehicles.get((row.get('registration_number') or '').strip())
+        if vehicle is None:
+            raise ValueError(f"unknown vehicle {row.get('registration_number')!r}")
+        from_location = registry.resolve(row.get('from_location') or '')
+        to_location = registry.resolve(row.get('to_location') or '')
+        if not from_location or not to_location:
+            raise ValueError(f"unknown location {row.get('from_location')!r} or {row.get('to_location')!r}")
+        if from_location == to_location:
+            raise ValueError("from_location and to_location are the same")
+
+        departure_datetime = self.parse_datetime(row.get('departure'))
+        if not departure_datetime:
+            raise ValueError(f"invalid departure {row.get('departure')!r}")
+        if row.get('arrival'):
+            arrival_datetime = self.parse_datetime(row['arrival'])
+            if not arrival_datetime or arrival_datetime <= departure_datetime:
+                raise ValueError(f"invalid arrival {row['arrival']!r}")
+        else:
+            arrival_datetime = departure_datetime + routes.duration(from_location, to_location)
+        try:
+            price = Decimal(row.get('price') or 0)
+        except InvalidOperation:
+            raise ValueError(f"invalid price {row.get('price')!r}")
+        if price < 0:
+            raise ValueError("price can't be negative")
+
+        return Departure(
+            organization_id=vehicle.organization_id, vehicle_id=vehicle.id, driver_id=vehicle.driver_id,
+            from_location=from_location, to_location=to_location,
+            departure_datetime=departure_datetime, arrival_datetime=arrival_datetime, price=price,
+        )
+
+    @staticmethod
+    def parse_datetime(value):
+        try:
+            parsed = parse_datetime((value or '').strip())
+        except ValueError:
+            return None
+        if parsed is not None and timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
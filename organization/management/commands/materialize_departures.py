@@ -0,0 +1,76 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from organization import planning, price_calendar
+from organization.models import Departure, Trip, TripSchedule
+
+
+class Command(BaseCommand):
+    help = ("Create the departures of active trip schedules for the coming days. "
+            "Safe to rerun: departures that already exist are left as they are.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRIP_SCHEDULE_HORIZON_DAYS,
+                            help="How many days ahead, today included, to materialize.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Schedules expanded per insert.")
+        parser.add_argument('--show-conflicts', type=int, default=20, help="How many skipped departures to list.")
+        parser.add_argument('--roll', action='store_true',
+                            help="Also move completed trips of scheduled vehicles onto their next departure.")
+
+    def handle(self, *args, **options):
+        first_day = timezone.localdate()
+        last_day = first_day + timedelta(days=options['days'] - 1)
+        window = Departure.objects.filter(
+            departure_datetime__gte=timezone.make_aware(datetime.combine(first_day, time.min)),
+            departure_datetime__lt=timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min)),
+        )
+        existing = window.count()
+
+        schedules = TripSchedule.objects.filter(is_active=True, starts_on__lte=last_day).filter(
+            Q(ends_on__isnull=True) | Q(ends_on__gte=first_day)
+        ).select_related('vehicle').order_by('pk')
+        # Everything vehicles and drivers already do in the window (plus a day for late arrivals), loaded once
+        start, end = planning.day_bounds(first_day, last_day + timedelta(days=1))
+        index = planning.busy_index(start, end)
+        expanded = 0
+        conflicts = []
+        last_pk = 0
+        while True:
+            chunk = list(schedules.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not chunk:
+                break
+            departures, clashing = planning.check_assignments(
+                [departure for schedule in chunk for departure in schedule.departures_between(first_day, last_day)], index
+            )
+            conflicts.extend(clashing)
+            # The (vehicle, departure time) constraint also skips departures made by concurrent runs
+            with transaction.atomic():
+                Departure.objects.bulk_create(departures, ignore_conflicts=True, batch_size=options['chunk_size'])
+            price_calendar.invalidate_departures(departures)
+            expanded += len(chunk)
+            last_pk = chunk[-1].pk
+
+        created = window.count() - existing
+        self.stdout.write(self.style.SUCCESS(
+            f"Expanded {expanded} schedules from {first_day} to {last_day}: {created} departures created, {existing} already there"
+        ))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(f"Skipped {len(conflicts)} departures that would double-book a vehicle or driver:"))
+            for departure, clashes in conflicts[:options['show_conflicts']]:
+                self.stdout.write(f"  {departure}: busy with {planning.describe_clashes(clashes)}")
+
+        if options['roll']:
+            rolled = 0
+            trips = Trip.objects.filter(
+                is_completed=True, vehicle__departures__trip__isnull=True,
+                vehicle__departures__departure_datetime__gt=timezone.now(),
+            ).distinct().select_related('vehicle')
+            for trip in trips:
+                if trip.advance_to_next_departure(updated_by='materialize_departures'):
+                    rolled += 1
+            self.stdout.write(self.style.SUCCESS(f"Moved {rolled} completed trips onto their next departure"))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from organization import planning
+
+
+class Command(BaseCommand):
+    help = ("Plan the fleet for the coming days in one pass: materialize scheduled departures, "
+            "then add return legs for vehicles whose trip is marked is_reverese_trip, "
+            "skipping any leg that would double-book its vehicle or driver.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="How many days ahead, today included, to plan.")
+        parser.add_argument('--dry-run', action='store_true', help="Report the return legs for existing departures without creating anything.")
+
+    def handle(self, *args, **options):
+        first_day = timezone.localdate()
+        last_day = first_day + timedelta(days=options['days'] - 1)
+
+        if not options['dry_run']:
+            call_command('materialize_departures', days=options['days'], stdout=self.stdout)
+            start, end = planning.day_bounds(first_day, last_day)
+            recorded = planning.record_trip_runs(start, end)
+            self.stdout.write(f"Recorded {recorded} unscheduled trips as departures")
+
+        legs, conflicts = planning.plan_return_legs(first_day, last_day, dry_run=options['dry_run'])
+        verb = "Would create" if options['dry_run'] else "Created"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(legs)} return legs from {first_day} to {last_day}"))
+        for departure, clashes in conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"  No return leg for {departure}: busy with {planning.describe_clashes(clashes)}"
+            ))
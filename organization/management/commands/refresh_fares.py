@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from organization.models import TripPrice
+
+
+class Command(BaseCommand):
+    help = ("Recompile the fare tables of open trips and offer each the fare of its current load and "
+            "days ahead. Run daily, so advance purchase bands move on as departures come closer.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help="Trips repriced per bulk update.")
+
+    def handle(self, *args, **options):
+        open_prices = TripPrice.objects.filter(trip__is_completed=False).order_by('pk')
+        refreshed = 0
+        last_pk = 0
+        while True:
+            chunk = list(open_prices.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['chunk_size']])
+            if not chunk:
+                break
+            refreshed += TripPrice.recompile(TripPrice.objects.filter(pk__in=chunk))
+            last_pk = chunk[-1]
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the fares of {refreshed} open trips"))
@@ -0,0 +1,75 @@
+# Generated by Django 5.1 on 2026-10-19 08:10
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def build_review_summaries(apps, schema_editor):
+    """Materialize summaries for reviews that existed before the summary table."""
+    Review = apps.get_model('organization', 'Review')
+    ReviewSummary = apps.get_model('organization', 'ReviewSummary')
+
+    summaries = {}
+    for review in Review.objects.only('rating', 'reviewee_content_type_id', 'reviewee_object_id').iterator():
+        key = (review.reviewee_content_type_id, review.reviewee_object_id)
+        summary = summaries.setdefault(key, ReviewSummary(
+            reviewee_content_type_id=key[0], reviewee_object_id=key[1], adjusted_sum=Decimal(0),
+        ))
+        summary.review_count += 1
+        summary.rating_sum += review.rating
+        setattr(summary, f'star_{review.rating}', getattr(summary, f'star_{review.rating}') + 1)
+        # Existing reviews have no trip, so they count with full weight
+        summary.adjusted_sum += Decimal(review.rating)
+    ReviewSummary.objects.bulk_create(summaries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('organization', '0009_alter_trip_from_location_alter_trip_to_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reviewee_object_id', models.PositiveIntegerField()),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('star_1', models.PositiveIntegerField(default=0)),
+                ('star_2', models.PositiveIntegerField(default=0)),
+                ('star_3', models.PositiveIntegerField(default=0)),
+                ('star_4', models.PositiveIntegerField(default=0)),
+                ('star_5', models.PositiveIntegerField(default=0)),
+                ('adjusted_sum', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='trip',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reviews', to='organization.trip'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='trip_passenger_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewee_content_type', 'reviewee_object_id'], name='review_reviewee_idx'),
+        ),
+        migrations.AddField(
+            model_name='reviewsummary',
+            name='reviewee_content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_summaries', to='contenttypes.contenttype'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewsummary',
+            constraint=models.UniqueConstraint(fields=('reviewee_content_type', 'reviewee_object_id'), name='unique_review_summary_reviewee'),
+        ),
+        migrations.RunPython(build_review_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-19 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('organization', '0010_review_summary'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_reviewee_idx',
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewee_content_type', 'reviewee_object_id', '-id'], name='review_reviewee_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewer_content_type', 'reviewer_object_id', '-id'], name='review_reviewer_id_idx'),
+        ),
+    ]
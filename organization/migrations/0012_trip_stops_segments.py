@@ -0,0 +1,49 @@
+# Generated by Django 5.1 on 2026-10-19 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def occupy_booked_seats(apps, schema_editor):
+    """Seats occupied before segment inventory are taken along the whole route."""
+    Seat = apps.get_model('organization', 'Seat')
+    Seat.objects.filter(is_occupied=True).update(occupied_segments=(1 << 63) - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0011_review_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seat',
+            name='occupied_segments',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='from_location',
+            field=models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='to_location',
+            field=models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], db_index=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='TripStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveSmallIntegerField()),
+                ('location', models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='organization.trip')),
+            ],
+            options={
+                'ordering': ['sequence'],
+                'constraints': [models.UniqueConstraint(fields=('trip', 'sequence'), name='unique_trip_stop_sequence')],
+            },
+        ),
+        migrations.RunPython(occupy_booked_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1 on 2026-10-19 08:30
+
+import datetime
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_alter_driver_profile_image_and_more'),
+        ('organization', '0012_trip_stops_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_location', models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100)),
+                ('to_location', models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100)),
+                ('days_of_week', models.PositiveSmallIntegerField(default=127, help_text='Bitmask of weekdays, Monday is bit 0')),
+                ('departure_time', models.TimeField()),
+                ('duration', models.DurationField(default=datetime.timedelta(seconds=25200))),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('starts_on', models.DateField(default=django.utils.timezone.localdate)),
+                ('ends_on', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(db_index=True, default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trip_schedules', to='authentication.organization')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='organization.vehicle')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Departure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_location', models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100)),
+                ('to_location', models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100)),
+                ('departure_datetime', models.DateTimeField()),
+                ('arrival_datetime', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('is_completed', models.BooleanField(default=False)),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('passenger_count', models.PositiveIntegerField(default=0)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='departures', to='authentication.organization')),
+                ('trip', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departures', to='organization.trip')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='departures', to='organization.vehicle')),
+                ('schedule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departures', to='organization.tripschedule')),
+            ],
+            options={
+                'ordering': ['departure_datetime'],
+                'indexes': [models.Index(fields=['from_location', 'to_location', 'departure_datetime'], name='departure_route_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'departure_datetime'), name='unique_vehicle_departure')],
+            },
+        ),
+    ]
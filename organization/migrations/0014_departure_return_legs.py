@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-19 08:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0013_trip_schedules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='departure',
+            name='is_return',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='departure',
+            name='return_of',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='return_leg', to='organization.departure'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-19 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0014_departure_return_legs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tripschedule',
+            name='duration',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RouteDuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_location', models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100)),
+                ('to_location', models.CharField(choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100)),
+                ('trip_count', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('from_location', 'to_location'), name='unique_route_duration')],
+            },
+        ),
+    ]
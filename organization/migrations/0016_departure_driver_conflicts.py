@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-19 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_exclusion_constraints(apps, schema_editor):
+    """
+    On PostgreSQL, refuse overlapping departures of the same vehicle or driver
+    in the database too. Other backends rely on organization.planning.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    schema_editor.execute(
+        "ALTER TABLE organization_departure ADD CONSTRAINT departure_vehicle_no_overlap "
+        "EXCLUDE USING gist (vehicle_id WITH =, tstzrange(departure_datetime, arrival_datetime) WITH &&)"
+    )
+    schema_editor.execute(
+        "ALTER TABLE organization_departure ADD CONSTRAINT departure_driver_no_overlap "
+        "EXCLUDE USING gist (driver_id WITH =, tstzrange(departure_datetime, arrival_datetime) WITH &&) "
+        "WHERE (driver_id IS NOT NULL)"
+    )
+
+
+def drop_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("ALTER TABLE organization_departure DROP CONSTRAINT IF EXISTS departure_vehicle_no_overlap")
+    schema_editor.execute("ALTER TABLE organization_departure DROP CONSTRAINT IF EXISTS departure_driver_no_overlap")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_alter_driver_profile_image_and_more'),
+        ('organization', '0015_route_durations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='departure',
+            name='driver',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='departures', to='authentication.driver'),
+        ),
+        migrations.RunPython(add_exclusion_constraints, drop_exclusion_constraints),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-19 08:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_base_prices(apps, schema_editor):
+    """Existing prices become the base fares; fare tables are compiled on first quote."""
+    TripPrice = apps.get_model('organization', 'TripPrice')
+    TripPrice.objects.filter(base_price__isnull=True).update(base_price=models.F('price'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_alter_driver_profile_image_and_more'),
+        ('organization', '0016_departure_driver_conflicts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tripprice',
+            name='base_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='tripprice',
+            name='fares',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('load_factor', 'Load factor'), ('advance_purchase', 'Advance purchase'), ('weekday', 'Day of week'), ('festival', 'Festival')], max_length=20)),
+                ('from_location', models.CharField(blank=True, choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100, null=True)),
+                ('to_location', models.CharField(blank=True, choices=[('kathmandu', 'Kathmandu'), ('pokhara', 'Pokhara'), ('chitwan', 'Chitwan'), ('lumbini', 'Lumbini'), ('janakpur', 'Janakpur'), ('biratnagar', 'Biratnagar'), ('birgunj', 'Birgunj'), ('dharan', 'Dharan'), ('butwal', 'Butwal'), ('hetauda', 'Hetauda'), ('nepalgunj', 'Nepalgunj'), ('dhangadhi', 'Dhangadhi'), ('bharatpur', 'Bharatpur'), ('itahari', 'Itahari'), ('gaur', 'Gaur'), ('tansen', 'Tansen'), ('jomsom', 'Jomsom'), ('namche_bazaar', 'Namche Bazaar'), ('manang', 'Manang'), ('lukla', 'Lukla'), ('jaleswor', 'Jaleswor'), ('mathayani', 'Mathayani'), ('sindhuli', 'Sindhuli')], max_length=100, null=True)),
+                ('percent', models.DecimalField(decimal_places=2, help_text='Surcharge in percent, negative for a discount', max_digits=6)),
+                ('min_value', models.PositiveIntegerField(blank=True, null=True)),
+                ('max_value', models.PositiveIntegerField(blank=True, null=True)),
+                ('days_of_week', models.PositiveSmallIntegerField(default=0)),
+                ('starts_on', models.DateField(blank=True, null=True)),
+                ('ends_on', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to='authentication.organization')),
+            ],
+        ),
+        migrations.RunPython(set_base_prices, migrations.RunPython.noop),
+    ]
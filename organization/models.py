@@ -1,12 +1,21 @@
-from django.db import models
+from django.db import models, transaction
 from authentication.models import Organization, Driver
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from rest_framework import serializers
 from django.utils import timezone
-from django.db.models import Sum
-from datetime import timedelta
+from django.conf import settings
+from django.db.models import Sum, F
+from datetime import datetime, timedelta
+from decimal import Decimal
 from cloudinary.models import CloudinaryField
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from . import cache as trip_cache
+from . import routes
+from . import price_calendar
+from . import pricing
+from .locations import trip_choices
 # Review Model
 class Review(models.Model):
     RATING_CHOICES = [
@@ -28,11 +37,117 @@ class Review(models.Model):
     reviewee_object_id = models.PositiveIntegerField()
     reviewee = GenericForeignKey('reviewee_content_type', 'reviewee_object_id')
 
+    # Trip the review is about, and how many passengers it carried when the review was written
+    trip = models.ForeignKey('Trip', on_delete=models.SET_NULL, blank=True, null=True, related_name='reviews')
+    trip_passenger_count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # The trailing id lets a reviewee's (or reviewer's) page be read in keyset order straight from the index
+        indexes = [
+            models.Index(fields=['reviewee_content_type', 'reviewee_object_id', '-id'], name='review_reviewee_id_idx'),
+            models.Index(fields=['reviewer_content_type', 'reviewer_object_id', '-id'], name='review_reviewer_id_idx'),
+        ]
+
     def __str__(self):
         reviewer_name = getattr(self.reviewer, 'username', 'unknown')
         reviewee_name = getattr(self.reviewee, 'username', 'unknown')
         return f"Review by {reviewer_name} for {reviewee_name} - {self.rating} Stars"
 
+    SUMMARY_FIELDS = ('reviewee_content_type_id', 'reviewee_object_id', 'rating', 'trip_passenger_count')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # What the reviewee's summary holds for this review, to take out again when it is edited
+        self._summarized = self._summary_values()
+
+    def _summary_values(self):
+        return tuple(self.__dict__.get(field) for field in self.SUMMARY_FIELDS)
+
+    def summarized_review(self):
+        """Unsaved copy of the review as its reviewee's summary last counted it."""
+        return Review(**{
+            field: getattr(self, field) if loaded is None else loaded
+            for field, loaded in zip(self.SUMMARY_FIELDS, self._summarized)
+        })
+
+    def adjusted_contribution(self):
+        """
+        Trip-weighted value of this review. A single passenger's review of a trip
+        that carried N passengers only speaks for 1/N of them; the other passengers
+        are counted as neutral, so one review can't swing the overall rating alone.
+        """
+        passengers = max(self.trip_passenger_count, 1)
+        value = Decimal(self.rating) / passengers + ReviewSummary.NEUTRAL_RATING * (passengers - 1) / passengers
+        return value.quantize(Decimal('0.0001'))
+
+
+# ReviewSummary Model
+class ReviewSummary(models.Model):
+    """
+    Rating aggregates per reviewee, updated incrementally when reviews are created,
+    edited or deleted, so a rating never requires scanning the reviews.
+    """
+    NEUTRAL_RATING = Decimal(3)
+
+    reviewee_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='review_summaries')
+    reviewee_object_id = models.PositiveIntegerField()
+    reviewee = GenericForeignKey('reviewee_content_type', 'reviewee_object_id')
+
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    star_1 = models.PositiveIntegerField(default=0)
+    star_2 = models.PositiveIntegerField(default=0)
+    star_3 = models.PositiveIntegerField(default=0)
+    star_4 = models.PositiveIntegerField(default=0)
+    star_5 = models.PositiveIntegerField(default=0)
+    adjusted_sum = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reviewee_content_type', 'reviewee_object_id'], name='unique_review_summary_reviewee'),
+        ]
+
+    def __str__(self):
+        return f"Rating summary for {self.reviewee_content_type.model} {self.reviewee_object_id} - {self.average_rating}"
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 2)
+
+    @property
+    def adjusted_rating(self):
+        if not self.review_count:
+            return None
+        return round(float(self.adjusted_sum) / self.review_count, 2)
+
+    def histogram(self):
+        return {star: getattr(self, f'star_{star}') for star in range(1, 6)}
+
+    def as_dict(self):
+        return {
+            'count': self.review_count,
+            'average': self.average_rating,
+            'adjusted': self.adjusted_rating,
+            'histogram': self.histogram(),
+        }
+
+    @classmethod
+    def apply_review(cls, review, sign=1):
+        """Add (sign=1) or remove (sign=-1) a review from its reviewee's summary."""
+        summary, _ = cls.objects.get_or_create(
+            reviewee_content_type_id=review.reviewee_content_type_id,
+            reviewee_object_id=review.reviewee_object_id,
+        )
+        # F() expressions keep concurrent reviews from overwriting each other
+        cls.objects.filter(pk=summary.pk).update(**{
+            'review_count': F('review_count') + sign,
+            'rating_sum': F('rating_sum') + sign * review.rating,
+            f'star_{review.rating}': F(f'star_{review.rating}') + sign,
+            'adjusted_sum': F('adjusted_sum') + sign * review.adjusted_contribution(),
+        })
+
 # Vehicle Model
 class Vehicle(models.Model):
     VEHICLE_TYPE_CHOICES = (
@@ -63,9 +178,56 @@ class Vehicle(models.Model):
         """
         Resets all seats in this vehicle to unoccupied status and updates the available seat count.
         """
-        self.seats.update(is_occupied=False)
+        self.seats.update(is_occupied=False, occupied_segments=0)
         self.available_seat = self.seating_capacity
         self.save()
+        self.reprice_trip()
+
+    def claim_seats(self, seat_ids, mask):
+        """
+        Occupy the route segments in mask on each of the given seats, all or none;
+        call inside a transaction. Every seat is claimed by an UPDATE that only
+        matches while none of those segments is taken, so overlapping bookings
+        of the same seat can't both succeed.
+        """
+        # An empty mask would match free seats as free again and book them twice
+        if not mask:
+            raise serializers.ValidationError({"stops": "A booking must travel at least one segment of the route."})
+        seats = self.seats.filter(pk__in=seat_ids, reserved_for_driver=False)
+        # Seats already booked on other segments take the new ones alongside
+        shared = seats.filter(occupied_segments__gt=0).alias(
+            clash=F('occupied_segments').bitand(mask)
+        ).filter(clash=0).update(occupied_segments=F('occupied_segments').bitor(mask))
+        # Free seats stop counting towards available_seat
+        fresh = seats.filter(occupied_segments=0).update(occupied_segments=mask, is_occupied=True)
+        if shared + fresh != len(set(seat_ids)):
+            raise serializers.ValidationError({"seats": "One or more seats are already occupied on this part of the route or invalid."})
+        if fresh:
+            Vehicle.objects.filter(pk=self.pk).update(available_seat=F('available_seat') - fresh)
+            self.refresh_from_db(fields=['available_seat'])
+            self.reprice_trip()
+        trip_cache.invalidate_vehicle(self.pk)
+
+    def release_seats(self, seat_ids, mask):
+        """Free the route segments in mask on each of the given seats; the reverse of claim_seats."""
+        self.seats.filter(pk__in=seat_ids).alias(
+            held=F('occupied_segments').bitand(mask)
+        ).filter(held=mask).update(occupied_segments=F('occupied_segments').bitxor(mask))
+        freed = self.seats.filter(
+            pk__in=seat_ids, occupied_segments=0, is_occupied=True, reserved_for_driver=False
+        ).update(is_occupied=False)
+        if freed:
+            Vehicle.objects.filter(pk=self.pk).update(available_seat=F('available_seat') + freed)
+            self.refresh_from_db(fields=['available_seat'])
+            self.reprice_trip()
+        trip_cache.invalidate_vehicle(self.pk)
+
+    def reprice_trip(self):
+        """Let the fare on offer follow the load now that seats were taken or freed."""
+        trip_price = TripPrice.objects.filter(trip__vehicle=self).select_related('trip').first()
+        if trip_price:
+            trip_price.trip.vehicle = self
+            trip_price.reprice()
 
     def save(self, *args, **kwargs):
         """Ensure available seats are properly set before saving."""
@@ -82,14 +244,20 @@ class Seat(models.Model):
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='seats')
     seat_number = models.CharField(max_length=5)
     is_occupied = models.BooleanField(default=False)
+    # Bit i is set while the seat is booked from stop i to stop i + 1 of the trip (see Trip.segment_mask)
+    occupied_segments = models.PositiveBigIntegerField(default=0)
     reserved_for_driver = models.BooleanField(default=False)
     reserved_for_conductor = models.BooleanField(default=False)
 
+    # Every segment of any trip, for seats taken outright
+    ALL_SEGMENTS = (1 << 63) - 1
+
     def save(self, *args, **kwargs):
         """Set seat as occupied and reserved for the driver if it's the first seat in the vehicle."""
         if not self.pk and not self.vehicle.seats.exists():
             self.is_occupied = True
             self.reserved_for_driver = True
+            self.occupied_segments = self.ALL_SEGMENTS
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -104,30 +272,15 @@ class Seat(models.Model):
         return False
 
 
-trip_choices = [
-    ('kathmandu', 'Kathmandu'),
-    ('pokhara', 'Pokhara'),
-    ('chitwan', 'Chitwan'),
-    ('lumbini', 'Lumbini'),
-    ('janakpur', 'Janakpur'),
-    ('biratnagar', 'Biratnagar'),
-    ('birgunj', 'Birgunj'),
-    ('dharan', 'Dharan'),
-    ('butwal', 'Butwal'),
-    ('hetauda', 'Hetauda'),
-    ('nepalgunj', 'Nepalgunj'),
-    ('dhangadhi', 'Dhangadhi'),
-    ('bharatpur', 'Bharatpur'),
-    ('itahari', 'Itahari'),
-    ('gaur', 'Gaur'),
-    ('tansen', 'Tansen'),
-    ('jomsom', 'Jomsom'),
-    ('namche_bazaar', 'Namche Bazaar'),
-    ('manang', 'Manang'),
-    ('lukla', 'Lukla'),
-    ('jaleswor', 'Jaleswor'),
-    ('mathayani', 'Mathayani'),
-]
+class TripQuerySet(models.QuerySet):
+    def with_related(self):
+        """Everything TripSerializer reads (vehicle, seats, price and rating summaries) in a fixed number of queries."""
+        return self.select_related(
+            'organization', 'vehicle__organization__user', 'vehicle__driver__user', 'price'
+        ).prefetch_related(
+            'vehicle__seats', 'vehicle__driver__rating_summaries', 'organization__rating_summaries',
+        )
+
 
 # Trip Model
 class Trip(models.Model):
@@ -146,25 +299,54 @@ class Trip(models.Model):
     passenger_count = models.PositiveIntegerField(default=0)
     last_updated_by = models.CharField(max_length=255, blank=True, null=True)
 
+    objects = TripQuerySet.as_manager()
+
+    ROUTE_FIELDS = ('from_location', 'to_location', 'distance', 'duration')
+    CALENDAR_FIELDS = ('from_location', 'to_location', 'start_datetime')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The route as last loaded or saved, to tell when distance and duration belong to another route
+        self._loaded_route = self._route_values()
+        # The price calendar day the trip was on, which a move to another day or route leaves
+        self._loaded_calendar_entry = self._calendar_entry()
+
+    def _route_values(self):
+        # Read from __dict__ so deferred fields aren't loaded
+        return tuple(self.__dict__.get(field) for field in self.ROUTE_FIELDS)
+
+    def _calendar_entry(self):
+        return tuple(self.__dict__.get(field) for field in self.CALENDAR_FIELDS)
+
     def save(self, *args, **kwargs):
         """Generate trip ID, calculate duration, and reset vehicle seats if trip is completed."""
         if not self.trip_id:
             self.trip_id = self.generate_trip_id()
 
+        loaded_from, loaded_to, loaded_distance, loaded_duration = self._loaded_route
+        if self.pk and loaded_from is not None and (self.from_location, self.to_location) != (loaded_from, loaded_to):
+            # A new route gets its own distance and duration, unless they were set along with it
+            if self.distance == loaded_distance:
+                self.distance = None
+            if self.duration == loaded_duration:
+                self.duration = None
+
+        if not self.distance:
+            self.distance = routes.distance_km(self.from_location, self.to_location)
+
         if not self.duration and self.distance:
             self.duration = self.calculate_duration_based_on_distance()
 
-        # Ensure end_datetime is set to 7 hours after start_datetime
-        if self.start_datetime and not self.end_datetime:
-            self.end_datetime = self.start_datetime + timedelta(hours=7)
-
+        # The trip ends when the route's usual travel time is up
         if self.start_datetime:
-            self.end_datetime = self.start_datetime + timedelta(hours=7)
+            self.end_datetime = self.start_datetime + (self.duration or routes.duration(self.from_location, self.to_location))
         
         # if self.is_completed:
         #     self.vehicle.reset_all_seats()
 
         super().save(*args, **kwargs)
+        self._loaded_route = self._route_values()
+        self._loaded_calendar_entry = self._calendar_entry()
 
     def generate_trip_id(self):
         """Generate a unique trip ID based on locations and timestamp."""
@@ -173,29 +355,552 @@ class Trip(models.Model):
         return f"{prefix}{timestamp}".upper()
 
     def calculate_duration_based_on_distance(self):
-        """Estimate trip duration based on distance, assuming an average speed of 60 km/h."""
-        return timezone.timedelta(hours=self.distance / 60)
+        """Estimate trip duration based on distance, at the usual speed on this route."""
+        return routes.matrix().duration_for_distance(self.from_location, self.to_location, self.distance)
 
-    def calculate_earnings(self):
-        """Calculate total earnings and passenger count from confirmed bookings."""
-        confirmed_paid_bookings = self.booking_set.filter(is_confirmed=True, is_paid=True)
-        confirmed_bookings = self.booking_set.filter(is_confirmed=True)
-        self.total_earnings = confirmed_paid_bookings.aggregate(Sum('price'))['price__sum'] or 0
-        self.passenger_count = confirmed_bookings.aggregate(Sum('num_passengers'))['num_passengers__sum'] or 0
+    def mark_completed(self):
+        """Mark the trip complete and record how long it actually took for the route matrix."""
+        was_completed = self.is_completed
+        self.is_completed = True
         self.save()
+        if not was_completed:
+            RouteDuration.record(self.from_location, self.to_location, timezone.now() - self.start_datetime)
+
+    def stop_locations(self):
+        """Ordered locations the trip stops at, origin and destination included."""
+        return [stop.location for stop in self.stops.all()] or [self.from_location, self.to_location]
+
+    def segment_mask(self, from_location=None, to_location=None):
+        """
+        Bitmask of the segments travelled between two stops, the whole route by
+        default. Bit i stands for the segment from stop i to stop i + 1.
+        """
+        locations = self.stop_locations()
+        try:
+            start = locations.index(from_location) if from_location else 0
+            end = locations.index(to_location, start + 1) if to_location else len(locations) - 1
+        except ValueError:
+            raise serializers.ValidationError({"stops": f"Trip {self.trip_id} doesn't stop at {from_location or self.from_location} and then {to_location or self.to_location}."})
+        # Boarding at the last stop travels no segment at all
+        if end <= start:
+            raise serializers.ValidationError({"stops": f"Trip {self.trip_id} goes nowhere after {from_location}."})
+        return ((1 << (end - start)) - 1) << start
+
+    def seat_availability(self):
+        """
+        Free seat numbers for every pair of stops, as {(from, to): [seat numbers]}.
+        Reads each seat's occupied segments once and answers every pair with
+        bitwise ands.
+        """
+        locations = self.stop_locations()
+        seats = list(self.vehicle.seats.filter(reserved_for_driver=False).values_list('seat_number', 'occupied_segments'))
+        availability = {}
+        for start in range(len(locations) - 1):
+            for end in range(start + 1, len(locations)):
+                mask = ((1 << (end - start)) - 1) << start
+                availability[locations[start], locations[end]] = [number for number, occupied in seats if not occupied & mask]
+        return availability
+
+    def set_stops(self, locations):
+        """Replace the ordered stops; they must run from the trip's origin to its destination."""
+        if len(locations) < 2 or locations[0] != self.from_location or locations[-1] != self.to_location:
+            raise serializers.ValidationError({"stops": "Stops must start at the trip's origin and end at its destination."})
+        if len(locations) > MAX_TRIP_STOPS:
+            raise serializers.ValidationError({"stops": f"A trip can have at most {MAX_TRIP_STOPS} stops."})
+        if len(set(locations)) != len(locations):
+            raise serializers.ValidationError({"stops": "A trip can stop at each location only once."})
+        # Bookings hold segments by position, so stops can't move under them
+        if self.vehicle.seats.filter(occupied_segments__gt=0, reserved_for_driver=False).exists():
+            raise serializers.ValidationError({"stops": "Stops can't be changed while seats are booked."})
+        self.stops.all().delete()
+        TripStop.objects.bulk_create(
+            TripStop(trip=self, sequence=sequence, location=location) for sequence, location in enumerate(locations)
+        )
+        trip_cache.invalidate_trip(self.pk)
+
+    @transaction.atomic
+    def advance_to_next_departure(self, updated_by=None):
+        """
+        Record this trip's earnings on the departure it ran, then move the trip
+        onto the vehicle's next scheduled departure (route, times and fare) with
+        its seats reset. Returns that departure, or None when the vehicle has
+        none scheduled, in which case the trip is left as it is.
+        """
+        upcoming = Departure.objects.filter(
+            vehicle_id=self.vehicle_id, trip__isnull=True, is_completed=False,
+            departure_datetime__gt=max(self.start_datetime, timezone.now()),
+        ).order_by('departure_datetime').first()
+        if upcoming is None:
+            return None
+
+        self.calculate_earnings()
+        self.departures.filter(is_completed=False).update(
+            is_completed=True, total_earnings=self.total_earnings, passenger_count=self.passenger_count,
+        )
+
+        if (self.from_location, self.to_location) != (upcoming.from_location, upcoming.to_location):
+            self.stops.all().delete()
+        self.vehicle.reset_all_seats()
+        self.from_location, self.to_location = upcoming.from_location, upcoming.to_location
+        self.start_datetime, self.end_datetime = upcoming.departure_datetime, upcoming.arrival_datetime
+        self.duration, self.distance = upcoming.duration, None
+        self.is_completed = False
+        self.total_earnings = 0
+        self.passenger_count = 0
+        self.last_updated_by = updated_by
+        self.save()
+        # A full save, so the fare table is compiled for the new date and route and the fare re-quoted
+        trip_price = TripPrice.objects.filter(trip=self).first() or TripPrice()
+        trip_price.trip = self
+        trip_price.base_price = trip_price.price = upcoming.price
+        trip_price.save()
+
+        upcoming.trip = self
+        upcoming.save(update_fields=['trip'])
+        return upcoming
+
+    def calculate_earnings(self):
+        """
+        Calculate total earnings and passenger count from the confirmed bookings
+        of the trip's current run. A trip moved onto its next departure keeps
+        its earlier bookings, dated by the run they were made for.
+        """
+        run_bookings = self.booking_set.filter(trip_datetime=self.start_datetime.date())
+        confirmed_paid_bookings = run_bookings.filter(is_confirmed=True, is_paid=True)
+        confirmed_bookings = run_bookings.filter(is_confirmed=True)
+        total_earnings = confirmed_paid_bookings.aggregate(Sum('price'))['price__sum'] or 0
+        passenger_count = confirmed_bookings.aggregate(Sum('num_passengers'))['num_passengers__sum'] or 0
+
+        # Only write when something changed, so reads don't invalidate the trip cache
+        if total_earnings != self.total_earnings or passenger_count != self.passenger_count:
+            self.total_earnings = total_earnings
+            self.passenger_count = passenger_count
+            self.save()
         return self.total_earnings, self.passenger_count
 
     def __str__(self) -> str:
         return self.trip_id
 
+# RouteDuration Model
+class RouteDuration(models.Model):
+    """Running total of how long completed trips on a route actually took."""
+    from_location = models.CharField(max_length=100, choices=trip_choices)
+    to_location = models.CharField(max_length=100, choices=trip_choices)
+    trip_count = models.PositiveIntegerField(default=0)
+    total_seconds = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['from_location', 'to_location'], name='unique_route_duration'),
+        ]
+
+    @classmethod
+    def record(cls, from_location, to_location, duration):
+        """
+        Add one trip's duration. Durations far from the route's current estimate
+        (trips marked complete late, or early by mistake) are ignored.
+        """
+        expected = routes.duration(from_location, to_location)
+        if not expected / 3 <= duration <= expected * 3:
+            return False
+        cls.objects.get_or_create(from_location=from_location, to_location=to_location)
+        cls.objects.filter(from_location=from_location, to_location=to_location).update(
+            trip_count=F('trip_count') + 1, total_seconds=F('total_seconds') + int(duration.total_seconds()),
+        )
+        trip_cache.bump_generation(trip_cache.ROUTE_GENERATION_KEY)
+        return True
+
+    def __str__(self):
+        return f"{self.from_location} to {self.to_location}: {self.trip_count} trips"
+
+
+# One occupied-segment bit per stop-to-stop segment fits a 64 bit integer
+MAX_TRIP_STOPS = 64
+
+
+# TripStop Model
+class TripStop(models.Model):
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='stops')
+    sequence = models.PositiveSmallIntegerField()
+    location = models.CharField(max_length=100, choices=trip_choices)
+
+    class Meta:
+        ordering = ['sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'sequence'], name='unique_trip_stop_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.trip.trip_id} stop {self.sequence}: {self.location}"
+
+
+# DemandForecast Model
+class DemandForecast(models.Model):
+    """Expected passengers on a route on a day, written by the forecast_demand command (organization.forecasting)."""
+    from_location = models.CharField(max_length=100, choices=trip_choices)
+    to_location = models.CharField(max_length=100, choices=trip_choices)
+    date = models.DateField()
+    expected_passengers = models.FloatField()
+    # 90% interval
+    lower = models.FloatField()
+    upper = models.FloatField()
+    generated_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['from_location', 'to_location', 'date'], name='unique_route_forecast'),
+        ]
+
+    def __str__(self):
+        return f"{self.from_location} to {self.to_location} on {self.date}: {self.expected_passengers}"
+
+
 # TripPrice Model
 class TripPrice(models.Model):
     trip = models.OneToOneField(Trip, on_delete=models.CASCADE, related_name='price')
+    # The fare on offer right now, after the organization's pricing rules
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # The fare the organization set; blank takes price as it was first saved
+    base_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    # Fare table compiled from base_price and the pricing rules (organization.pricing)
+    fares = models.JSONField(default=dict, blank=True, editable=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The fare on offer as last loaded or saved, to tell an edited price from a quoted one
+        self._offered_price = self.price
+
+    def save(self, *args, **kwargs):
+        """
+        Compile the fare table and put the current fare on offer, unless only
+        some fields are saved. A price edited since it was loaded (API, admin)
+        is the organization setting a new fare, so it becomes the base price.
+        """
+        full_save = kwargs.get('update_fields') is None
+        # Partial saves (reprice) store a quoted fare, never a new base
+        if self.base_price is None or (full_save and self.pk and self.price != self._offered_price):
+            self.base_price = self.price
+        if full_save:
+            self.compile_fares()
+            self.price = self.quote()
+        super().save(*args, **kwargs)
+        self._offered_price = self.price
+
+    def compile_fares(self, rules=None):
+        """Rebuild the fare table; rules are the organization's active rules, fetched when not given."""
+        trip = self.trip
+        if rules is None:
+            rules = PricingRule.objects.filter(organization_id=trip.organization_id, is_active=True)
+        self.fares = pricing.compile_fares(
+            self.base_price, [rule for rule in rules if rule.matches_route(trip.from_location, trip.to_location)],
+            timezone.localdate(trip.start_datetime), trip.vehicle.seating_capacity,
+        )
+
+    def quote(self, booked=None):
+        """
+        Fare per seat for booking now with booked seats taken (the vehicle's
+        current load by default): a lookup in the compiled table.
+        """
+        trip = self.trip
+        trip_date = timezone.localdate(trip.start_datetime)
+        # Trips moved to another day since the table was compiled get it rebuilt once
+        if self.fares.get('date') != trip_date.isoformat():
+            self.compile_fares()
+            if self.pk:
+                TripPrice.objects.filter(pk=self.pk).update(fares=self.fares)
+        if booked is None:
+            booked = trip.vehicle.seating_capacity - trip.vehicle.available_seat
+        return pricing.quote(self.fares, (trip_date - timezone.localdate()).days, booked)
+
+    def reprice(self):
+        """Offer the fare of the trip's current load and days ahead, if it has moved into another band."""
+        fare = self.quote()
+        if fare != self.price:
+            self.price = fare
+            self.save(update_fields=['price'])
+
+    @classmethod
+    def recompile(cls, trip_prices):
+        """
+        Rebuild the fare tables of many trips with one query for the rules and
+        one bulk update, e.g. after an organization changed its rules.
+        Returns how many trips were updated.
+        """
+        trip_prices = list(trip_prices.select_related('trip__vehicle'))
+        organization_ids = {trip_price.trip.organization_id for trip_price in trip_prices}
+        rules = {}
+        for rule in PricingRule.objects.filter(organization_id__in=organization_ids, is_active=True):
+            rules.setdefault(rule.organization_id, []).append(rule)
+        for trip_price in trip_prices:
+            trip_price.compile_fares(rules.get(trip_price.trip.organization_id, []))
+            trip_price.price = trip_price.quote()
+        cls.objects.bulk_update(trip_prices, ['fares', 'price'], batch_size=500)
+        # bulk_update sends no signals
+        for trip_price in trip_prices:
+            trip_cache.invalidate_trip(trip_price.trip_id)
+        price_calendar.invalidate(
+            (trip_price.trip.from_location, trip_price.trip.to_location, trip_price.trip.start_datetime)
+            for trip_price in trip_prices
+        )
+        return len(trip_prices)
 
     def __str__(self):
         return f"Trip from {self.trip.from_location} to {self.trip.to_location} - Price: {self.price}"
 
 
+# PricingRule Model
+class PricingRule(models.Model):
+    """
+    A surcharge or discount an organization applies to the fares of matching
+    trips. Rules are compiled into each trip's fare table (organization.pricing).
+    """
+    LOAD_FACTOR = 'load_factor'
+    ADVANCE_PURCHASE = 'advance_purchase'
+    WEEKDAY = 'weekday'
+    FESTIVAL = 'festival'
+    KIND_CHOICES = [
+        (LOAD_FACTOR, 'Load factor'),
+        (ADVANCE_PURCHASE, 'Advance purchase'),
+        (WEEKDAY, 'Day of week'),
+        (FESTIVAL, 'Festival'),
+    ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='pricing_rules')
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Blank matches every origin or destination
+    from_location = models.CharField(max_length=100, choices=trip_choices, blank=True, null=True)
+    to_location = models.CharField(max_length=100, choices=trip_choices, blank=True, null=True)
+    percent = models.DecimalField(max_digits=6, decimal_places=2, help_text="Surcharge in percent, negative for a discount")
+    # Load factor rules: booked share of the seats in percent; advance purchase rules:
+    # days before the departure date. The rule applies from min_value up to, not including, max_value
+    min_value = models.PositiveIntegerField(blank=True, null=True)
+    max_value = models.PositiveIntegerField(blank=True, null=True)
+    # Day of week rules, same bitmask as TripSchedule.days_of_week
+    days_of_week = models.PositiveSmallIntegerField(default=0)
+    # Festival rules, both days included
+    starts_on = models.DateField(blank=True, null=True)
+    ends_on = models.DateField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def matches_route(self, from_location, to_location):
+        return self.from_location in (None, '', from_location) and self.to_location in (None, '', to_location)
+
+    def applies_on(self, day):
+        """Whether a day of week or festival rule covers trips leaving on day."""
+        if self.kind == self.WEEKDAY:
+            return bool(self.days_of_week >> day.weekday() & 1)
+        if self.kind == self.FESTIVAL:
+            return (self.starts_on is None or self.starts_on <= day) and (self.ends_on is None or day <= self.ends_on)
+        return True
+
+    def __str__(self):
+        return f"{self.name} ({self.get_kind_display()}, {self.percent}%) - {self.organization}"
+
+
+
+    
+
+
+# TripSchedule Model
+class TripSchedule(models.Model):
+    """A recurring departure: route, vehicle, days of the week, departure time and fare."""
+    WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='trip_schedules')
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='schedules')
+    from_location = models.CharField(max_length=100, choices=trip_choices)
+    to_location = models.CharField(max_length=100, choices=trip_choices)
+    days_of_week = models.PositiveSmallIntegerField(default=0b1111111, help_text="Bitmask of weekdays, Monday is bit 0")
+    departure_time = models.TimeField()
+    # Blank means the route's usual travel time (organization.routes)
+    duration = models.DurationField(blank=True, null=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    starts_on = models.DateField(default=timezone.localdate)
+    ends_on = models.DateField(blank=True, null=True)
+    is_active = models.BooleanField(default=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def runs_on(self, day):
+        """Whether the schedule has a departure on the given date."""
+        if day < self.starts_on or (self.ends_on and day > self.ends_on):
+            return False
+        return bool(self.days_of_week >> day.weekday() & 1)
+
+    def departures_between(self, first_day, last_day):
+        """Unsaved departures still ahead on every day from first_day to last_day (inclusive) the schedule runs on."""
+        day = max(first_day, self.starts_on)
+        last_day = min(last_day, self.ends_on) if self.ends_on else last_day
+        now = timezone.now()
+        duration = self.duration or routes.duration(self.from_location, self.to_location)
+        departures = []
+        while day <= last_day:
+            start = timezone.make_aware(datetime.combine(day, self.departure_time))
+            if self.runs_on(day) and start > now:
+                departures.append(Departure(
+                    schedule=self, organization_id=self.organization_id, vehicle_id=self.vehicle_id,
+                    driver_id=self.vehicle.driver_id,
+                    from_location=self.from_location, to_location=self.to_location,
+                    departure_datetime=start, arrival_datetime=start + duration, price=self.price,
+                ))
+            day += timedelta(days=1)
+        return departures
+
+    def materialize(self, days=None):
+        """
+        Create this schedule's missing departures for the coming days; safe to
+        repeat. Raises ValidationError, creating nothing, if any of them would
+        overlap something the vehicle or its driver is already doing.
+        """
+        from .planning import check_assignments, describe_clashes
+
+        first_day = timezone.localdate()
+        last_day = first_day + timedelta(days=(days or settings.TRIP_SCHEDULE_HORIZON_DAYS) - 1)
+        departures, conflicts = check_assignments(self.departures_between(first_day, last_day))
+        if conflicts:
+            departure, clashes = conflicts[0]
+            raise serializers.ValidationError({"schedule": (
+                f"{len(conflicts)} departures clash with the vehicle's or driver's other trips, the first at "
+                f"{timezone.localtime(departure.departure_datetime):%Y-%m-%d %H:%M} with {describe_clashes(clashes)}."
+            )})
+        Departure.objects.bulk_create(departures, ignore_conflicts=True)
+        price_calendar.invalidate_departures(departures)
+
+    def clear_upcoming(self):
+        """Drop departures that haven't run or been taken by a trip yet; past ones stay as history."""
+        self.departures.filter(trip__isnull=True, is_completed=False, departure_datetime__gt=timezone.now()).delete()
+
+    def __str__(self):
+        days = ','.join(name for bit, name in enumerate(self.WEEKDAYS) if self.days_of_week >> bit & 1)
+        return f"{self.from_location} to {self.to_location} at {self.departure_time:%H:%M} ({days}) - {self.vehicle.registration_number}"
+
+
+# Departure Model
+class Departure(models.Model):
+    """
+    One dated run of a schedule. Departures are created ahead by the
+    materialize_departures command and keep the earnings and passenger count of
+    the run once the trip that served it is reset, so history isn't overwritten.
+    """
+    schedule = models.ForeignKey(TripSchedule, on_delete=models.SET_NULL, blank=True, null=True, related_name='departures')
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='departures')
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='departures')
+    # The vehicle's driver when the departure was planned
+    driver = models.ForeignKey(Driver, on_delete=models.SET_NULL, blank=True, null=True, related_name='departures')
+    from_location = models.CharField(max_length=100, choices=trip_choices)
+    to_location = models.CharField(max_length=100, choices=trip_choices)
+    departure_datetime = models.DateTimeField()
+    arrival_datetime = models.DateTimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # The trip row that ran (or is running) this departure
+    trip = models.ForeignKey(Trip, on_delete=models.SET_NULL, blank=True, null=True, related_name='departures')
+    is_completed = models.BooleanField(default=False)
+    total_earnings = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    passenger_count = models.PositiveIntegerField(default=0)
+    # Return legs run the outbound route backwards (see organization.planning)
+    is_return = models.BooleanField(default=False)
+    return_of = models.OneToOneField('self', on_delete=models.CASCADE, blank=True, null=True, related_name='return_leg')
+
+    class Meta:
+        ordering = ['departure_datetime']
+        constraints = [
+            # A vehicle leaves once at a time; also what makes materializing idempotent
+            models.UniqueConstraint(fields=['vehicle', 'departure_datetime'], name='unique_vehicle_departure'),
+        ]
+        indexes = [
+            models.Index(fields=['from_location', 'to_location', 'departure_datetime'], name='departure_route_idx'),
+        ]
+
+    @property
+    def duration(self):
+        return self.arrival_datetime - self.departure_datetime
+
+    def build_return_leg(self, turnaround):
+        """Unsaved departure back to the origin, leaving turnaround after this one arrives."""
+        leaves = self.arrival_datetime + turnaround
+        return Departure(
+            schedule_id=self.schedule_id, organization_id=self.organization_id, vehicle_id=self.vehicle_id,
+            driver_id=self.driver_id, from_location=self.to_location, to_location=self.from_location,
+            departure_datetime=leaves, arrival_datetime=leaves + self.duration, price=self.price,
+            is_return=True, return_of=self,
+        )
+
+    def __str__(self):
+        return f"{self.from_location} to {self.to_location} at {self.departure_datetime} - {self.vehicle_id}"
+
+
+# Cache invalidation: any change to what trip listings and trip details show
+# bumps the generation counters in organization.cache, those of the price
+# calendar days it touches included
+@receiver([post_save, post_delete], sender=Trip)
+def invalidate_trip_cache(sender, instance, **kwargs):
+    trip_cache.invalidate_trip(instance.pk)
+    # Runs before Trip.save refreshes the loaded entry, so both the old day and the new one are dropped
+    price_calendar.invalidate([instance._loaded_calendar_entry, instance._calendar_entry()])
+
+
+@receiver([post_save, post_delete], sender=TripPrice)
+def invalidate_trip_price_cache(sender, instance, **kwargs):
+    trip_cache.invalidate_trip(instance.trip_id)
+    price_calendar.invalidate_trips(pk=instance.trip_id)
+
+
+@receiver([post_save, post_delete], sender=Vehicle)
+def invalidate_vehicle_cache(sender, instance, **kwargs):
+    trip_cache.invalidate_vehicle(instance.pk)
+    price_calendar.invalidate_trips(vehicle_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Seat)
+def invalidate_seat_cache(sender, instance, **kwargs):
+    trip_cache.invalidate_vehicle(instance.vehicle_id)
+    price_calendar.invalidate_trips(vehicle_id=instance.vehicle_id)
+
+
+@receiver([post_save, post_delete], sender=PricingRule)
+def recompile_organization_fares(sender, instance, **kwargs):
+    """Rule changes reach the fare tables of the organization's open trips."""
+    TripPrice.recompile(TripPrice.objects.filter(trip__organization_id=instance.organization_id, trip__is_completed=False))
+
+
+@receiver([post_save, post_delete], sender=Departure)
+def invalidate_departure_calendar(sender, instance, **kwargs):
+    price_calendar.invalidate_departures([instance])
+
+
+def invalidate_reviewee_trips(content_type_id, object_id):
+    """Trip listings and the details of the reviewee's trips show driver and organization ratings."""
+    trip_cache.invalidate_trip_listings()
+    reviewee_model = ContentType.objects.get_for_id(content_type_id).model_class()
+    if reviewee_model is Driver:
+        trips = Trip.objects.filter(vehicle__driver_id=object_id)
+    elif reviewee_model is Organization:
+        trips = Trip.objects.filter(organization_id=object_id)
+    else:
+        return
+    for trip_pk in trips.values_list('pk', flat=True):
+        trip_cache.invalidate_trip(trip_pk)
+
+
+@receiver(post_save, sender=Review)
+def add_review_to_summary(sender, instance, created, **kwargs):
+    if created:
+        ReviewSummary.apply_review(instance, sign=1)
+    elif instance._summary_values() != instance._summarized:
+        # Edited: take out what was counted, then count it as it is now
+        previous = instance.summarized_review()
+        ReviewSummary.apply_review(previous, sign=-1)
+        ReviewSummary.apply_review(instance, sign=1)
+        invalidate_reviewee_trips(previous.reviewee_content_type_id, previous.reviewee_object_id)
+    else:
+        return
+    instance._summarized = instance._summary_values()
+    invalidate_reviewee_trips(instance.reviewee_content_type_id, instance.reviewee_object_id)
+
 
-    
\ No newline at end of file
+@receiver(post_delete, sender=Review)
+def remove_review_from_summary(sender, instance, **kwargs):
+    ReviewSummary.apply_review(instance.summarized_review(), sign=-1)
+    invalidate_reviewee_trips(instance.reviewee_content_type_id, instance.reviewee_object_id)
@@ -0,0 +1,187 @@
+"""
+Fleet planning over departures.
+
+Every vehicle's and driver's busy time (departures and open trips) is loaded
+with one query into an IntervalIndex, and candidate departures are checked
+against it with a binary search instead of a query each, so schedules, bulk
+imports and return legs validate thousands of assignments in one pass. On
+PostgreSQL exclusion constraints on organization_departure back this up
+(migration 0016).
+
+Return legs are generated in bulk for outbound runs of vehicles whose trip is
+marked is_reverese_trip: the vehicle heads back after a turnaround that grows
+with the length of the outbound run.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import price_calendar
+from .models import Departure, Trip
+
+
+# What keeps a vehicle or driver busy: kind is 'departure', 'trip' or 'planned'
+Busy = namedtuple('Busy', 'kind ref vehicle_id start')
+
+
+class IntervalIndex:
+    """Busy [start, end) intervals per key, sorted by start."""
+
+    def __init__(self):
+        self.intervals = defaultdict(list)
+        # Longest interval per key, which bounds how far back an overlap can start
+        self.longest = defaultdict(timedelta)
+
+    def add(self, key, start, end, item=None):
+        insort(self.intervals[key], (start, end, item), key=lambda interval: interval[:2])
+        self.longest[key] = max(self.longest[key], end - start)
+
+    def overlapping(self, key, start, end):
+        """Items of the intervals for key that overlap [start, end)."""
+        intervals = self.intervals.get(key, [])
+        # Intervals starting at or after end can't overlap
+        index = bisect_left(intervals, (end,), key=lambda interval: interval[:1])
+        found = []
+        earliest = start - self.longest[key]
+        while index > 0:
+            index -= 1
+            other_start, other_end, item = intervals[index]
+            if other_start < earliest:
+                break
+            if other_end > start:
+                found.append(item)
+        return found
+
+    def is_free(self, key, start, end):
+        return not self.overlapping(key, start, end)
+
+
+def turnaround(duration):
+    """Rest before the return leg: a share of the outbound run, never less than the minimum."""
+    minimum = timedelta(minutes=settings.RETURN_LEG_MIN_TURNAROUND_MINUTES)
+    return max(minimum, duration * settings.RETURN_LEG_TURNAROUND_RATIO)
+
+
+def day_bounds(first_day, last_day):
+    """Aware datetimes spanning first_day to last_day inclusive."""
+    return (timezone.make_aware(datetime.combine(first_day, time.min)),
+            timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min)))
+
+
+def assignment_keys(vehicle_id, driver_id):
+    """Index keys an assignment occupies: its vehicle and, if it has one, its driver."""
+    keys = [('vehicle', vehicle_id)]
+    if driver_id:
+        keys.append(('driver', driver_id))
+    return keys
+
+
+def busy_index(start, end):
+    """IntervalIndex of every departure and open trip overlapping [start, end), by vehicle and driver."""
+    index = IntervalIndex()
+    departures = Departure.objects.filter(
+        departure_datetime__lt=end, arrival_datetime__gt=start,
+    ).order_by('departure_datetime').values_list('pk', 'vehicle_id', 'driver_id', 'departure_datetime', 'arrival_datetime')
+    for pk, vehicle_id, driver_id, leaves, arrives in departures:
+        for key in assignment_keys(vehicle_id, driver_id):
+            index.add(key, leaves, arrives, Busy('departure', pk, vehicle_id, leaves))
+    trips = Trip.objects.filter(
+        is_completed=False, start_datetime__lt=end, end_datetime__gt=start,
+    ).values_list('trip_id', 'vehicle_id', 'vehicle__driver_id', 'start_datetime', 'end_datetime')
+    for trip_id, vehicle_id, driver_id, leaves, arrives in trips:
+        for key in assignment_keys(vehicle_id, driver_id):
+            index.add(key, leaves, arrives, Busy('trip', trip_id, vehicle_id, leaves))
+    return index
+
+
+def check_assignments(departures, index=None):
+    """
+    Split unsaved departures into those that fit and those that would overlap
+    something their vehicle or driver already does, including departures
+    earlier in the same batch. Departures that already exist (same vehicle and
+    departure time) are dropped from both, so reruns stay quiet.
+
+    Returns (fitting departures, [(departure, clashes)]). Pass an index from
+    busy_index to check several batches against each other.
+    """
+    if not departures:
+        return [], []
+    if index is None:
+        index = busy_index(min(departure.departure_datetime for departure in departures),
+                           max(departure.arrival_datetime for departure in departures))
+    fitting, conflicts = [], []
+    for departure in departures:
+        keys = assignment_keys(departure.vehicle_id, departure.driver_id)
+        clashes = {
+            busy for key in keys
+            for busy in index.overlapping(key, departure.departure_datetime, departure.arrival_datetime)
+        }
+        if any(busy.vehicle_id == departure.vehicle_id and busy.start == departure.departure_datetime
+               and busy.kind != 'planned' for busy in clashes):
+            continue
+        if clashes:
+            conflicts.append((departure, sorted(clashes, key=lambda busy: busy.start)))
+            continue
+        planned = Busy('planned', f"{departure.from_location}-{departure.to_location}", departure.vehicle_id, departure.departure_datetime)
+        for key in keys:
+            index.add(key, departure.departure_datetime, departure.arrival_datetime, planned)
+        fitting.append(departure)
+    return fitting, conflicts
+
+
+def describe_clashes(clashes):
+    return ', '.join(f"{busy.kind} {busy.ref} at {timezone.localtime(busy.start):%Y-%m-%d %H:%M}" for busy in clashes)
+
+
+def record_trip_runs(start, end):
+    """
+    Give open trips marked is_reverese_trip that leave in [start, end) a
+    departure for their own run, so their return legs are planned like those
+    of scheduled departures. Returns how many were created.
+    """
+    trips = Trip.objects.filter(
+        is_reverese_trip=True, is_completed=False, start_datetime__gte=start, start_datetime__lt=end,
+        departures__isnull=True,
+    ).select_related('price', 'vehicle')
+    runs = [
+        Departure(
+            organization_id=trip.organization_id, vehicle_id=trip.vehicle_id, driver_id=trip.vehicle.driver_id,
+            from_location=trip.from_location, to_location=trip.to_location,
+            departure_datetime=trip.start_datetime, arrival_datetime=trip.end_datetime,
+            price=trip.price.price if hasattr(trip, 'price') else 0, trip=trip,
+        )
+        for trip in trips
+    ]
+    return len(Departure.objects.bulk_create(runs, ignore_conflicts=True))
+
+
+def plan_return_legs(first_day, last_day, dry_run=False):
+    """
+    Create the missing return legs for outbound departures from first_day to
+    last_day. A return leg that would overlap anything else its vehicle or
+    driver does is skipped and reported.
+
+    Returns (created return legs, [(outbound departure, clashing items)]).
+    """
+    start, end = day_bounds(first_day, last_day)
+    outbound = list(Departure.objects.filter(
+        departure_datetime__gte=start, departure_datetime__lt=end,
+        is_return=False, return_leg__isnull=True, vehicle__vehicle__is_reverese_trip=True,
+    ).order_by('departure_datetime'))
+    if not outbound:
+        return [], []
+
+    legs = [departure.build_return_leg(turnaround(departure.duration)) for departure in outbound]
+    # Returns can finish after the window, so the index reaches past it too
+    index = busy_index(start, max(end, max(leg.arrival_datetime for leg in legs)))
+    planned, conflicts = check_assignments(legs, index)
+
+    if not dry_run:
+        with transaction.atomic():
+            Departure.objects.bulk_create(planned, batch_size=1000)
+        price_calendar.invalidate_departures(planned)
+    return planned, [(leg.return_of, clashes) for leg, clashes in conflicts]
@@ -0,0 +1,127 @@
+"""
+Cheapest fare and seats left per day on a route.
+
+Each (route, day) is cached on its own. A calendar request reads its whole
+window with one get_many and computes only the days that are missing, with one
+grouped query over unclaimed departures and one over open trips with a
+TripPrice, so after a price or booking change only the affected day is redone.
+Every (route, day) has a generation counter in organization.cache that is
+part of its key. Changes bump the counters of the days their trips and
+departures were on and are on now, so a trip moved to another day or route
+leaves neither day stale. The counters are read before a day is computed, so
+a change that lands while it is computed leaves the result under a key that
+is no longer read. Entries also expire after PRICE_CALENDAR_TIMEOUT, which
+covers departures passing and the rare change that doesn't go through a model
+signal.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import cache as trip_cache
+
+
+MAX_DAYS = 60
+DEFAULT_DAYS = 30
+
+
+def generation_key(origin, destination, day):
+    return f"calendar:generation:{origin}:{destination}:{day.isoformat()}"
+
+
+def day_key(origin, destination, day, generation):
+    return f"calendar:{origin}:{destination}:{day.isoformat()}:{generation}"
+
+
+def invalidate(entries):
+    """Invalidate the cached days of (origin, destination, aware datetime) entries."""
+    keys = {generation_key(origin, destination, timezone.localdate(when)) for origin, destination, when in entries if when}
+    for key in keys:
+        trip_cache.bump_generation(key, settings.PRICE_CALENDAR_TIMEOUT)
+
+
+def invalidate_trips(**filters):
+    """Drop the cached days of the open trips matching filters, e.g. pk= or vehicle_id=."""
+    from .models import Trip
+    invalidate(Trip.objects.filter(is_completed=False, **filters).values_list(
+        'from_location', 'to_location', 'start_datetime'
+    ))
+
+
+def invalidate_departures(departures):
+    invalidate((departure.from_location, departure.to_location, departure.departure_datetime) for departure in departures)
+
+
+def _empty_day():
+    return {'min_price': None, 'seats_left': 0, 'departures': 0}
+
+
+def _merge(days, rows):
+    for row in rows:
+        day = days.get(row['day'])
+        if day is None:
+            continue
+        if row['min_price'] is not None and (day['min_price'] is None or row['min_price'] < day['min_price']):
+            day['min_price'] = row['min_price']
+        day['seats_left'] += row['seats'] or 0
+        day['departures'] += row['runs']
+
+
+def compute_days(origin, destination, days):
+    """Calendar entries for the given dates, two grouped queries whatever their number."""
+    from .models import Departure, Trip
+
+    entries = {day: _empty_day() for day in days}
+    tz = timezone.get_current_timezone()
+    # Runs that have already left are no longer on offer
+    start = max(timezone.now(), timezone.make_aware(datetime.combine(min(days), time.min)))
+    end = timezone.make_aware(datetime.combine(max(days) + timedelta(days=1), time.min))
+
+    # Departures not yet taken by a trip still have the whole vehicle free
+    departures = Departure.objects.filter(
+        from_location=origin, to_location=destination, trip__isnull=True, is_completed=False,
+        departure_datetime__gte=start, departure_datetime__lt=end,
+    ).annotate(day=TruncDate('departure_datetime', tzinfo=tz)).values('day').annotate(
+        min_price=Min('price', filter=Q(vehicle__seating_capacity__gt=0)),
+        seats=Sum('vehicle__seating_capacity'),
+        runs=Count('pk'),
+    ).order_by()
+    _merge(entries, departures)
+
+    trips = Trip.objects.filter(
+        from_location=origin, to_location=destination, is_completed=False, price__isnull=False,
+        start_datetime__gte=start, start_datetime__lt=end,
+    ).annotate(day=TruncDate('start_datetime', tzinfo=tz)).values('day').annotate(
+        # Sold out trips don't offer their price
+        min_price=Min('price__price', filter=Q(vehicle__available_seat__gt=0)),
+        seats=Sum('vehicle__available_seat'),
+        runs=Count('pk'),
+    ).order_by()
+    _merge(entries, trips)
+
+    for entry in entries.values():
+        if entry['min_price'] is not None:
+            entry['min_price'] = str(Decimal(entry['min_price']).quantize(Decimal('0.01')))
+    return entries
+
+
+def get_calendar(origin, destination, first_day, days=DEFAULT_DAYS):
+    """[{'date', 'min_price', 'seats_left', 'departures'}] for days days from first_day."""
+    dates = [first_day + timedelta(days=offset) for offset in range(days)]
+    # An expired counter starts over at a new value, which only orphans entries
+    generations = trip_cache.get_generations(
+        *(generation_key(origin, destination, day) for day in dates), timeout=settings.PRICE_CALENDAR_TIMEOUT,
+    )
+    keys = {day: day_key(origin, destination, day, generation) for day, generation in zip(dates, generations)}
+    cached = cache.get_many(list(keys.values()))
+    missing = [day for day in dates if keys[day] not in cached]
+    if missing:
+        computed = compute_days(origin, destination, missing)
+        cache.set_many({keys[day]: entry for day, entry in computed.items()}, settings.PRICE_CALENDAR_TIMEOUT)
+        cached.update({keys[day]: entry for day, entry in computed.items()})
+    return [{'date': day.isoformat(), **cached[keys[day]]} for day in dates]
@@ -0,0 +1,89 @@
+"""
+Dynamic fares from an organization's pricing rules.
+
+Rules are never evaluated when a fare is quoted. Instead each trip's rules are
+compiled into a fare table (stored on TripPrice.fares) when its price, date or
+the organization's rules change:
+
+- day-of-week and festival rules depend only on the trip's date, so they fold
+  into one multiplier;
+- load-factor and advance-purchase rules split occupancy and days ahead into
+  bands, and the table holds the fare of every (advance band, load band) pair;
+- two lookup lists map each possible number of booked seats and each number of
+  days ahead straight to its band.
+
+Quoting is then three list lookups. Percentages of every matching rule are
+applied one after another, so +20% and -10% make 1.2 * 0.9 of the base fare.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+
+CENT = Decimal('0.01')
+
+
+def _matches_range(rule, value):
+    return (rule.min_value is None or value >= rule.min_value) and (rule.max_value is None or value < rule.max_value)
+
+
+def _boundaries(rules):
+    """Sorted values at which some rule starts or stops applying."""
+    values = {0}
+    for rule in rules:
+        values.update(value for value in (rule.min_value, rule.max_value) if value is not None)
+    return sorted(values)
+
+
+def _multiplier(rules, applies):
+    multiplier = Decimal(1)
+    for rule in rules:
+        if applies(rule):
+            multiplier *= 1 + rule.percent / 100
+    return multiplier
+
+
+def compile_fares(base, rules, trip_date, capacity):
+    """
+    Fare table of a trip with the given base fare, local departure date and
+    seating capacity, under rules (active PricingRules matching its route).
+    """
+    from .models import PricingRule
+
+    dated = [rule for rule in rules if rule.kind in (PricingRule.WEEKDAY, PricingRule.FESTIVAL)]
+    load_rules = [rule for rule in rules if rule.kind == PricingRule.LOAD_FACTOR]
+    advance_rules = [rule for rule in rules if rule.kind == PricingRule.ADVANCE_PURCHASE]
+
+    base = Decimal(base) * _multiplier(dated, lambda rule: rule.applies_on(trip_date))
+    load_starts = _boundaries(load_rules)
+    advance_starts = _boundaries(advance_rules)
+
+    def band(starts, value):
+        # Index of the last boundary at or below value
+        index = 0
+        while index + 1 < len(starts) and starts[index + 1] <= value:
+            index += 1
+        return index
+
+    fares = [
+        [
+            str((base * _multiplier(advance_rules, lambda rule: _matches_range(rule, days))
+                 * _multiplier(load_rules, lambda rule: _matches_range(rule, load))).quantize(CENT, ROUND_HALF_UP))
+            for load in load_starts
+        ]
+        for days in advance_starts
+    ]
+    return {
+        'date': trip_date.isoformat(),
+        # Band of every possible number of booked seats, by load factor in percent
+        'load_bands': [band(load_starts, booked * 100 // capacity if capacity else 0) for booked in range(capacity + 1)],
+        # Band of every number of days ahead up to the last boundary; later days share its band
+        'advance_bands': [band(advance_starts, days) for days in range(advance_starts[-1] + 1)],
+        'fares': fares,
+    }
+
+
+def quote(table, days_ahead, booked):
+    """Fare per seat from a compiled table, for a booking days_ahead days out with booked seats taken."""
+    load_bands, advance_bands = table['load_bands'], table['advance_bands']
+    load_band = load_bands[min(max(booked, 0), len(load_bands) - 1)]
+    advance_band = advance_bands[min(max(days_ahead, 0), len(advance_bands) - 1)]
+    return Decimal(table['fares'][advance_band][load_band])
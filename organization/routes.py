@@ -0,0 +1,184 @@
+"""
+Distance and travel time between trip locations.
+
+Every pair of locations gets a road distance and a duration, kept in two flat
+arrays indexed by location, so a lookup is two dict hits and an array read.
+Pairs start from published road distances and typical bus times where known,
+otherwise from the straight-line distance times a road winding factor at an
+average bus speed. Durations are then refined with the actual durations of
+completed trips (RouteDuration), weighted against the estimate until enough
+trips have been recorded. The matrix is rebuilt in the process when a new
+duration is recorded (routes generation counter in organization.cache).
+"""
+import math
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+
+from . import cache as trip_cache
+from .locations import LOCATIONS
+
+
+# (latitude, longitude) of each location
+COORDINATES = {
+    'kathmandu': (27.7172, 85.3240),
+    'pokhara': (28.2096, 83.9856),
+    'chitwan': (27.5291, 84.3542),
+    'lumbini': (27.4840, 83.2760),
+    'janakpur': (26.7288, 85.9263),
+    'biratnagar': (26.4525, 87.2718),
+    'birgunj': (27.0104, 84.8770),
+    'dharan': (26.8120, 87.2836),
+    'butwal': (27.7000, 83.4484),
+    'hetauda': (27.4287, 85.0322),
+    'nepalgunj': (28.0500, 81.6167),
+    'dhangadhi': (28.6940, 80.5931),
+    'bharatpur': (27.6768, 84.4359),
+    'itahari': (26.6646, 87.2718),
+    'gaur': (26.7649, 85.2785),
+    'tansen': (27.8673, 83.5467),
+    'jomsom': (28.7804, 83.7233),
+    'namche_bazaar': (27.8069, 86.7140),
+    'manang': (28.6667, 84.0167),
+    'lukla': (27.6869, 86.7314),
+    'jaleswor': (26.6486, 85.8003),
+    'sindhuli': (27.2569, 85.9713),
+}
+
+# Road distance (km) and typical bus time (hours) of well travelled routes, either direction
+KNOWN_ROUTES = {
+    ('kathmandu', 'pokhara'): (200, 7),
+    ('kathmandu', 'chitwan'): (150, 5),
+    ('kathmandu', 'bharatpur'): (146, 5),
+    ('kathmandu', 'sindhuli'): (150, 5),
+    ('kathmandu', 'janakpur'): (225, 8),
+    ('kathmandu', 'lumbini'): (280, 9),
+    ('kathmandu', 'butwal'): (260, 8),
+    ('kathmandu', 'hetauda'): (135, 5),
+    ('kathmandu', 'biratnagar'): (400, 11),
+    ('pokhara', 'jomsom'): (160, 8),
+    ('pokhara', 'butwal'): (160, 6),
+    ('pokhara', 'chitwan'): (130, 4),
+    ('sindhuli', 'janakpur'): (75, 3),
+}
+
+# Roads wind; straight-line distance times this is a fair road distance estimate
+ROAD_FACTOR = 1.4
+AVERAGE_SPEED_KMH = 35
+# Used for locations without coordinates
+DEFAULT_DURATION = timedelta(hours=7)
+# Recorded trips weigh against the estimate as if it were this many trips
+PRIOR_TRIPS = 5
+
+
+def haversine_km(origin, destination):
+    lat1, lon1 = map(math.radians, origin)
+    lat2, lon2 = map(math.radians, destination)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(a))
+
+
+class RouteMatrix:
+    """Road distance (km) and duration (seconds) for every ordered pair of locations."""
+
+    def __init__(self, slugs, observed=None, generation=None):
+        self.generation = generation
+        self.built_at = time.monotonic()
+        self.index = {slug: position for position, slug in enumerate(slugs)}
+        size = len(slugs)
+        # 0 marks an unknown distance
+        self.distances = array('f', bytes(4 * size * size))
+        self.seconds = array('l', [int(DEFAULT_DURATION.total_seconds())]) * (size * size)
+        for (origin, destination), (km, hours) in self._estimates(slugs):
+            cell = self.index[origin] * size + self.index[destination]
+            self.distances[cell] = km
+            self.seconds[cell] = int(hours * 3600)
+        # observed: {(origin, destination): (trip count, total seconds)}
+        for (origin, destination), (count, total) in (observed or {}).items():
+            if origin in self.index and destination in self.index and count:
+                cell = self.index[origin] * size + self.index[destination]
+                self.seconds[cell] = int((self.seconds[cell] * PRIOR_TRIPS + total) / (PRIOR_TRIPS + count))
+        self.size = size
+
+    @staticmethod
+    def _estimates(slugs):
+        for origin in slugs:
+            for destination in slugs:
+                if origin == destination:
+                    continue
+                known = KNOWN_ROUTES.get((origin, destination)) or KNOWN_ROUTES.get((destination, origin))
+                if known:
+                    yield (origin, destination), known
+                elif origin in COORDINATES and destination in COORDINATES:
+                    km = haversine_km(COORDINATES[origin], COORDINATES[destination]) * ROAD_FACTOR
+                    yield (origin, destination), (km, km / AVERAGE_SPEED_KMH)
+
+    def _cell(self, origin, destination):
+        return self.index[origin] * self.size + self.index[destination]
+
+    def distance_km(self, origin, destination):
+        """Road distance, or None when it isn't known."""
+        if origin not in self.index or destination not in self.index or origin == destination:
+            return None
+        return round(self.distances[self._cell(origin, destination)], 1) or None
+
+    def duration(self, origin, destination):
+        if origin not in self.index or destination not in self.index:
+            return DEFAULT_DURATION
+        return timedelta(seconds=self.seconds[self._cell(origin, destination)])
+
+    def duration_for_distance(self, origin, destination, km):
+        """Time to cover km at the route's usual speed (for trips with their own distance)."""
+        route_km = self.distance_km(origin, destination)
+        if not route_km:
+            return timedelta(hours=km / AVERAGE_SPEED_KMH)
+        return self.duration(origin, destination) * (km / route_km)
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+def load_observed():
+    from .models import RouteDuration
+    return {
+        (origin, destination): (count, total)
+        for origin, destination, count, total in RouteDuration.objects.values_list(
+            'from_location', 'to_location', 'trip_count', 'total_seconds'
+        )
+    }
+
+
+def _is_current(route_matrix, generation):
+    if route_matrix is None or route_matrix.generation != generation:
+        return False
+    # A worker with its own counters can miss another's bump; rebuilding now and then bounds that
+    return trip_cache.generations_are_shared() or time.monotonic() - route_matrix.built_at < settings.TRIP_CACHE_TIMEOUT
+
+
+def matrix():
+    """
+    The process's route matrix, rebuilt when a trip duration has been recorded
+    since it was built. Without shared generation counters it is also rebuilt
+    every TRIP_CACHE_TIMEOUT, which bounds how long a worker that missed a bump keeps it.
+    """
+    global _matrix
+    generation, = trip_cache.get_generations(trip_cache.ROUTE_GENERATION_KEY)
+    current = _matrix
+    if _is_current(current, generation):
+        return current
+    with _matrix_lock:
+        if not _is_current(_matrix, generation):
+            _matrix = RouteMatrix([slug for slug, _, _, _ in LOCATIONS], load_observed(), generation)
+        return _matrix
+
+
+def distance_km(origin, destination):
+    return matrix().distance_km(origin, destination)
+
+
+def duration(origin, destination):
+    return matrix().duration(origin, destination)
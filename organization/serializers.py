@@ -1,10 +1,11 @@
 from rest_framework import serializers
 from authentication.models import CustomUser, Driver, Organization, Passenger
 from authentication.serializers import CustomUserSerializer, OrganizationSerializer, DriverSerializer, PassengerSerializer
-from .models import Vehicle, Review, Seat, Trip, TripPrice
+from .models import Vehicle, Review, Seat, Trip, TripPrice, TripSchedule, Departure, PricingRule
 import random
 import string
 from django.utils import timezone
+from django.db import transaction
 from datetime import timedelta
 
 
@@ -125,28 +126,36 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = '__all__'
+        extra_kwargs = {
+            'trip': {'required': False},
+            'trip_passenger_count': {'read_only': True},
+        }
+
+    def create(self, validated_data):
+        """Record how many passengers the reviewed trip carried, for the trip-weighted rating."""
+        trip = validated_data.get('trip')
+        if trip:
+            validated_data['trip_passenger_count'] = max(trip.passenger_count, 1)
+        return super().create(validated_data)
+
+    # Serializer per profile type; the related objects are prefetched by the list view
+    PROFILE_SERIALIZERS = {
+        Passenger: PassengerSerializer,
+        Driver: DriverSerializer,
+        Organization: OrganizationSerializer,
+    }
+
+    def _serialize_profile(self, profile):
+        serializer_class = self.PROFILE_SERIALIZERS.get(type(profile))
+        return serializer_class(profile).data if serializer_class else None
 
     def get_reviewer(self, obj):
         """Return the serialized reviewer object based on its type."""
-        reviewer = obj.reviewer
-        if isinstance(reviewer, Passenger):
-            return PassengerSerializer(reviewer).data
-        elif isinstance(reviewer, Driver):
-            return DriverSerializer(reviewer).data
-        elif isinstance(reviewer, Organization):
-            return OrganizationSerializer(reviewer).data
-        return None
+        return self._serialize_profile(obj.reviewer)
 
     def get_reviewee(self, obj):
         """Return the serialized reviewee object based on its type."""
-        reviewee = obj.reviewee
-        if isinstance(reviewee, Passenger):
-            return PassengerSerializer(reviewee).data
-        elif isinstance(reviewee, Driver):
-            return DriverSerializer(reviewee).data
-        elif isinstance(reviewee, Organization):
-            return OrganizationSerializer(reviewee).data
-        return None
+        return self._serialize_profile(obj.reviewee)
 
     def validate(self, data):
         """
@@ -181,6 +190,8 @@ class SeatSerializer(serializers.ModelSerializer):
         
         if is_occupied != instance.is_occupied:
             instance.is_occupied = is_occupied
+            # A seat taken or freed by hand is taken or freed along the whole route
+            instance.occupied_segments = Seat.ALL_SEGMENTS if is_occupied else 0
             # Adjust vehicle's available seating capacity accordingly
             vehicle = instance.vehicle
             if vehicle:
@@ -199,7 +210,7 @@ class SeatSerializer(serializers.ModelSerializer):
 
         for vehicle in vehicles:
             # Reset each seat to unoccupied
-            vehicle.seats.update(is_occupied=False)
+            vehicle.seats.update(is_occupied=False, occupied_segments=0)
 
             # Update vehicle's available seat count
             vehicle.available_seat = vehicle.seating_capacity
@@ -212,7 +223,7 @@ class TripPriceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = TripPrice
-        fields = '__all__'
+        exclude = ['fares']
 
     def create(self, validated_data):
         """
@@ -248,6 +259,8 @@ class TripSerializer(serializers.ModelSerializer):
     trip_price = TripPriceSerializer(source='price', read_only=True)
     available_seat = serializers.ReadOnlyField(source='vehicle.available_seat')
     seats = SeatSerializer(source='vehicle.seats', many=True, read_only=True)
+    driver_rating = serializers.SerializerMethodField()
+    organization_rating = serializers.SerializerMethodField()
 
     class Meta:
         model = Trip
@@ -263,6 +276,17 @@ class TripSerializer(serializers.ModelSerializer):
             return vehicle.image.url
         return None  # Return None or an empty string if there is no image associated
 
+    def get_driver_rating(self, obj):
+        """Return the driver's rating from the materialized summary (no review scan)."""
+        driver = obj.vehicle.driver if obj.vehicle else None
+        summary = driver.get_rating_summary() if driver else None
+        return summary.as_dict() if summary else None
+
+    def get_organization_rating(self, obj):
+        """Return the organization's rating from the materialized summary (no review scan)."""
+        summary = obj.organization.get_rating_summary() if obj.organization else None
+        return summary.as_dict() if summary else None
+
     def create(self, validated_data):
         """
         Create a trip instance, ensuring that the organization and vehicle are correctly assigned.
@@ -309,3 +333,108 @@ class TripSerializer(serializers.ModelSerializer):
         instance.last_updated_by = user.username
         instance.save()
         return instance
+
+
+class WeekdaysField(serializers.Field):
+    """Days of the week as a list of names ('mon' to 'sun'), stored as a bitmask."""
+
+    def to_representation(self, value):
+        return [name for bit, name in enumerate(TripSchedule.WEEKDAYS) if value >> bit & 1]
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or not data or any(day not in TripSchedule.WEEKDAYS for day in data):
+            raise serializers.ValidationError(f"Expected a list of days from {', '.join(TripSchedule.WEEKDAYS)}.")
+        return sum(1 << TripSchedule.WEEKDAYS.index(day) for day in set(data))
+
+
+class TripScheduleSerializer(serializers.ModelSerializer):
+    registration_number = serializers.CharField(source='vehicle.registration_number', read_only=True)
+    days_of_week = WeekdaysField(required=False)
+
+    class Meta:
+        model = TripSchedule
+        fields = '__all__'
+        extra_kwargs = {
+            'organization': {'read_only': True},
+            'vehicle': {'read_only': True},
+        }
+
+    def validate(self, data):
+        from_location = data.get('from_location', getattr(self.instance, 'from_location', None))
+        to_location = data.get('to_location', getattr(self.instance, 'to_location', None))
+        if from_location == to_location:
+            raise serializers.ValidationError("A schedule must go between two different locations.")
+        starts_on = data.get('starts_on', getattr(self.instance, 'starts_on', None))
+        ends_on = data.get('ends_on', getattr(self.instance, 'ends_on', None))
+        if starts_on and ends_on and ends_on < starts_on:
+            raise serializers.ValidationError("ends_on must not be before starts_on.")
+        return data
+
+    def create(self, validated_data):
+        """Create the schedule for one of the organization's vehicles and materialize its departures."""
+        organization = Organization.objects.get(user=self.context.get('user'))
+        try:
+            validated_data['vehicle'] = Vehicle.objects.get(
+                registration_number=self.context.get('registration_number'), organization=organization
+            )
+        except Vehicle.DoesNotExist:
+            raise serializers.ValidationError("Vehicle with the provided registration number does not exist.")
+        validated_data['organization'] = organization
+        # A schedule whose departures clash with the vehicle's other runs isn't kept
+        with transaction.atomic():
+            schedule = TripSchedule.objects.create(**validated_data)
+            schedule.materialize()
+        return schedule
+
+
+class DepartureSerializer(serializers.ModelSerializer):
+    registration_number = serializers.ReadOnlyField(source='vehicle.registration_number')
+    trip_id = serializers.ReadOnlyField(source='trip.trip_id')
+
+    class Meta:
+        model = Departure
+        exclude = ['trip']
+
+
+class PricingRuleSerializer(serializers.ModelSerializer):
+    days_of_week = WeekdaysField(required=False)
+
+    # Advance purchase bands are compiled day by day, so they can't reach too far out
+    MAX_ADVANCE_DAYS = 365
+
+    class Meta:
+        model = PricingRule
+        fields = '__all__'
+        extra_kwargs = {
+            'organization': {'read_only': True},
+        }
+
+    def validate(self, data):
+        def value(field):
+            return data.get(field, getattr(self.instance, field, None))
+
+        kind = value('kind')
+        min_value, max_value = value('min_value'), value('max_value')
+        if value('percent') is not None and value('percent') <= -100:
+            raise serializers.ValidationError({"percent": "A discount can't be 100% or more."})
+        if kind in (PricingRule.LOAD_FACTOR, PricingRule.ADVANCE_PURCHASE):
+            if min_value is None and max_value is None:
+                raise serializers.ValidationError("Load factor and advance purchase rules need min_value or max_value.")
+            if min_value is not None and max_value is not None and max_value <= min_value:
+                raise serializers.ValidationError("max_value must be greater than min_value.")
+            limit = 100 if kind == PricingRule.LOAD_FACTOR else self.MAX_ADVANCE_DAYS
+            if any(bound is not None and bound > limit for bound in (min_value, max_value)):
+                raise serializers.ValidationError(f"min_value and max_value can't be over {limit} for this kind of rule.")
+        elif kind == PricingRule.WEEKDAY and not value('days_of_week'):
+            raise serializers.ValidationError({"days_of_week": "Day of week rules need at least one day."})
+        elif kind == PricingRule.FESTIVAL:
+            starts_on, ends_on = value('starts_on'), value('ends_on')
+            if not starts_on or not ends_on:
+                raise serializers.ValidationError("Festival rules need starts_on and ends_on.")
+            if ends_on < starts_on:
+                raise serializers.ValidationError("ends_on must not be before starts_on.")
+        return data
+
+    def create(self, validated_data):
+        validated_data['organization'] = Organization.objects.get(user=self.context.get('user'))
+        return PricingRule.objects.create(**validated_data)
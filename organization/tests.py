@@ -1,3 +1,367 @@
-from django.test import TestCase
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.serializers import ValidationError
+
+from authentication.models import CustomUser, Organization, Driver
+from . import cache as trip_cache, price_calendar, routes
+from .models import Vehicle, Seat, Trip, TripStop, TripPrice, PricingRule, Departure, Review, ReviewSummary
+
+
+class SegmentClaimTests(TestCase):
+    """Seats booked per route segment: kathmandu -> bharatpur -> pokhara."""
+
+    def setUp(self):
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        organization = Organization.objects.create(user=org_user, name='Org')
+        driver_user = CustomUser.objects.create_user('driver', 'driver@example.com', 'password', is_driver=True)
+        driver = Driver.objects.create(user=driver_user, license_number='L-1', organization=organization)
+        self.vehicle = Vehicle.objects.create(
+            organization=organization, driver=driver, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=4, available_seat=3, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        # The first seat is the driver's
+        self.seats = [Seat.objects.create(vehicle=self.vehicle, seat_number=f"S00{i}") for i in range(1, 5)]
+        start = timezone.now() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            organization=organization, vehicle=self.vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=start, end_datetime=start + timedelta(hours=7),
+        )
+        for sequence, location in enumerate(['kathmandu', 'bharatpur', 'pokhara']):
+            TripStop.objects.create(trip=self.trip, sequence=sequence, location=location)
+        self.first_leg = self.trip.segment_mask('kathmandu', 'bharatpur')
+        self.second_leg = self.trip.segment_mask('bharatpur', 'pokhara')
+        self.whole_route = self.trip.segment_mask()
+
+    def claim(self, seats, mask):
+        with transaction.atomic():
+            self.vehicle.claim_seats([seat.pk for seat in seats], mask)
+
+    def release(self, seats, mask):
+        with transaction.atomic():
+            self.vehicle.release_seats([seat.pk for seat in seats], mask)
+
+    def seat_state(self, seat):
+        seat.refresh_from_db()
+        return seat.occupied_segments, seat.is_occupied
+
+    def available(self):
+        self.vehicle.refresh_from_db()
+        return self.vehicle.available_seat
+
+    def test_segment_masks(self):
+        self.assertEqual(self.first_leg, 0b01)
+        self.assertEqual(self.second_leg, 0b10)
+        self.assertEqual(self.whole_route, 0b11)
+
+    def test_boarding_at_the_last_stop_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.trip.segment_mask('pokhara')
+        with self.assertRaises(ValidationError):
+            self.trip.segment_mask('pokhara', 'kathmandu')
+
+    def test_empty_mask_is_rejected(self):
+        seat = self.seats[1]
+        with self.assertRaises(ValidationError):
+            self.claim([seat], 0)
+        self.assertEqual(self.seat_state(seat), (0, False))
+        self.assertEqual(self.available(), 3)
+
+    def test_disjoint_segments_share_a_seat(self):
+        seat = self.seats[1]
+        self.claim([seat], self.first_leg)
+        self.claim([seat], self.second_leg)
+        self.assertEqual(self.seat_state(seat), (self.whole_route, True))
+        # One seat taken, however many bookings share it
+        self.assertEqual(self.available(), 2)
+
+    def test_overlapping_segments_conflict(self):
+        seat = self.seats[1]
+        self.claim([seat], self.whole_route)
+        with self.assertRaises(ValidationError):
+            self.claim([seat], self.second_leg)
+        self.assertEqual(self.seat_state(seat), (self.whole_route, True))
+        self.assertEqual(self.available(), 2)
+
+    def test_claim_is_all_or_none(self):
+        free, taken = self.seats[1], self.seats[2]
+        self.claim([taken], self.first_leg)
+        with self.assertRaises(ValidationError):
+            self.claim([free, taken], self.first_leg)
+        self.assertEqual(self.seat_state(free), (0, False))
+        self.assertEqual(self.seat_state(taken), (self.first_leg, True))
+        self.assertEqual(self.available(), 2)
+
+    def test_driver_seat_cannot_be_claimed(self):
+        with self.assertRaises(ValidationError):
+            self.claim([self.seats[0]], self.first_leg)
+
+    def test_release_restores_available_seat(self):
+        shared, single = self.seats[1], self.seats[2]
+        self.claim([shared, single], self.first_leg)
+        self.claim([shared], self.second_leg)
+        self.assertEqual(self.available(), 1)
+
+        # The shared seat is still held on the second leg
+        self.release([shared, single], self.first_leg)
+        self.assertEqual(self.seat_state(shared), (self.second_leg, True))
+        self.assertEqual(self.seat_state(single), (0, False))
+        self.assertEqual(self.available(), 2)
+
+        self.release([shared], self.second_leg)
+        self.assertEqual(self.seat_state(shared), (0, False))
+        self.assertEqual(self.available(), 3)
+
+        # Releasing again changes nothing
+        self.release([shared], self.second_leg)
+        self.assertEqual(self.available(), 3)
+
+
+class TripPriceTests(TestCase):
+    """A 10-seat bus at base fare 1000, 20% dearer once half its seats are booked."""
+
+    def setUp(self):
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        self.organization = Organization.objects.create(user=org_user, name='Org')
+        self.vehicle = Vehicle.objects.create(
+            organization=self.organization, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=10, available_seat=10, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        PricingRule.objects.create(organization=self.organization, name='Busy', kind=PricingRule.LOAD_FACTOR, percent=20, min_value=50)
+        self.start = timezone.now() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            organization=self.organization, vehicle=self.vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=self.start, end_datetime=self.start + timedelta(hours=7),
+        )
+        self.trip_price = TripPrice.objects.create(trip=self.trip, price=1000)
+
+    def fill(self, booked):
+        self.vehicle.available_seat = self.vehicle.seating_capacity - booked
+        self.vehicle.save()
+
+    def fresh(self):
+        return TripPrice.objects.get(pk=self.trip_price.pk)
+
+    def test_first_price_becomes_the_base(self):
+        self.assertEqual((self.trip_price.base_price, self.trip_price.price), (1000, 1000))
+
+    def test_edited_price_becomes_the_base(self):
+        self.fill(5)
+        trip_price = self.fresh()
+        trip_price.price = 1500
+        trip_price.save()
+        self.assertEqual((trip_price.base_price, trip_price.price), (1500, 1800))
+        # Saving again re-quotes from the base instead of compounding the surcharge
+        trip_price.save()
+        trip_price = self.fresh()
+        self.assertEqual((trip_price.base_price, trip_price.price), (1500, 1800))
+
+    def test_reprice_keeps_the_base(self):
+        self.fill(5)
+        trip_price = self.fresh()
+        trip_price.reprice()
+        self.assertEqual((trip_price.base_price, trip_price.price), (1000, 1200))
+        self.assertEqual((self.fresh().base_price, self.fresh().price), (1000, 1200))
+        trip_price.save()
+        self.assertEqual((trip_price.base_price, trip_price.price), (1000, 1200))
+
+    def test_advance_quotes_the_next_departure(self):
+        departure_at = self.start + timedelta(days=3)
+        Departure.objects.create(
+            organization=self.organization, vehicle=self.vehicle, from_location='kathmandu', to_location='chitwan',
+            departure_datetime=departure_at, arrival_datetime=departure_at + timedelta(hours=5), price=2500,
+        )
+        self.fill(6)
+        self.trip.advance_to_next_departure()
+        trip_price = self.fresh()
+        # Seats are reset with the advance, so no load surcharge
+        self.assertEqual((trip_price.base_price, trip_price.price), (2500, 2500))
+        self.assertEqual(trip_price.fares['date'], timezone.localdate(departure_at).isoformat())
+        self.assertEqual(trip_price.quote(), 2500)
+
+
+@override_settings(TRIP_CACHE_TIMEOUT=1, TRIP_CACHE_STALE_TIMEOUT=60)
+class TripCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_expired_entry_is_served_stale_during_a_refresh(self):
+        key = trip_cache.trip_listing_key({})
+        trip_cache.cached(key, lambda: 'old')
+        time.sleep(1.1)
+        # Past its freshness the entry is still under the same generation
+        self.assertEqual(trip_cache.trip_listing_key({}), key)
+        # Another request is refreshing it
+        cache.add(f"{key}:refresh", True)
+        self.assertEqual(trip_cache.cached(key, lambda: 'new'), 'old')
+        cache.delete(f"{key}:refresh")
+        self.assertEqual(trip_cache.cached(key, lambda: 'new'), 'new')
+
+    def test_invalidation_changes_the_key(self):
+        key = trip_cache.trip_listing_key({})
+        trip_cache.invalidate_trip_listings()
+        self.assertNotEqual(trip_cache.trip_listing_key({}), key)
+
+
+class TripRouteTests(TestCase):
+    def setUp(self):
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        organization = Organization.objects.create(user=org_user, name='Org')
+        vehicle = Vehicle.objects.create(
+            organization=organization, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=10, available_seat=10, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        self.start = timezone.now() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            organization=organization, vehicle=vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=self.start, end_datetime=self.start,
+        )
+
+    def test_new_trip_takes_the_route_matrix(self):
+        self.assertEqual(self.trip.distance, routes.distance_km('kathmandu', 'pokhara'))
+        self.assertEqual(self.trip.end_datetime, self.start + self.trip.duration)
+
+    def test_changed_route_is_recomputed(self):
+        trip = Trip.objects.get(pk=self.trip.pk)
+        trip.to_location = 'biratnagar'
+        trip.save()
+        trip = Trip.objects.get(pk=self.trip.pk)
+        self.assertEqual(trip.distance, routes.distance_km('kathmandu', 'biratnagar'))
+        self.assertNotEqual(trip.duration, self.trip.duration)
+        self.assertEqual(trip.end_datetime, trip.start_datetime + trip.duration)
+
+    def test_duration_set_with_the_route_is_kept(self):
+        trip = Trip.objects.get(pk=self.trip.pk)
+        trip.to_location, trip.duration = 'biratnagar', timedelta(hours=9)
+        trip.save()
+        trip = Trip.objects.get(pk=self.trip.pk)
+        self.assertEqual(trip.duration, timedelta(hours=9))
+        self.assertEqual(trip.distance, routes.distance_km('kathmandu', 'biratnagar'))
+
+    def test_unchanged_route_keeps_its_values(self):
+        trip = Trip.objects.get(pk=self.trip.pk)
+        trip.duration = timedelta(hours=8)
+        trip.save()
+        self.assertEqual(Trip.objects.get(pk=self.trip.pk).duration, timedelta(hours=8))
+
+
+class PriceCalendarTests(TestCase):
+    """A 10-seat bus on a kathmandu -> pokhara trip tomorrow, fare 1000."""
+
+    def setUp(self):
+        cache.clear()
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        self.organization = Organization.objects.create(user=org_user, name='Org')
+        self.vehicle = Vehicle.objects.create(
+            organization=self.organization, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=10, available_seat=10, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        self.start = timezone.now() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            organization=self.organization, vehicle=self.vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=self.start, end_datetime=self.start,
+        )
+        TripPrice.objects.create(trip=self.trip, price=1000)
+        self.day = timezone.localdate(self.start)
+
+    def calendar(self, destination='pokhara'):
+        days = price_calendar.get_calendar('kathmandu', destination, self.day, 5)
+        return {day['date']: (day['min_price'], day['departures']) for day in days if day['departures']}
+
+    def test_moved_trip_leaves_its_old_day(self):
+        self.assertEqual(self.calendar(), {self.day.isoformat(): ('1000.00', 1)})
+        trip = Trip.objects.get(pk=self.trip.pk)
+        trip.start_datetime = self.start + timedelta(days=2)
+        trip.save()
+        self.assertEqual(self.calendar(), {(self.day + timedelta(days=2)).isoformat(): ('1000.00', 1)})
+
+    def test_advanced_trip_leaves_its_old_route(self):
+        self.assertEqual(self.calendar(), {self.day.isoformat(): ('1000.00', 1)})
+        self.assertEqual(self.calendar('chitwan'), {})
+        departure_at = self.start + timedelta(days=3)
+        Departure.objects.create(
+            organization=self.organization, vehicle=self.vehicle, from_location='kathmandu', to_location='chitwan',
+            departure_datetime=departure_at, arrival_datetime=departure_at + timedelta(hours=5), price=2500,
+        )
+        Trip.objects.get(pk=self.trip.pk).advance_to_next_departure()
+        self.assertEqual(self.calendar(), {})
+        self.assertEqual(self.calendar('chitwan'), {(self.day + timedelta(days=3)).isoformat(): ('2500.00', 1)})
+
+    def test_change_during_compute_is_not_overwritten(self):
+        compute_days = price_calendar.compute_days
+
+        def compute_then_change(*args):
+            computed = compute_days(*args)
+            # Lands after the days were read but before they are cached
+            TripPrice.objects.filter(trip=self.trip).update(price=1500)
+            price_calendar.invalidate_trips(pk=self.trip.pk)
+            return computed
+
+        with mock.patch.object(price_calendar, 'compute_days', compute_then_change):
+            self.assertEqual(self.calendar(), {self.day.isoformat(): ('1000.00', 1)})
+        self.assertEqual(self.calendar(), {self.day.isoformat(): ('1500.00', 1)})
+
+
+class ReviewSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        organization = Organization.objects.create(user=org_user, name='Org')
+        driver_user = CustomUser.objects.create_user('driver', 'driver@example.com', 'password', is_driver=True)
+        self.driver = Driver.objects.create(user=driver_user, license_number='L-1', organization=organization)
+        vehicle = Vehicle.objects.create(
+            organization=organization, driver=self.driver, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=10, available_seat=9, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        start = timezone.now() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            organization=organization, vehicle=vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=start, end_datetime=start,
+        )
+        reviewer = CustomUser.objects.create_user('rider', 'rider@example.com', 'password', is_passenger=True)
+        self.review = Review.objects.create(
+            rating=5, reviewer=reviewer, reviewee=self.driver, trip=self.trip, trip_passenger_count=2,
+        )
+
+    def summary(self):
+        return ReviewSummary.objects.get(
+            reviewee_content_type=ContentType.objects.get_for_model(Driver), reviewee_object_id=self.driver.pk,
+        )
+
+    def test_edited_rating_replaces_the_old_one(self):
+        self.assertEqual(self.summary().as_dict()['histogram'][5], 1)
+        review = Review.objects.get(pk=self.review.pk)
+        review.rating = 2
+        review.save()
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_sum), (1, 2))
+        self.assertEqual(summary.histogram(), {1: 0, 2: 1, 3: 0, 4: 0, 5: 0})
+        # 2 for the reviewer and neutral 3 for the other passenger
+        self.assertEqual(summary.adjusted_sum, Decimal('2.5'))
+
+        # Saving again without changes counts nothing twice
+        review.save()
+        self.assertEqual(self.summary().rating_sum, 2)
+
+        review.delete()
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_sum, summary.star_2, summary.adjusted_sum), (0, 0, 0, 0))
+
+    def test_edited_review_invalidates_the_reviewee_trips(self):
+        key = trip_cache.trip_detail_key(self.trip)
+        review = Review.objects.get(pk=self.review.pk)
+        review.rating = 3
+        review.save()
+        self.assertNotEqual(trip_cache.trip_detail_key(self.trip), key)
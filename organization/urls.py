@@ -8,6 +8,11 @@ urlpatterns = [
     path('vehicles/<str:RN>/',views.VehicleDetailView.as_view(),name='vehicle-detail'),
     path('trips/',views.TripCreateAPIView.as_view(),name='trip-create'),
     path('trips/<str:trip_id>/',views.TripDetailView.as_view(),name='trip-detail'),
+    path('trips/<str:trip_id>/stops/',views.TripStopsView.as_view(),name='trip-stops'),
+    path('schedules/',views.TripScheduleView.as_view(),name='trip-schedules'),
+    path('schedules/<int:schedule_id>/',views.TripScheduleDetailView.as_view(),name='trip-schedule-detail'),
+    path('pricing-rules/',views.PricingRuleView.as_view(),name='pricing-rules'),
+    path('pricing-rules/<int:rule_id>/',views.PricingRuleDetailView.as_view(),name='pricing-rule-detail'),
     path('trip-reset/',views.TripResetView.as_view(),name='trip-reset'),
     path('drivers/',views.DriverDetailsView.as_view(),name='org-drivers'),
 ]
@@ -1,5 +1,6 @@
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -9,8 +10,10 @@ from rest_framework.serializers import ValidationError
 from authentication.renderers import UserRenderer
 from authentication.models import Driver
 from authentication.serializers import DriverSerializer
-from .models import Vehicle, Trip, TripPrice, Seat
-from .serializers import VehicleSerializer, TripPriceSerializer, TripSerializer, SeatSerializer
+from .models import Vehicle, Trip, TripPrice, Seat, TripSchedule, PricingRule
+from .serializers import VehicleSerializer, TripPriceSerializer, TripSerializer, SeatSerializer, TripScheduleSerializer, DepartureSerializer, PricingRuleSerializer
+from .cache import get_or_set_trip_detail, trip_etag, vehicle_etag, not_modified
+from .locations import registry as locations
 
 class VehicleView(APIView):
     """
@@ -95,28 +98,38 @@ class VehicleDetailView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
     def get(self, request, RN=None):
-        """Retrieve detailed information of a specific vehicle by registration number."""
+        """
+        Retrieve detailed information of a specific vehicle by registration number.
+        Clients that send the ETag back in If-None-Match get a 304 while the
+        vehicle, its seats and its trip are unchanged.
+        """
         try:
-            # Fetch vehicle based on registration number and user
+            # Fetch vehicle (with its trip) based on registration number and user
             vehicle = self._get_vehicle_by_user(request.user, RN)
+            trip = getattr(vehicle, 'vehicle', None)  # 'vehicle' is the related name for Trip model
 
-            # Fetch related trip details for the vehicle
-            trip = Trip.objects.filter(vehicle=vehicle).select_related('vehicle').first()
+            etag = vehicle_etag(vehicle, trip.pk if trip else None)
+            unchanged = not_modified(request, etag)
+            if unchanged:
+                return unchanged
 
             # Fetch all seats related to the vehicle
             seats = Seat.objects.filter(vehicle=vehicle)
 
             # Serialize vehicle, trip, and seat data
             vehicle_data = VehicleSerializer(vehicle).data
-            trip_data = TripSerializer(trip).data if trip else {}
+            trip_data = TripSerializer(Trip.objects.with_related().get(pk=trip.pk)).data if trip else {}
             seat_data = SeatSerializer(seats, many=True).data
 
             # Return the response including vehicle, trip, and seat details
-            return Response({
+            response = Response({
                 'vehicle': vehicle_data,
                 'trip': trip_data,
                 'seats': seat_data
             }, status=status.HTTP_200_OK)
+            if etag:
+                response['ETag'] = etag
+            return response
 
         except Vehicle.DoesNotExist:
             return Response({"error": "Vehicle not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -182,7 +195,7 @@ class VehicleDetailView(APIView):
             filters['organization__user'] = user
         elif user.is_driver:
             filters['driver__user'] = user
-        return get_object_or_404(Vehicle, **filters)
+        return get_object_or_404(Vehicle.objects.select_related('vehicle'), **filters)
 
 
 class TripCreateAPIView(APIView):
@@ -198,9 +211,9 @@ class TripCreateAPIView(APIView):
         """Retrieve trips based on user role."""
         try:
             if request.user.is_organization:
-                trips = Trip.objects.filter(organization__user=request.user).select_related('organization', 'vehicle')
+                trips = Trip.objects.filter(organization__user=request.user).with_related()
             else:
-                trips = Trip.objects.all().select_related('organization', 'vehicle')
+                trips = Trip.objects.all().with_related()
 
             # Calculate earnings for each trip
             for trip in trips:
@@ -254,10 +267,22 @@ class TripDetailView(APIView):
 
     def get(self, request, trip_id=None):
         """Retrieve detailed information of a specific trip by trip ID."""
-        trip = get_object_or_404(Trip, trip_id=trip_id, organization__user=request.user)
+        trip = get_object_or_404(Trip.objects.select_related('vehicle'), trip_id=trip_id, organization__user=request.user)
+        etag = trip_etag(trip)
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+
+        data = get_or_set_trip_detail(trip, lambda: self._serialize_trip(trip))
+        response = Response(data, status=status.HTTP_200_OK)
+        if etag:
+            response['ETag'] = etag
+        return response
+
+    def _serialize_trip(self, trip):
+        """Refresh the trip's earnings and serialize it; only runs on a cache miss."""
         trip.calculate_earnings()
-        serializer = TripSerializer(trip)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return TripSerializer(Trip.objects.with_related().get(pk=trip.pk)).data
 
     @transaction.atomic
     def put(self, request, trip_id=None):
@@ -278,6 +303,174 @@ class TripDetailView(APIView):
         return Response(status=status.HTTP_200_OK)
 
 
+class TripStopsView(APIView):
+    """
+    Ordered stops of a trip and the seats free between them.
+    GET lists the stops and, for every pair (or just ?from=&to=), the free seats.
+    PUT {"stops": [...]} replaces the stops; only the trip's organization can.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request, trip_id=None):
+        trip = get_object_or_404(Trip.objects.select_related('vehicle').prefetch_related('stops'), trip_id=trip_id)
+        from_stop, to_stop = request.query_params.get('from'), request.query_params.get('to')
+        try:
+            availability = trip.seat_availability()
+            if from_stop or to_stop:
+                pair = (locations.resolve(from_stop) if from_stop else trip.from_location,
+                        locations.resolve(to_stop) if to_stop else trip.to_location)
+                if pair not in availability:
+                    raise ValidationError({"stops": f"Trip {trip.trip_id} doesn't stop at {pair[0]} and then {pair[1]}."})
+                availability = {pair: availability[pair]}
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "trip_id": trip.trip_id,
+            "stops": trip.stop_locations(),
+            "availability": [
+                {"from_stop": start, "to_stop": end, "available_seats": len(seats), "seat_numbers": seats}
+                for (start, end), seats in availability.items()
+            ],
+        }, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def put(self, request, trip_id=None):
+        trip = get_object_or_404(Trip.objects.select_related('vehicle'), trip_id=trip_id, organization__user=request.user)
+        stops = request.data.get('stops')
+        if not isinstance(stops, list):
+            return Response({"error": "Stops must be provided as a list."}, status=status.HTTP_400_BAD_REQUEST)
+        resolved = [locations.resolve(stop) for stop in stops]
+        if None in resolved:
+            unknown = [stop for stop, slug in zip(stops, resolved) if slug is None]
+            return Response({"error": f"Unknown locations: {', '.join(map(str, unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            trip.set_stops(resolved)
+        except ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"trip_id": trip.trip_id, "stops": resolved}, status=status.HTTP_200_OK)
+
+
+class TripScheduleView(APIView):
+    """
+    API view for an organization's recurring trip schedules:
+    - List its schedules
+    - Create a schedule for one of its vehicles, which materializes its departures
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        schedules = TripSchedule.objects.filter(organization__user=request.user).select_related('vehicle')
+        return Response(TripScheduleSerializer(schedules, many=True).data, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def post(self, request):
+        if not request.user.is_organization:
+            return Response({"error": "Only organizations can create schedules."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = TripScheduleSerializer(
+            data=request.data,
+            context={'user': request.user, 'registration_number': request.data.get('registration_number')},
+        )
+        if serializer.is_valid():
+            serializer.save()
+            return Response({"message": "Schedule created successfully", "data": serializer.data}, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TripScheduleDetailView(APIView):
+    """
+    API view for one schedule: its upcoming departures, updates and removal.
+    Changes only touch departures that no trip has taken yet; past runs are kept.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get_schedule(self, request, schedule_id):
+        return get_object_or_404(
+            TripSchedule.objects.select_related('vehicle'), pk=schedule_id, organization__user=request.user
+        )
+
+    def get(self, request, schedule_id):
+        schedule = self.get_schedule(request, schedule_id)
+        departures = schedule.departures.filter(departure_datetime__gte=timezone.now()).select_related('vehicle', 'trip')
+        return Response({
+            "schedule": TripScheduleSerializer(schedule).data,
+            "departures": DepartureSerializer(departures, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def put(self, request, schedule_id):
+        schedule = self.get_schedule(request, schedule_id)
+        serializer = TripScheduleSerializer(schedule, data=request.data, partial=True)
+        if serializer.is_valid():
+            with transaction.atomic():
+                schedule = serializer.save()
+                schedule.clear_upcoming()
+                if schedule.is_active:
+                    schedule.materialize()
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @transaction.atomic
+    def delete(self, request, schedule_id):
+        """Stop the schedule; its past departures stay on record."""
+        schedule = self.get_schedule(request, schedule_id)
+        schedule.is_active = False
+        schedule.save(update_fields=['is_active'])
+        schedule.clear_upcoming()
+        return Response({"message": "Schedule stopped"}, status=status.HTTP_200_OK)
+
+
+class PricingRuleView(APIView):
+    """
+    API view for an organization's pricing rules:
+    - List its rules
+    - Create a rule, which reprices its open trips
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        rules = PricingRule.objects.filter(organization__user=request.user).order_by('kind', 'pk')
+        return Response(PricingRuleSerializer(rules, many=True).data, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def post(self, request):
+        if not request.user.is_organization:
+            return Response({"error": "Only organizations can create pricing rules."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = PricingRuleSerializer(data=request.data, context={'user': request.user})
+        if serializer.is_valid():
+            serializer.save()
+            return Response({"message": "Pricing rule created successfully", "data": serializer.data}, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PricingRuleDetailView(APIView):
+    """API view for one pricing rule: updates and removal, each repricing the organization's open trips."""
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get_rule(self, request, rule_id):
+        return get_object_or_404(PricingRule, pk=rule_id, organization__user=request.user)
+
+    def get(self, request, rule_id):
+        return Response(PricingRuleSerializer(self.get_rule(request, rule_id)).data, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def put(self, request, rule_id):
+        serializer = PricingRuleSerializer(self.get_rule(request, rule_id), data=request.data, partial=True)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @transaction.atomic
+    def delete(self, request, rule_id):
+        self.get_rule(request, rule_id).delete()
+        return Response({"message": "Pricing rule deleted"}, status=status.HTTP_200_OK)
+
+
 class TripResetView(APIView):
     """
     API view to handle the reset of a trip by updating its details.
@@ -323,7 +516,7 @@ class DriverDetailsView(APIView):
             if not request.user.is_organization:
                 return Response({"error": "Only organizations can retrieve drivers."}, status=status.HTTP_403_FORBIDDEN)
 
-            drivers = Driver.objects.filter(organization__user=request.user).select_related('user')
+            drivers = Driver.objects.filter(organization__user=request.user).select_related('user').prefetch_related('rating_summaries')
             serializer = DriverSerializer(drivers, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
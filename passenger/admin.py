@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, PaymentWebhookEvent
 # Register your models here.
 
-admin.site.register(Payment)
\ No newline at end of file
+admin.site.register(Payment)
+admin.site.register(PaymentWebhookEvent)
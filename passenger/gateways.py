@@ -0,0 +1,360 @@
+"""
+Payment gateway adapters.
+
+Every gateway call goes through one pooled HTTP session with a hard timeout and
+runs on a small worker pool, so a slow gateway holds a pool thread rather than
+the request thread: views wait at most PAYMENT_INITIATE_WAIT seconds and then
+answer with the payment still pending. Gateway notifications (webhooks) are
+verified and recorded in PaymentWebhookEvent, which makes redeliveries no-ops;
+unsigned ones are acknowledged at once and confirmed by a lookup on the pool.
+A lookup that fails leaves an unprocessed event behind, which
+reconcile_payments --fix looks up again (confirm_pending_notifications).
+
+The pool stands in for an async HTTP client: the app runs as synchronous WSGI
+under gunicorn, where an event loop per request would buy nothing over a
+bounded pool of threads sharing one connection pool.
+"""
+import hashlib
+import hmac
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from decimal import Decimal
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import transaction, IntegrityError, close_old_connections
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Payment, PaymentWebhookEvent
+
+
+COMPLETED = 'completed'
+PENDING = 'pending'
+FAILED = 'failed'
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or rejected the request."""
+
+
+class InvalidSignature(GatewayError):
+    """A webhook whose signature doesn't match the gateway's webhook secret."""
+
+
+class UnknownPayment(GatewayError):
+    """A webhook for a payment we have no reference for (yet); the gateway should retry."""
+
+
+def sign(body, secret):
+    """Hex HMAC-SHA256 of a raw webhook body."""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+_session = None
+_executor = None
+_setup_lock = threading.Lock()
+
+
+def http_session():
+    """Process wide session, so connections to a gateway are pooled and reused."""
+    global _session
+    if _session is None:
+        with _setup_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(settings.PAYMENT_GATEWAYS),
+                                      pool_maxsize=settings.PAYMENT_HTTP_POOL_SIZE, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _setup_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.PAYMENT_HTTP_WORKERS, thread_name_prefix='payment-gateway')
+    return _executor
+
+
+def _in_background(func, *args):
+    """Run func on the gateway pool with its own database connection."""
+    def run():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return executor().submit(run)
+
+
+class PaymentGateway:
+    """Base adapter. Subclasses talk to one gateway and translate its statuses."""
+    name = None
+
+    def __init__(self, config):
+        self.base_url = config['BASE_URL'].rstrip('/')
+        self.secret_key = config.get('SECRET_KEY', '')
+        self.webhook_secret = config.get('WEBHOOK_SECRET', '')
+
+    def _request(self, method, path, **kwargs):
+        try:
+            response = http_session().request(
+                method, f"{self.base_url}{path}", headers=self.headers(),
+                timeout=settings.PAYMENT_HTTP_TIMEOUT, **kwargs
+            )
+        except requests.RequestException as e:
+            raise GatewayError(f"{self.name} request failed: {e}")
+        if response.status_code >= 400:
+            raise GatewayError(f"{self.name} returned {response.status_code}: {response.text[:200]}")
+        try:
+            return response.json()
+        except ValueError:
+            raise GatewayError(f"{self.name} returned an invalid response.")
+
+    def headers(self):
+        return {'Authorization': f"Key {self.secret_key}"}
+
+    def callback_url(self):
+        return f"{settings.PAYMENT_WEBHOOK_BASE_URL.rstrip('/')}{reverse('payment-webhook', args=[self.name])}"
+
+    def initiate(self, payment):
+        """Start a payment; returns {'reference': ..., 'payment_url': ...}."""
+        raise NotImplementedError
+
+    def lookup(self, reference):
+        """Current state of a payment; returns {'status': ..., 'amount': Decimal or None}."""
+        raise NotImplementedError
+
+    def verify_signature(self, body, headers):
+        """HMAC-SHA256 of the raw body with the webhook secret, hex encoded in X-Signature."""
+        if not self.webhook_secret:
+            raise InvalidSignature(f"No webhook secret configured for {self.name}.")
+        if not hmac.compare_digest(sign(body, self.webhook_secret), headers.get('X-Signature', '')):
+            raise InvalidSignature("Invalid webhook signature.")
+
+    def parse_webhook(self, body, headers):
+        """
+        Verify a notification and return {'event_id', 'reference', 'status', 'amount', 'payload'}.
+        A status of None means the notification can't be trusted on its own and
+        is confirmed with a lookup (see process_webhook).
+        """
+        self.verify_signature(body, headers)
+        try:
+            data = json.loads(body)
+            return {
+                'event_id': str(data['event_id']),
+                'reference': str(data['reference']),
+                'status': data['status'],
+                'amount': Decimal(str(data['amount'])) if data.get('amount') is not None else None,
+                'payload': data,
+            }
+        except (ValueError, KeyError, ArithmeticError):
+            raise GatewayError("Malformed webhook payload.")
+
+
+class MockGateway(PaymentGateway):
+    """Adapter for the local mock gateway (manage.py mock_payment_gateway)."""
+    name = 'mock'
+
+    def initiate(self, payment):
+        data = self._request('POST', '/payments', json={
+            'amount': str(payment.amount_paid),
+            'order_id': payment.transaction_id,
+            'callback_url': self.callback_url(),
+        })
+        return {'reference': data['reference'], 'payment_url': data.get('payment_url', '')}
+
+    def lookup(self, reference):
+        data = self._request('GET', f"/payments/{reference}")
+        return {'status': data['status'], 'amount': Decimal(str(data['amount']))}
+
+
+class KhaltiGateway(PaymentGateway):
+    """
+    Khalti ePayment. Khalti doesn't sign its callbacks, so a notification only
+    tells us which payment to look at: its status always comes from a lookup,
+    made off the request thread.
+    """
+    name = 'khalti'
+    STATUSES = {'Completed': COMPLETED, 'Pending': PENDING, 'Initiated': PENDING}
+
+    def initiate(self, payment):
+        data = self._request('POST', '/epayment/initiate/', json={
+            'return_url': settings.PAYMENT_RETURN_URL,
+            'website_url': settings.PAYMENT_RETURN_URL,
+            'amount': int(payment.amount_paid * 100),  # in paisa
+            'purchase_order_id': payment.transaction_id,
+            'purchase_order_name': f"Booking {payment.booking.booking_id}",
+        })
+        return {'reference': data['pidx'], 'payment_url': data.get('payment_url', '')}
+
+    def lookup(self, reference):
+        data = self._request('POST', '/epayment/lookup/', json={'pidx': reference})
+        amount = data.get('total_amount')
+        return {
+            'status': self.STATUSES.get(data.get('status'), FAILED),
+            'amount': Decimal(amount) / 100 if amount is not None else None,
+        }
+
+    def parse_webhook(self, body, headers):
+        try:
+            data = json.loads(body)
+            reference = str(data['pidx'])
+        except (ValueError, KeyError):
+            raise GatewayError("Malformed callback payload.")
+        return {'event_id': None, 'reference': reference, 'status': None, 'amount': None, 'payload': data}
+
+
+GATEWAYS = {
+    MockGateway.name: MockGateway,
+    KhaltiGateway.name: KhaltiGateway,
+}
+
+
+def get_gateway(name):
+    if name not in GATEWAYS or name not in settings.PAYMENT_GATEWAYS:
+        raise GatewayError(f"Unknown payment provider: {name}")
+    return GATEWAYS[name](settings.PAYMENT_GATEWAYS[name])
+
+
+def apply_status(payment, status, amount=None):
+    """Bring a payment in line with the gateway's view of it. Safe to repeat."""
+    if status == COMPLETED:
+        if amount is not None and amount != payment.amount_paid:
+            return payment.mark_failed(f"Gateway amount {amount} doesn't match {payment.amount_paid}.")
+        return payment.mark_successful()
+    if status == FAILED:
+        return payment.mark_failed("Payment failed at the gateway.")
+    return False
+
+
+def _initiate(payment_pk):
+    payment = Payment.objects.select_related('booking').get(pk=payment_pk)
+    gateway = get_gateway(payment.provider)
+    try:
+        result = gateway.initiate(payment)
+    except GatewayError as e:
+        payment.mark_failed(str(e))
+        raise
+    Payment.objects.filter(pk=payment.pk).update(provider_reference=result['reference'], payment_url=result['payment_url'])
+    return result
+
+
+def start_payment(payment):
+    """
+    Initiate the payment at its gateway. Waits at most PAYMENT_INITIATE_WAIT
+    seconds; returns the gateway's result, or None if it is still in progress
+    (the worker stores the reference when the gateway answers).
+    Must be called after the payment row is committed.
+    """
+    future = _in_background(_initiate, payment.pk)
+    try:
+        result = future.result(timeout=settings.PAYMENT_INITIATE_WAIT)
+    except FutureTimeoutError:
+        return None
+    payment.provider_reference = result['reference']
+    payment.payment_url = result['payment_url']
+    return result
+
+
+def _refresh(payment_pk):
+    payment = Payment.objects.select_related('booking').get(pk=payment_pk)
+    if payment.is_successful or not payment.provider_reference:
+        return False
+    state = get_gateway(payment.provider).lookup(payment.provider_reference)
+    return apply_status(payment, state['status'], state['amount'])
+
+
+def refresh_in_background(payment):
+    """Ask the gateway for the payment's status without waiting for the answer."""
+    return _in_background(_refresh, payment.pk)
+
+
+def process_webhook(provider, body, headers):
+    """
+    Verify and apply one gateway notification. Returns 'processed' or 'duplicate',
+    or 'accepted' for an unsigned notification, which is confirmed with a lookup
+    on the gateway pool so the request thread never waits on the gateway.
+    """
+    gateway = get_gateway(provider)
+    event = gateway.parse_webhook(body, headers)
+    if event['status'] is None:
+        if not Payment.objects.filter(provider=provider, provider_reference=event['reference']).exists():
+            raise UnknownPayment(f"No {provider} payment with reference {event['reference']}.")
+        _in_background(_confirm_notification, provider, event)
+        return 'accepted'
+    return _record_event(provider, event)
+
+
+def _confirm_notification(provider, event):
+    """Look up the status an unsigned notification points at, then record and apply it."""
+    try:
+        state = get_gateway(provider).lookup(event['reference'])
+        return _record_event(provider, dict(
+            event, event_id=f"{event['reference']}:{state['status']}", status=state['status'], amount=state['amount'],
+        ))
+    except GatewayError as e:
+        print(f"Error confirming {provider} notification for {event['reference']}: {e}")
+        # We already answered the gateway, which won't send it again: keep it for a retry
+        PaymentWebhookEvent.objects.update_or_create(
+            provider=provider, event_id=f"{event['reference']}:unconfirmed",
+            defaults={'provider_reference': event['reference'], 'payload': event['payload'], 'processed_at': None},
+        )
+        return None
+
+
+def confirm_pending_notifications():
+    """
+    Look up the payments of notifications that couldn't be confirmed when they
+    arrived and apply their status. Returns (confirmed, still failing).
+    """
+    confirmed = failing = 0
+    for webhook_event in PaymentWebhookEvent.objects.filter(processed_at=None).order_by('id'):
+        payment = Payment.objects.select_related('booking').filter(
+            provider=webhook_event.provider, provider_reference=webhook_event.provider_reference
+        ).first()
+        try:
+            if payment is not None and not payment.is_successful:
+                state = get_gateway(payment.provider).lookup(payment.provider_reference)
+                apply_status(payment, state['status'], state['amount'])
+        except GatewayError as e:
+            print(f"Error confirming {webhook_event.provider} notification for {webhook_event.provider_reference}: {e}")
+            failing += 1
+            continue
+        webhook_event.processed_at = timezone.now()
+        webhook_event.save(update_fields=['processed_at'])
+        confirmed += 1
+    return confirmed, failing
+
+
+def _record_event(provider, event):
+    """
+    Record a notification and apply it. The event row and its effects commit
+    together, so a notification that fails halfway (or arrives before we
+    stored the payment's reference) is processed again when the gateway retries.
+    """
+    try:
+        with transaction.atomic():
+            webhook_event = PaymentWebhookEvent.objects.create(
+                provider=provider, event_id=event['event_id'],
+                provider_reference=event['reference'], payload=event['payload'],
+            )
+            payment = Payment.objects.select_related('booking').filter(
+                provider=provider, provider_reference=event['reference']
+            ).first()
+            if payment is None:
+                raise UnknownPayment(f"No {provider} payment with reference {event['reference']}.")
+            apply_status(payment, event['status'], event['amount'])
+            webhook_event.processed_at = timezone.now()
+            webhook_event.save(update_fields=['processed_at'])
+    except IntegrityError:
+        if PaymentWebhookEvent.objects.filter(provider=provider, event_id=event['event_id']).exists():
+            return 'duplicate'
+        raise
+    return 'processed'
+
@@ -0,0 +1,162 @@
+import json
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from passenger.gateways import sign, COMPLETED, PENDING, FAILED
+
+
+class MockGateway:
+    """In-memory gateway state shared by the request handler threads."""
+
+    def __init__(self, options):
+        self.options = options
+        self.payments = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+
+    def delay(self):
+        latency = self.options['latency'] + random.uniform(0, self.options['jitter'])
+        if latency:
+            time.sleep(latency / 1000)
+
+    def create(self, data):
+        reference = f"MOCK-{uuid.uuid4().hex[:16].upper()}"
+        payment = {
+            'reference': reference,
+            'order_id': data.get('order_id'),
+            'amount': str(Decimal(str(data['amount']))),
+            'callback_url': data.get('callback_url'),
+            'status': PENDING,
+        }
+        with self.lock:
+            self.payments[reference] = payment
+        if self.options['auto_complete']:
+            status = FAILED if random.random() < self.options['failure_rate'] else COMPLETED
+            threading.Timer(self.options['webhook_delay'], self.complete, args=[reference, status]).start()
+        return payment
+
+    def complete(self, reference, status):
+        with self.lock:
+            payment = self.payments.get(reference)
+            if payment is None or payment['status'] != PENDING:
+                return payment
+            payment['status'] = status
+        self.notify(payment)
+        return payment
+
+    def notify(self, payment, attempts=5):
+        """Send a signed notification, retrying like a real gateway; sometimes send it twice."""
+        if not payment['callback_url']:
+            return
+        event = {'event_id': uuid.uuid4().hex, 'reference': payment['reference'],
+                 'status': payment['status'], 'amount': payment['amount']}
+        body = json.dumps(event).encode()
+        headers = {'Content-Type': 'application/json', 'X-Signature': sign(body, self.options['webhook_secret'])}
+        deliveries = 2 if random.random() < self.options['duplicate_rate'] else 1
+        for _ in range(deliveries):
+            for attempt in range(attempts):
+                try:
+                    response = self.session.post(payment['callback_url'], data=body, headers=headers, timeout=10)
+                    if response.status_code < 300:
+                        break
+                except requests.RequestException:
+                    pass
+                time.sleep(2 ** attempt * 0.5)
+
+
+def make_handler(gateway):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            if gateway.options['verbosity'] > 1:
+                super().log_message(format, *args)
+
+        def _send(self, status_code, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                return json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return None
+
+        def do_POST(self):
+            gateway.delay()
+            url = urlparse(self.path)
+            parts = url.path.strip('/').split('/')
+            if parts == ['payments']:
+                if self.headers.get('Authorization') != f"Key {gateway.options['secret_key']}":
+                    return self._send(401, {'detail': 'Invalid key.'})
+                data = self._read_json()
+                if not data or 'amount' not in data:
+                    return self._send(400, {'detail': 'amount is required.'})
+                payment = gateway.create(data)
+                base_url = f"http://{self.headers.get('Host')}"
+                return self._send(201, {'reference': payment['reference'], 'status': payment['status'],
+                                        'payment_url': f"{base_url}/pay/{payment['reference']}"})
+            if len(parts) == 2 and parts[0] == 'pay':
+                # Simulates the customer finishing (or abandoning) the payment
+                status = parse_qs(url.query).get('status', [COMPLETED])[0]
+                payment = gateway.complete(parts[1], status)
+                if payment is None:
+                    return self._send(404, {'detail': 'Not found.'})
+                return self._send(200, payment)
+            self._send(404, {'detail': 'Not found.'})
+
+        def do_GET(self):
+            gateway.delay()
+            parts = urlparse(self.path).path.strip('/').split('/')
+            if len(parts) == 2 and parts[0] == 'payments':
+                payment = gateway.payments.get(parts[1])
+                if payment is None:
+                    return self._send(404, {'detail': 'Not found.'})
+                return self._send(200, payment)
+            self._send(404, {'detail': 'Not found.'})
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = "Run a local mock payment gateway (the 'mock' provider) for development, tests and load runs."
+
+    def add_arguments(self, parser):
+        config = settings.PAYMENT_GATEWAYS['mock']
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0, help="Added latency per request in ms.")
+        parser.add_argument('--jitter', type=float, default=0, help="Random extra latency per request, up to this many ms.")
+        parser.add_argument('--no-auto-complete', dest='auto_complete', action='store_false',
+                            help="Leave payments pending until POST /pay/<reference> is called.")
+        parser.add_argument('--webhook-delay', type=float, default=0.5, help="Seconds before an auto-completed payment is notified.")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of auto-completed payments that fail.")
+        parser.add_argument('--duplicate-rate', type=float, default=0.0, help="Share of notifications delivered twice.")
+        parser.add_argument('--secret-key', default=config['SECRET_KEY'])
+        parser.add_argument('--webhook-secret', default=config['WEBHOOK_SECRET'])
+
+    def handle(self, *args, **options):
+        gateway = MockGateway(options)
+        server = ThreadingHTTPServer((options['host'], options['port']), make_handler(gateway))
+        server.daemon_threads = True
+        self.stdout.write(f"Mock payment gateway listening on http://{options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
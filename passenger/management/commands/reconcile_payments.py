@@ -0,0 +1,178 @@
+import csv
+import sys
+import time
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DateTimeField, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from booking.models import Booking
+from organization import cache as trip_cache
+from organization.models import Trip
+from passenger import gateways
+from passenger.models import Payment, PaymentWebhookEvent
+
+
+def _successful_payments(field, aggregate):
+    """Per booking aggregate over its successful payments, as a correlated subquery."""
+    return Subquery(
+        Payment.objects.filter(booking=OuterRef('pk'), is_successful=True)
+        .order_by().values('booking').annotate(value=aggregate(field)).values('value')
+    )
+
+
+def _confirmed_bookings(field, paid_only=False):
+    """
+    Per trip sum over the confirmed bookings of its current run, as computed by
+    Trip.calculate_earnings (Booking.trip_datetime is the UTC date of the run's start).
+    """
+    run_date = TruncDate(ExpressionWrapper(OuterRef('start_datetime'), output_field=DateTimeField()), tzinfo=dt_timezone.utc)
+    bookings = Booking.objects.filter(trip=OuterRef('pk'), trip_datetime=run_date, is_confirmed=True)
+    if paid_only:
+        bookings = bookings.filter(is_paid=True)
+    return Subquery(bookings.order_by().values('trip').annotate(value=Sum(field)).values('value'))
+
+
+ZERO_AMOUNT = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+ZERO_COUNT = Value(0, output_field=IntegerField())
+
+
+class Command(BaseCommand):
+    help = ("Check that successful payments, Booking.is_paid and trip earnings agree. "
+            "Scans bookings and trips in id ranges; every check runs in SQL.")
+
+    # Problems --fix corrects; everything else needs a person to look at it
+    FIXABLE = {'unconfirmed_notifications', 'paid_flag_missing', 'trip_earnings_drift'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Ids per range scanned in one query.")
+        parser.add_argument('--fix', action='store_true',
+                            help="Confirm gateway notifications whose lookup failed, mark bookings with a successful "
+                                 "payment as paid and recompute drifted trip earnings.")
+        parser.add_argument('--report', help="Write every mismatch to this CSV file ('-' for stdout).")
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.fix = options['fix']
+        self.counts = dict.fromkeys(
+            ['unconfirmed_notifications', 'paid_flag_missing', 'paid_without_payment', 'duplicate_payments',
+             'amount_mismatch', 'trip_earnings_drift'], 0
+        )
+        self.fixed = dict.fromkeys(self.FIXABLE, 0)
+
+        report_file = None
+        if options['report']:
+            report_file = sys.stdout if options['report'] == '-' else open(options['report'], 'w', newline='')
+            self.report = csv.writer(report_file)
+            self.report.writerow(['problem', 'model', 'id', 'details'])
+        else:
+            self.report = None
+
+        started = time.perf_counter()
+        try:
+            # Notifications first: confirming them marks payments successful, which the bookings check reads
+            self._check_notifications()
+            # Bookings before trips: fixing paid flags changes the trip earnings checked next
+            scanned_bookings = self._scan(Booking, self._check_bookings)
+            scanned_trips = self._scan(Trip, self._check_trips)
+        finally:
+            if report_file and report_file is not sys.stdout:
+                report_file.close()
+
+        self.stdout.write(f"Scanned {scanned_bookings} bookings and {scanned_trips} trips in {time.perf_counter() - started:.1f}s")
+        for problem, count in self.counts.items():
+            line = f"  {problem}: {count}"
+            if problem in self.fixed and self.fix:
+                line += f" ({self.fixed[problem]} fixed)"
+            style = self.style.ERROR if count and not (self.fix and problem in self.FIXABLE) else self.style.SUCCESS
+            self.stdout.write(style(line))
+
+    def _scan(self, model, check):
+        """Run check over consecutive id ranges; memory is bounded by the mismatches in one range."""
+        low = model.objects.order_by('id').values_list('id', flat=True).first()
+        high = model.objects.order_by('-id').values_list('id', flat=True).first()
+        if low is None:
+            return 0
+        scanned = 0
+        for start in range(low, high + 1, self.chunk_size):
+            scanned += check(start, start + self.chunk_size)
+        return scanned
+
+    def _record(self, problem, model, pk, details):
+        self.counts[problem] += 1
+        if self.report:
+            self.report.writerow([problem, model, pk, details])
+
+    def _check_notifications(self):
+        unconfirmed = PaymentWebhookEvent.objects.filter(processed_at=None).values_list('provider', 'provider_reference')
+        for provider, reference in unconfirmed:
+            self._record('unconfirmed_notifications', 'payment', f"{provider}:{reference}", "gateway lookup failed")
+        if self.fix and self.counts['unconfirmed_notifications']:
+            self.fixed['unconfirmed_notifications'] += gateways.confirm_pending_notifications()[0]
+
+    def _check_bookings(self, start, end):
+        in_range = Booking.objects.filter(id__gte=start, id__lt=end)
+        mismatches = in_range.annotate(
+            paid_count=Coalesce(_successful_payments('id', Count), ZERO_COUNT),
+            paid_total=Coalesce(_successful_payments('amount_paid', Sum), ZERO_AMOUNT),
+        ).filter(
+            Q(is_paid=False, paid_count__gt=0)
+            | Q(is_paid=True, paid_count=0)
+            | Q(paid_count__gt=1)
+            | (Q(paid_count=1) & ~Q(paid_total=F('price')))
+        ).values_list('id', 'booking_id', 'trip_id', 'is_paid', 'price', 'paid_count', 'paid_total')
+
+        to_mark_paid = []
+        for pk, booking_id, trip_id, is_paid, price, paid_count, paid_total in mismatches:
+            if not is_paid and paid_count:
+                self._record('paid_flag_missing', 'booking', booking_id, f"{paid_count} successful payment(s), is_paid is False")
+                to_mark_paid.append((pk, trip_id))
+            if is_paid and not paid_count:
+                self._record('paid_without_payment', 'booking', booking_id, "is_paid without a successful payment")
+            if paid_count > 1:
+                self._record('duplicate_payments', 'booking', booking_id, f"{paid_count} successful payments totalling {paid_total}")
+            elif paid_count == 1 and paid_total != price:
+                self._record('amount_mismatch', 'booking', booking_id, f"paid {paid_total}, price {price}")
+
+        if self.fix and to_mark_paid:
+            self._mark_paid(to_mark_paid)
+        return in_range.count()
+
+    def _mark_paid(self, bookings):
+        ids = [pk for pk, _ in bookings]
+        with transaction.atomic():
+            self.fixed['paid_flag_missing'] += Booking.objects.filter(id__in=ids, is_paid=False).update(is_paid=True, updated_at=timezone.now())
+        # The bulk update skips Booking.save, so refresh what it would have: tickets and cached trips
+        for booking in Booking.objects.filter(id__in=ids).select_related(
+            'passenger__user', 'trip__organization__user', 'trip__vehicle__driver__user', 'trip__price'
+        ).prefetch_related('seats'):
+            booking.generate_or_update_ticket()
+        for trip_id in {trip_id for _, trip_id in bookings}:
+            trip_cache.invalidate_trip(trip_id)
+
+    def _check_trips(self, start, end):
+        in_range = Trip.objects.filter(id__gte=start, id__lt=end)
+        expected_earnings = Coalesce(_confirmed_bookings('price', paid_only=True), ZERO_AMOUNT)
+        expected_passengers = Coalesce(_confirmed_bookings('num_passengers'), ZERO_COUNT)
+        drifted = list(in_range.annotate(
+            expected_earnings=expected_earnings, expected_passengers=expected_passengers,
+        ).filter(
+            ~Q(total_earnings=F('expected_earnings')) | ~Q(passenger_count=F('expected_passengers'))
+        ).values_list('id', 'trip_id', 'total_earnings', 'expected_earnings', 'passenger_count', 'expected_passengers'))
+
+        for _, trip_id, earnings, expected, passengers, expected_count in drifted:
+            self._record('trip_earnings_drift', 'trip', trip_id,
+                         f"earnings {earnings} (expected {expected}), passengers {passengers} (expected {expected_count})")
+
+        if self.fix and drifted:
+            ids = [row[0] for row in drifted]
+            with transaction.atomic():
+                self.fixed['trip_earnings_drift'] += Trip.objects.filter(id__in=ids).update(
+                    total_earnings=expected_earnings, passenger_count=expected_passengers,
+                )
+            for pk in ids:
+                trip_cache.invalidate_trip(pk)
+        return in_range.count()
@@ -0,0 +1,55 @@
+# Generated by Django 5.1 on 2026-10-19 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0010_alter_driver_profile_image_and_more'),
+        ('booking', '0011_dailyearnings_is_completed'),
+        ('passenger', '0003_alter_payment_transaction_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=20)),
+                ('event_id', models.CharField(max_length=100)),
+                ('provider_reference', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField(default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='failure_reason',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='payment_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='provider',
+            field=models.CharField(blank=True, help_text='Payment gateway handling this payment, blank for manual payments', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='provider_reference',
+            field=models.CharField(blank=True, help_text="The gateway's id for this payment", max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(fields=('provider', 'provider_reference'), name='unique_payment_provider_reference'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentwebhookevent',
+            constraint=models.UniqueConstraint(fields=('provider', 'event_id'), name='unique_payment_webhook_event'),
+        ),
+    ]
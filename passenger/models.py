@@ -2,9 +2,51 @@ from django.db import models
 from authentication.models import Passenger
 from booking.models import Booking
 from django.utils import timezone
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from authentication.querysets import RoleScopedQuerySet
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 import uuid
 # Create your models here.
 
+class PaymentQuerySet(RoleScopedQuerySet):
+    role_lookups = {
+        'organization': 'booking__trip__organization__user',
+        'driver': 'booking__trip__vehicle__driver__user',
+        'passenger': 'passenger__user',
+    }
+
+    def with_related(self):
+        """Everything PaymentSerializer and Payment.__str__ read, joined in one query (seats prefetched)."""
+        return self.select_related(
+            'passenger__user', 'booking__passenger__user', 'booking__trip__organization',
+            'booking__trip__vehicle__driver', 'booking__trip__price',
+        ).prefetch_related('booking__seats')
+
+    def paid_between(self, start=None, end=None):
+        """Payments made on or after start and on or before end (dates, either optional)."""
+        queryset = self
+        if start:
+            queryset = queryset.filter(payment_date__gte=start_of_day(start))
+        if end:
+            queryset = queryset.filter(payment_date__lt=start_of_day(end + timedelta(days=1)))
+        return queryset
+
+    def totals(self):
+        """Count and amounts of the payments, in one aggregate query."""
+        return self.order_by().aggregate(
+            count=Count('id'),
+            total_amount=Coalesce(Sum('amount_paid'), Decimal('0')),
+            successful_count=Count('id', filter=Q(is_successful=True)),
+            successful_amount=Coalesce(Sum('amount_paid', filter=Q(is_successful=True)), Decimal('0')),
+        )
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
 class Payment(models.Model):
     PAYMENT_METHOD_CHOICES = [
         ('credit_card', 'Credit Card'),
@@ -21,6 +63,20 @@ class Payment(models.Model):
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES)
     transaction_id = models.CharField(max_length=100, unique=True)
     is_successful = models.BooleanField(default=False)
+    provider = models.CharField(max_length=20, blank=True, help_text="Payment gateway handling this payment, blank for manual payments")
+    provider_reference = models.CharField(max_length=100, blank=True, null=True, help_text="The gateway's id for this payment")
+    payment_url = models.URLField(max_length=500, blank=True)
+    failure_reason = models.CharField(max_length=255, blank=True)
+
+    objects = PaymentQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'provider_reference'], name='unique_payment_provider_reference'),
+        ]
+        indexes = [
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
     
     #We can include the amount_remaining field for any advance payment system, so it can later be given to the driver on the bus.
     
@@ -30,4 +86,47 @@ class Payment(models.Model):
     def save(self, *args, **kwargs):
         if not self.transaction_id:
             self.transaction_id = f"TXN-{uuid.uuid4().hex[:12].upper()}"
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+    def mark_successful(self):
+        """
+        Mark the payment successful and the booking paid. The conditional update
+        makes this safe to call from concurrent or repeated gateway notifications:
+        only the first call changes anything. Returns whether this call did.
+        """
+        updated = Payment.objects.filter(pk=self.pk, is_successful=False).update(is_successful=True, failure_reason='')
+        if not updated:
+            return False
+        self.is_successful = True
+        booking = self.booking
+        if not booking.is_paid:
+            booking.is_paid = True
+            booking.save()
+        return True
+
+    def mark_failed(self, reason):
+        updated = Payment.objects.filter(pk=self.pk, is_successful=False).update(failure_reason=reason[:255])
+        if updated:
+            self.failure_reason = reason[:255]
+        return bool(updated)
+
+
+class PaymentWebhookEvent(models.Model):
+    """
+    Every gateway notification we accepted, keyed on the gateway's event id,
+    so a redelivered notification is recognised and not processed twice.
+    """
+    provider = models.CharField(max_length=20)
+    event_id = models.CharField(max_length=100)
+    provider_reference = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='unique_payment_webhook_event'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_id}"
\ No newline at end of file
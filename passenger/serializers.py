@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from passenger.models import Payment
+from passenger.gateways import GATEWAYS
 from authentication.models import Passenger,CustomUser
 from authentication.serializers import PassengerSerializer
 from booking.models import Booking
@@ -16,9 +17,18 @@ class PaymentSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'amount_paid': {'required': False},
             'transaction_id': {'required': False},
-            
+            'is_successful': {'read_only': True},
+            'provider': {'required': False},
+            'provider_reference': {'read_only': True},
+            'payment_url': {'read_only': True},
+            'failure_reason': {'read_only': True},
         }
 
+    def validate_provider(self, value):
+        if value and value not in GATEWAYS:
+            raise serializers.ValidationError("Unknown payment provider.")
+        return value
+
     def validate(self, data):
         booking_id = self.context.get('booking_id')
 
@@ -67,6 +77,10 @@ class PaymentSerializer(serializers.ModelSerializer):
         if 'amount_paid' not in validated_data:
             validated_data['amount_paid'] = booking.price
 
+        # Gateway payments stay pending until the gateway confirms them
+        if validated_data.get('provider'):
+            return Payment.objects.create(**validated_data)
+
         # Create payment and mark it as successful
         payment = Payment.objects.create(**validated_data)
         payment.is_successful = True
@@ -90,6 +104,14 @@ class PaymentSerializer(serializers.ModelSerializer):
         instance.delete()
     
     
+class PaymentTotalsSerializer(serializers.Serializer):
+    """Totals returned by PaymentQuerySet.totals()."""
+    count = serializers.IntegerField()
+    total_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    successful_count = serializers.IntegerField()
+    successful_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
 class OngoingTripSerializer(serializers.ModelSerializer):
     """Serializer for ongoing trips details of a passenger."""
     
@@ -1,3 +1,140 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import CustomUser, Organization, Driver, Passenger
+from booking.models import Booking
+from organization.models import Vehicle, Seat, Trip, TripPrice, Departure
+from . import gateways
+from .models import Payment, PaymentWebhookEvent
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ReconcileTripEarningsTests(TestCase):
+    """A trip run once, then advanced onto its vehicle's next departure and booked again."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        organization = Organization.objects.create(user=org_user, name='Org')
+        driver_user = CustomUser.objects.create_user('driver', 'driver@example.com', 'password', is_driver=True)
+        driver = Driver.objects.create(user=driver_user, license_number='L-1', organization=organization)
+        passenger_user = CustomUser.objects.create_user('rider', 'rider@example.com', 'password', is_passenger=True)
+        self.passenger = Passenger.objects.create(user=passenger_user)
+        vehicle = Vehicle.objects.create(
+            organization=organization, driver=driver, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=4, available_seat=3, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        for i in range(1, 5):
+            Seat.objects.create(vehicle=vehicle, seat_number=f"S00{i}")
+        start = timezone.now() + timedelta(days=1)
+        self.trip = Trip.objects.create(
+            organization=organization, vehicle=vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=start, end_datetime=start + timedelta(hours=7),
+        )
+        TripPrice.objects.create(trip=self.trip, price=1000)
+        self.book()
+        self.book()
+        Departure.objects.create(
+            organization=organization, vehicle=vehicle, from_location='kathmandu', to_location='pokhara',
+            departure_datetime=start + timedelta(days=2), arrival_datetime=start + timedelta(days=2, hours=7), price=1000,
+        )
+        self.trip.advance_to_next_departure()
+        self.book()
+        self.trip.calculate_earnings()
+
+    def book(self):
+        return Booking.objects.create(passenger=self.passenger, trip=Trip.objects.get(pk=self.trip.pk), is_paid=True, is_confirmed=True)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_payments', *args, stdout=out)
+        return out.getvalue()
+
+    def test_advanced_trip_counts_only_its_current_run(self):
+        self.assertEqual((self.trip.total_earnings, self.trip.passenger_count), (1000, 1))
+        self.assertIn('trip_earnings_drift: 0', self.reconcile())
+
+    def test_fix_keeps_current_run_earnings(self):
+        self.reconcile('--fix')
+        self.trip.refresh_from_db()
+        self.assertEqual((self.trip.total_earnings, self.trip.passenger_count), (1000, 1))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class GatewayPaymentTests(TestCase):
+    """A pending Khalti payment of 1000 for one booking."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        org_user = CustomUser.objects.create_user('org', 'org@example.com', 'password', is_organization=True)
+        organization = Organization.objects.create(user=org_user, name='Org')
+        driver_user = CustomUser.objects.create_user('driver', 'driver@example.com', 'password', is_driver=True)
+        driver = Driver.objects.create(user=driver_user, license_number='L-1', organization=organization)
+        passenger_user = CustomUser.objects.create_user('rider', 'rider@example.com', 'password', is_passenger=True)
+        passenger = Passenger.objects.create(user=passenger_user)
+        vehicle = Vehicle.objects.create(
+            organization=organization, driver=driver, registration_number='BA-1', vehicle_type='bus',
+            seating_capacity=4, available_seat=4, license_plate_number='BA1',
+            insurance_expiry_date=date(2099, 1, 1), fitness_certificate_expiry_date=date(2099, 1, 1),
+        )
+        start = timezone.now() + timedelta(days=1)
+        trip = Trip.objects.create(
+            organization=organization, vehicle=vehicle, from_location='kathmandu', to_location='pokhara',
+            start_datetime=start, end_datetime=start + timedelta(hours=7),
+        )
+        TripPrice.objects.create(trip=trip, price=1000)
+        self.booking = Booking.objects.create(passenger=passenger, trip=trip, is_confirmed=True)
+        self.payment = Payment.objects.create(
+            passenger=passenger, booking=self.booking, amount_paid=1000, payment_method='mobile_wallet',
+            provider='khalti', provider_reference='pidx-1',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(passenger_user)
+
+    def test_status_polls_refresh_once_per_interval(self):
+        with mock.patch.object(gateways, 'refresh_in_background') as refresh:
+            for _ in range(3):
+                response = self.client.get(f"/api/passenger/payment/status/{self.payment.transaction_id}/")
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_failed_confirmation_is_retried_by_reconcile(self):
+        event = gateways.get_gateway('khalti').parse_webhook(b'{"pidx": "pidx-1"}', {})
+        with mock.patch.object(gateways.KhaltiGateway, 'lookup', side_effect=gateways.GatewayError("timed out")):
+            self.assertIsNone(gateways._confirm_notification('khalti', event))
+        self.assertTrue(PaymentWebhookEvent.objects.filter(provider_reference='pidx-1', processed_at=None).exists())
+
+        out = StringIO()
+        call_command('reconcile_payments', stdout=out)
+        self.assertIn('unconfirmed_notifications: 1', out.getvalue())
+
+        completed = {'status': gateways.COMPLETED, 'amount': Decimal('1000')}
+        with mock.patch.object(gateways.KhaltiGateway, 'lookup', return_value=completed):
+            call_command('reconcile_payments', '--fix', stdout=StringIO())
+        self.payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertTrue(self.payment.is_successful)
+        self.assertTrue(self.booking.is_paid)
+        self.assertFalse(PaymentWebhookEvent.objects.filter(processed_at=None).exists())
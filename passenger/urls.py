@@ -6,7 +6,9 @@ urlpatterns = [
     path('profile/', ProfileAPIView.as_view(), name='profile'),
     path('payment/',views.PaymentCreateView.as_view(),name='payment'),
     path('user-payment/',views.UserPaymentView.as_view(),name='user-payment'),   
+    path('bookings/',views.BookingListView.as_view(),name='passenger-bookings'),
     path("payment/status/<str:txn_id>/", views.PaymentDetailView.as_view(), name="payment-status"),
+    path('payment/webhook/<str:provider>/', views.PaymentWebhookView.as_view(), name='payment-webhook'),
     path('ongoing-trips/',views.OngoingTripView.as_view(),name='ongoing-trips'),
 ]
 
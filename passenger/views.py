@@ -2,15 +2,22 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
 from booking.models import Booking
 from booking.serializers import BookingSerializer
 from .models import Payment
-from .serializers import PaymentSerializer,OngoingTripSerializer
+from .serializers import PaymentSerializer,OngoingTripSerializer,PaymentTotalsSerializer
+from . import gateways
+from .gateways import GatewayError
 from authentication.models import Passenger
 from authentication.renderers import UserRenderer
+from api import fraud
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from api.pagination import KeysetPagination
 # class PassengerHomePageView(APIView):
 #     permission_classes = [IsAuthenticated]
 
@@ -36,6 +43,18 @@ from django.utils import timezone
 #             return Response({"error": "Passenger not found"}, status=404)
 
 
+def parse_date_range(request):
+    """Read ?from= and ?to= (YYYY-MM-DD) from the query string; either may be missing."""
+    dates = []
+    for param in ('from', 'to'):
+        value = request.query_params.get(param)
+        day = parse_date(value) if value else None
+        if value and day is None:
+            raise ValueError(f"Invalid '{param}' date, expected YYYY-MM-DD.")
+        dates.append(day)
+    return dates
+
+
 class PaymentCreateView(APIView):
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
@@ -57,33 +76,54 @@ class PaymentCreateView(APIView):
         if serializer.is_valid():
             try:
                 with transaction.atomic():
-                    serializer.save()
+                    payment = serializer.save()
+                fraud.observe(fraud.PAYMENT, request)
+                if payment.provider:
+                    return self._start_gateway_payment(payment)
                 return Response({"message":"Payment successful.","data":serializer.data},status=status.HTTP_201_CREATED)
             
+            except GatewayError as e:
+                fraud.observe(fraud.PAYMENT_FAILED, request)
+                return Response({'error':str(e)},status=status.HTTP_502_BAD_GATEWAY)
             except Exception as e:
+                fraud.observe(fraud.PAYMENT_FAILED, request)
                 return Response({'error':str(e)},status=status.HTTP_400_BAD_REQUEST)
             
         else:
+            fraud.observe(fraud.PAYMENT_FAILED, request)
             return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
+
+    def _start_gateway_payment(self, payment):
+        """
+        The gateway call runs on the gateway pool and is waited on for at most
+        PAYMENT_INITIATE_WAIT seconds; a slow gateway leaves the payment pending
+        and the client follows it through the payment status endpoint.
+        """
+        if gateways.start_payment(payment) is None:
+            return Response({"message":"Payment is being initiated, check its status shortly.","data":PaymentSerializer(payment).data},status=status.HTTP_202_ACCEPTED)
+        return Response({"message":"Payment initiated.","data":PaymentSerializer(payment).data},status=status.HTTP_201_CREATED)
         
 class UserPaymentView(APIView):
+    """
+    Payments visible to the logged in user: made by them (passenger) or for
+    bookings on their trips (organization, driver). Newest first, keyset
+    paginated (?cursor=...), optionally limited to ?from=YYYY-MM-DD&to=YYYY-MM-DD.
+    Totals cover every payment matching the filters, not just the page.
+    """
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
     def get(self, request):
-        user = request.user
-        payments = Payment.objects.none()
-
-        if user.is_organization:
-            payments = Payment.objects.filter(booking__trip__organization=user.organization)
-        elif user.is_driver:
-            payments = Payment.objects.filter(booking__trip__vehicle__driver=user.driver)
-        elif user.is_passenger:
-            payments = Payment.objects.filter(passenger__user=user)
-        else:
-            return Response({"detail": "Invalid user role."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = parse_date_range(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = PaymentSerializer(payments, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        payments = Payment.objects.visible_to(request.user).paid_between(start, end)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(payments.with_related(), request, view=self)
+        response = paginator.get_paginated_response(PaymentSerializer(page, many=True).data)
+        response.data['totals'] = PaymentTotalsSerializer(payments.totals()).data
+        return response
     
 class PaymentDetailView(APIView):
     permission_classes = [IsAuthenticated]
@@ -98,6 +138,11 @@ class PaymentDetailView(APIView):
         
         try:
             payment = Payment.objects.get(transaction_id=transaction_id)
+            if payment.provider and not payment.is_successful and payment.provider_reference and cache.add(
+                f"payment-refresh:{payment.pk}", True, settings.PAYMENT_REFRESH_INTERVAL
+            ):
+                # Don't wait on the gateway; a later status check sees the result
+                gateways.refresh_in_background(payment)
             serializer = PaymentSerializer(payment)
             return Response(serializer.data,status=status.HTTP_200_OK)
         
@@ -105,25 +150,50 @@ class PaymentDetailView(APIView):
             return Response({'message':'Payment not found'},status=status.HTTP_404_NOT_FOUND)
         
 
+class PaymentWebhookView(APIView):
+    """
+    Receives payment notifications from a gateway. Authenticated by the
+    gateway's signature rather than a user token; redelivered notifications
+    are acknowledged without being applied again.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, provider):
+        try:
+            outcome = gateways.process_webhook(provider, request.body, request.headers)
+            return Response({"status": outcome}, status=status.HTTP_200_OK)
+        except gateways.InvalidSignature as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except gateways.UnknownPayment as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except GatewayError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class BookingListView(APIView):
+    """
+    Bookings visible to the logged in user, newest first and keyset paginated.
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD limits them by trip date.
+    """
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
     
     def get(self,request,*args,**kwargs):
-        user = request.user
-        bookings = Booking.objects.none()
-        
-        if user.is_organization:
-            bookings = Booking.objects.filter(trip__organization=user.organization)
-        elif user.is_driver:
-            bookings = Booking.objects.filter(trip__vehicle__driver=user.driver)
-        elif user.is_passenger:
-            bookings = Booking.objects.filter(passenger__user=user)
-        else:
-            return Response({"detail": "Invalid user role."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        serializer = BookingSerializer(bookings,many=True)
-        return Response(serializer.data,status=status.HTTP_200_OK)
+        try:
+            start, end = parse_date_range(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        bookings = Booking.objects.visible_to(request.user)
+        if start:
+            bookings = bookings.filter(trip_datetime__gte=start)
+        if end:
+            bookings = bookings.filter(trip_datetime__lte=end)
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(bookings.with_related(), request, view=self)
+        return paginator.get_paginated_response(BookingSerializer(page, many=True).data)
     
 
 class OngoingTripView(APIView):
@@ -0,0 +1,30 @@
+from django.contrib import admin
+from . import models
+# Register your models here.
+
+admin.site.register(models.BalanceSnapshot)
+
+
+class AdminWallet(admin.ModelAdmin):
+    list_display = ('code', 'kind', 'user', 'balance', 'allow_negative', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('code', 'user__username')
+    readonly_fields = ('balance',)
+
+admin.site.register(models.Wallet, AdminWallet)
+
+
+class LedgerEntryInline(admin.TabularInline):
+    model = models.LedgerEntry
+    extra = 0
+    can_delete = False
+    readonly_fields = ('wallet', 'amount', 'created_at')
+
+
+class AdminLedgerTransaction(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'reference', 'description', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('reference',)
+    inlines = [LedgerEntryInline]
+
+admin.site.register(models.LedgerTransaction, AdminLedgerTransaction)
@@ -0,0 +1,119 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, close_old_connections
+from django.db.models import Sum
+
+from wallet.models import CENT, Wallet, LedgerTransaction, LedgerEntry, BalanceSnapshot, InsufficientFunds, post_transaction
+
+
+PREFIX = 'bench:'
+
+
+class Command(BaseCommand):
+    help = ("Post many concurrent transfers between benchmark wallets and check that every "
+            "balance still matches its ledger. Benchmark wallets and entries are removed afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--postings', type=int, default=5000, help="Number of transfers to post.")
+        parser.add_argument('--wallets', type=int, default=20, help="Number of benchmark wallets.")
+        parser.add_argument('--threads', type=int, default=16, help="Concurrent posting threads.")
+        parser.add_argument('--initial', type=Decimal, default=Decimal('1000'), help="Opening balance of each wallet.")
+        parser.add_argument('--snapshot-every', type=int, default=500, help="Snapshot a random wallet every N postings (0 disables).")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and options['threads'] > 1:
+            self.stdout.write(self.style.WARNING(
+                "SQLite serializes writers; expect lock contention rather than row-level concurrency."
+            ))
+
+        self._cleanup()
+        source = Wallet.objects.create(code=f"{PREFIX}source", kind='external', allow_negative=True)
+        wallets = [Wallet.objects.create(code=f"{PREFIX}{index}") for index in range(options['wallets'])]
+        for index, wallet in enumerate(wallets):
+            post_transaction('top_up', [(source, -options['initial']), (wallet, options['initial'])], reference=f"{PREFIX}open:{index}")
+
+        rng = random.Random(options['seed'])
+        plans = []
+        for index in range(options['postings']):
+            debit, credit = rng.sample(wallets, 2)
+            plans.append((index, debit, credit, Decimal(rng.randint(1, 20000)) / 100))
+
+        self.counts = {'posted': 0, 'insufficient': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.timings = []
+
+        def run(plan):
+            index, debit, credit, amount = plan
+            started = time.perf_counter()
+            outcome = 'posted'
+            try:
+                post_transaction('transfer', [(debit, -amount), (credit, amount)], reference=f"{PREFIX}{index}")
+                if options['snapshot_every'] and index % options['snapshot_every'] == 0:
+                    wallets[index % len(wallets)].take_snapshot()
+            except InsufficientFunds:
+                outcome = 'insufficient'
+            except Exception as e:
+                outcome = 'errors'
+                self.stderr.write(f"posting {index} failed: {e}")
+            finally:
+                close_old_connections()
+            with self.lock:
+                self.counts[outcome] += 1
+                self.timings.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(run, plans))
+        elapsed = time.perf_counter() - started
+
+        try:
+            self._report(elapsed, wallets + [source])
+        finally:
+            self._cleanup()
+
+    def _report(self, elapsed, wallets):
+        timings = sorted(self.timings)
+        self.stdout.write(
+            f"{len(timings)} postings in {elapsed:.2f}s ({len(timings) / elapsed:.0f}/s): "
+            f"{self.counts['posted']} posted, {self.counts['insufficient']} rejected for insufficient funds, "
+            f"{self.counts['errors']} errors"
+        )
+        self.stdout.write(
+            f"latency mean {statistics.mean(timings):.2f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms, max {timings[-1]:.2f} ms"
+        )
+
+        mismatches = []
+        for wallet in wallets:
+            wallet.refresh_from_db()
+            full_sum = (wallet.entries.aggregate(total=Sum('amount'))['total'] or Decimal('0')).quantize(CENT)
+            ledger_balance = wallet.ledger_balance()
+            if not wallet.balance == ledger_balance == full_sum:
+                mismatches.append(f"{wallet.code}: balance {wallet.balance}, ledger {ledger_balance}, entries {full_sum}")
+            if wallet.balance < 0 and not wallet.allow_negative:
+                mismatches.append(f"{wallet.code}: negative balance {wallet.balance}")
+
+        total = LedgerEntry.objects.filter(wallet__in=wallets).aggregate(total=Sum('amount'))['total'].quantize(CENT)
+        if total != 0:
+            mismatches.append(f"entries sum to {total}, not 0")
+
+        if mismatches or self.counts['errors']:
+            for mismatch in mismatches:
+                self.stdout.write(self.style.ERROR(mismatch))
+            raise CommandError("Ledger check failed.")
+        self.stdout.write(self.style.SUCCESS("All balances match the ledger and postings sum to zero."))
+
+    def _cleanup(self):
+        wallets = Wallet.objects.filter(code__startswith=PREFIX)
+        transactions = LedgerTransaction.objects.filter(entries__wallet__in=wallets).distinct()
+        LedgerEntry.objects.filter(transaction__in=list(transactions.values_list('id', flat=True))).delete()
+        LedgerTransaction.objects.filter(reference__startswith=PREFIX).delete()
+        BalanceSnapshot.objects.filter(wallet__in=wallets).delete()
+        wallets.delete()
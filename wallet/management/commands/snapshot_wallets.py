@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from wallet.models import Wallet
+
+
+class Command(BaseCommand):
+    help = "Snapshot wallet balances, so reading a balance only sums the entries since the last snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-tail', type=int, default=100,
+                            help="Only snapshot wallets with at least this many entries since their last snapshot.")
+
+    def handle(self, *args, **options):
+        snapshotted = 0
+        for wallet in Wallet.objects.iterator():
+            last_snapshot = wallet.snapshots.order_by('-entry_id').values_list('entry_id', flat=True).first() or 0
+            tail = wallet.entries.filter(id__gt=last_snapshot).count()
+            if tail and tail >= options['min_tail']:
+                wallet.take_snapshot()
+                snapshotted += 1
+        self.stdout.write(self.style.SUCCESS(f"Snapshotted {snapshotted} wallet(s)."))
@@ -0,0 +1,170 @@
+from decimal import Decimal
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Sum
+from rest_framework.serializers import ValidationError
+
+from authentication.models import CustomUser
+
+
+CENT = Decimal('0.01')
+
+
+class InsufficientFunds(ValidationError):
+    """Raised when a posting would take a wallet below zero."""
+
+
+class Wallet(models.Model):
+    """
+    A ledger account. User wallets belong to a user; system wallets (external
+    money in/out, platform) have no user and may go negative.
+
+    `balance` is a running total kept in step with the ledger by conditional
+    updates; the ledger itself (snapshot + tail) is the source of truth.
+    """
+    KIND_CHOICES = [
+        ('user', 'User'),
+        ('external', 'External'),
+        ('platform', 'Platform'),
+    ]
+
+    code = models.CharField(max_length=50, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='user')
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, blank=True, null=True, related_name='wallet')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    allow_negative = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.code} - {self.balance}"
+
+    @classmethod
+    def for_user(cls, user):
+        wallet, _ = cls.objects.get_or_create(code=f"user:{user.pk}", defaults={'user': user, 'kind': 'user'})
+        return wallet
+
+    @classmethod
+    def system(cls, kind):
+        wallet, _ = cls.objects.get_or_create(code=f"system:{kind}", defaults={'kind': kind, 'allow_negative': True})
+        return wallet
+
+    def ledger_balance(self):
+        """Balance from the ledger: the latest snapshot plus the entries after it."""
+        snapshot = self.snapshots.order_by('-entry_id').first()
+        base = snapshot.balance if snapshot else Decimal('0')
+        last_entry_id = snapshot.entry_id if snapshot else 0
+        tail = self.entries.filter(id__gt=last_entry_id).aggregate(total=Sum('amount'))['total']
+        return (base + (tail or Decimal('0'))).quantize(CENT)
+
+    def take_snapshot(self):
+        """
+        Record the ledger balance up to the latest entry. The wallet row is locked first
+        (a no-op update, which also takes SQLite's write lock up front), so no posting for
+        this wallet is in flight and every earlier entry is committed.
+        """
+        with transaction.atomic():
+            Wallet.objects.filter(pk=self.pk).update(balance=F('balance'))
+            last_entry_id = self.entries.order_by('-id').values_list('id', flat=True).first()
+            if not last_entry_id:
+                return None
+            previous = self.snapshots.order_by('-entry_id').first()
+            if previous and previous.entry_id == last_entry_id:
+                return previous
+            return BalanceSnapshot.objects.create(wallet=self, entry_id=last_entry_id, balance=self.ledger_balance())
+
+
+class LedgerTransaction(models.Model):
+    """One balanced posting: its entries always sum to zero."""
+    KIND_CHOICES = [
+        ('top_up', 'Top Up'),
+        ('withdrawal', 'Withdrawal'),
+        ('refund', 'Refund'),
+        ('payment', 'Payment'),
+        ('transfer', 'Transfer'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    reference = models.CharField(max_length=100, unique=True, blank=True, null=True, help_text="Idempotency key")
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.reference or self.pk}"
+
+
+class LedgerEntry(models.Model):
+    """Append-only ledger line. Positive amounts credit the wallet, negative amounts debit it."""
+    transaction = models.ForeignKey(LedgerTransaction, on_delete=models.PROTECT, related_name='entries')
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='entries')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'id'], name='ledger_entry_wallet_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet.code} {self.amount}"
+
+
+class BalanceSnapshot(models.Model):
+    """Wallet balance including every entry up to and including entry_id."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='snapshots')
+    entry_id = models.BigIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', '-entry_id'], name='balance_snapshot_wallet_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet.code} @ {self.entry_id}: {self.balance}"
+
+
+def post_transaction(kind, legs, reference=None, description=''):
+    """
+    Post a balanced transaction. legs is a list of (wallet, amount) pairs that must sum to zero.
+
+    Each leg is applied with a conditional UPDATE (balance >= debit for wallets
+    that can't go negative), which also locks the wallet row until commit. Legs are
+    applied in wallet id order so concurrent postings can't deadlock. A repeated
+    reference returns the transaction that was already posted.
+    """
+    legs = [(wallet, Decimal(amount)) for wallet, amount in legs if Decimal(amount)]
+    if sum(amount for _, amount in legs) != 0:
+        raise ValidationError("Ledger transaction legs must sum to zero.")
+
+    try:
+        with transaction.atomic():
+            ledger_transaction = LedgerTransaction.objects.create(kind=kind, reference=reference, description=description)
+            for wallet, amount in sorted(legs, key=lambda leg: leg[0].pk):
+                wallets = Wallet.objects.filter(pk=wallet.pk)
+                if amount < 0 and not wallet.allow_negative:
+                    wallets = wallets.filter(balance__gte=-amount)
+                if wallets.update(balance=F('balance') + amount) != 1:
+                    raise InsufficientFunds(f"Insufficient balance in wallet {wallet.code}.")
+            LedgerEntry.objects.bulk_create([
+                LedgerEntry(transaction=ledger_transaction, wallet=wallet, amount=amount) for wallet, amount in legs
+            ])
+    except IntegrityError:
+        if reference and LedgerTransaction.objects.filter(reference=reference).exists():
+            return LedgerTransaction.objects.get(reference=reference)
+        raise
+    return ledger_transaction
+
+
+# Top-ups and withdrawals move money through a payment gateway, which credits
+# or pays out once it confirms; no endpoint posts them until a gateway flow does
+def top_up(wallet, amount, reference=None):
+    return post_transaction('top_up', [(Wallet.system('external'), -amount), (wallet, amount)], reference, "Wallet top up")
+
+
+def withdraw(wallet, amount, reference=None):
+    return post_transaction('withdrawal', [(wallet, -amount), (Wallet.system('external'), amount)], reference, "Wallet withdrawal")
+
+
+def refund(wallet, amount, reference=None, description="Refund"):
+    return post_transaction('refund', [(Wallet.system('platform'), -amount), (wallet, amount)], reference, description)
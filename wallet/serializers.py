@@ -0,0 +1,19 @@
+from rest_framework import serializers
+from .models import Wallet, LedgerEntry
+
+
+class WalletSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Wallet
+        fields = ['code', 'balance', 'created_at']
+
+
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    kind = serializers.ReadOnlyField(source='transaction.kind')
+    reference = serializers.ReadOnlyField(source='transaction.reference')
+    description = serializers.ReadOnlyField(source='transaction.description')
+
+    class Meta:
+        model = LedgerEntry
+        fields = ['id', 'amount', 'kind', 'reference', 'description', 'created_at']
+
@@ -0,0 +1,99 @@
+import threading
+from decimal import Decimal
+
+from django.db import OperationalError, close_old_connections
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from rest_framework.serializers import ValidationError
+
+from authentication.models import CustomUser
+from .models import (
+    Wallet, LedgerEntry, LedgerTransaction, InsufficientFunds,
+    post_transaction, top_up, withdraw, refund,
+)
+
+
+def make_wallet(username):
+    user = CustomUser.objects.create_user(username, f"{username}@example.com", 'password')
+    return Wallet.for_user(user)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.wallet = make_wallet('rider')
+
+    def assert_in_step(self, wallet):
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, wallet.ledger_balance())
+
+    def test_balance_follows_ledger(self):
+        top_up(self.wallet, Decimal('500.00'))
+        withdraw(self.wallet, Decimal('120.50'))
+        refund(self.wallet, Decimal('30.25'))
+        self.assert_in_step(self.wallet)
+        self.assertEqual(self.wallet.balance, Decimal('409.75'))
+
+        # The snapshot plus the entries after it still add up to the running total
+        self.wallet.take_snapshot()
+        top_up(self.wallet, Decimal('10.00'))
+        self.assert_in_step(self.wallet)
+        self.assertEqual(self.wallet.balance, Decimal('419.75'))
+
+    def test_every_transaction_balances(self):
+        top_up(self.wallet, Decimal('200'))
+        withdraw(self.wallet, Decimal('50'))
+        for ledger_transaction in LedgerTransaction.objects.all():
+            self.assertEqual(ledger_transaction.entries.aggregate(total=Sum('amount'))['total'], 0)
+
+    def test_unbalanced_legs_are_rejected(self):
+        with self.assertRaises(ValidationError):
+            post_transaction('transfer', [(self.wallet, Decimal('10')), (Wallet.system('platform'), Decimal('-5'))])
+        self.assertFalse(LedgerTransaction.objects.exists())
+
+    def test_withdraw_beyond_balance_posts_nothing(self):
+        top_up(self.wallet, Decimal('100'))
+        with self.assertRaises(InsufficientFunds):
+            withdraw(self.wallet, Decimal('100.01'))
+        self.assert_in_step(self.wallet)
+        self.assertEqual(self.wallet.balance, Decimal('100'))
+        self.assertEqual(LedgerTransaction.objects.filter(kind='withdrawal').count(), 0)
+
+    def test_refund_is_idempotent_by_reference(self):
+        first = refund(self.wallet, Decimal('75'), reference='refund:booking:1')
+        second = refund(self.wallet, Decimal('75'), reference='refund:booking:1')
+        self.assertEqual(first.pk, second.pk)
+        self.assert_in_step(self.wallet)
+        self.assertEqual(self.wallet.balance, Decimal('75'))
+        self.assertEqual(LedgerEntry.objects.filter(wallet=self.wallet).count(), 1)
+
+
+class ConcurrentWithdrawTests(TransactionTestCase):
+    def test_concurrent_withdrawals_never_overdraw(self):
+        wallet = make_wallet('rider')
+        top_up(wallet, Decimal('100'))
+        attempts, amount = 8, Decimal('30')
+        start = threading.Barrier(attempts)
+        succeeded = []
+
+        def attempt():
+            start.wait()
+            try:
+                withdraw(wallet, amount)
+                succeeded.append(True)
+            # SQLite refuses a second writer outright instead of making it wait
+            except (InsufficientFunds, OperationalError):
+                pass
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=attempt) for _ in range(attempts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        wallet.refresh_from_db()
+        self.assertTrue(1 <= len(succeeded) <= 3)
+        self.assertEqual(wallet.balance, Decimal('100') - amount * len(succeeded))
+        self.assertGreaterEqual(wallet.balance, 0)
+        self.assertEqual(wallet.balance, wallet.ledger_balance())
@@ -0,0 +1,33 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from authentication.renderers import UserRenderer
+from api.pagination import KeysetPagination
+from .models import Wallet
+from .serializers import WalletSerializer, LedgerEntrySerializer
+
+
+class WalletView(APIView):
+    """
+    Wallet balance of the logged in user with its ledger entries, newest first.
+    Entries are keyset paginated (?cursor=...&page_size=...).
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        try:
+            wallet = Wallet.for_user(request.user)
+            entries = wallet.entries.select_related('transaction')
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(entries, request, view=self)
+            return Response({
+                "wallet": WalletSerializer(wallet).data,
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+                "entries": LedgerEntrySerializer(page, many=True).data,
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+